@@ -0,0 +1,150 @@
+"""
+Collision-free short code allocation.
+
+Every code comes from a unique integer taken from a shared counter, so two
+callers can never be handed the same code and nothing has to be checked
+against the database and retried:
+
+* The counter lives in `database.counter`. A thread reserves a whole block
+  of numbers at once under a file lock, then hands them out from its own
+  thread-local block without any locking, so lock traffic is one syscall
+  pair per `block_size` codes per thread.
+* Numbers are pushed through a keyed Feistel permutation of the 6-character
+  code space before base62 encoding, so consecutive numbers give unrelated
+  looking codes. The key is created once in `database.key` (or taken from
+  SHORTENER_KEY) and must stay the same for the life of the database.
+"""
+
+import hashlib
+import os
+import secrets
+import struct
+import threading
+from pathlib import Path
+
+from storage import FileLock
+
+ALPHABET = "0123456789ABCDEFGHIJKLMNOPQRSTUVWXYZabcdefghijklmnopqrstuvwxyz"
+CODE_LENGTH = 6
+SPACE = len(ALPHABET) ** CODE_LENGTH          # 56,800,235,584 codes
+
+counter_file = Path("database.counter")
+key_file = Path("database.key")
+
+_HALF_BITS = 18                               # 2 ** 36 > SPACE
+_HALF_MASK = (1 << _HALF_BITS) - 1
+_ROUNDS = 4
+
+
+def base62(n, length=CODE_LENGTH):
+    chars = []
+    for _ in range(length):
+        n, rem = divmod(n, len(ALPHABET))
+        chars.append(ALPHABET[rem])
+    return "".join(reversed(chars))
+
+
+def load_key(path=key_file):
+    env = os.environ.get("SHORTENER_KEY")
+    if env:
+        return env.encode("utf-8")
+    path = Path(path)
+    try:
+        return _read_key(path)
+    except FileNotFoundError:
+        pass
+    # Write the key in full under a temp name, then link it into place.
+    # link() never overwrites, so whichever process links first wins and
+    # everyone else reads that complete file; nobody can see it empty.
+    key = os.urandom(16).hex().encode("ascii")
+    tmp = path.with_name(f"{path.name}.{os.getpid()}.{secrets.token_hex(4)}.tmp")
+    fd = os.open(tmp, os.O_WRONLY | os.O_CREAT | os.O_EXCL, 0o600)
+    try:
+        with os.fdopen(fd, "wb") as f:
+            f.write(key)
+            f.flush()
+            os.fsync(f.fileno())
+        os.link(tmp, path)
+    except FileExistsError:
+        return _read_key(path)
+    finally:
+        os.unlink(tmp)
+    return key
+
+
+def _read_key(path):
+    key = path.read_bytes()
+    if not key:
+        raise RuntimeError(f"{path} is empty; refusing to pick a new key for an existing database")
+    return key
+
+
+class Permutation:
+    """Keyed bijection on range(SPACE): a balanced Feistel network over 36
+    bits, with cycle walking to stay inside the code space."""
+
+    def __init__(self, key):
+        self.round_keys = [hashlib.blake2b(key, digest_size=16, person=b"round%d" % i).digest()
+                           for i in range(_ROUNDS)]
+
+    def _round(self, i, half):
+        digest = hashlib.blake2b(half.to_bytes(3, "big"), digest_size=4, key=self.round_keys[i]).digest()
+        return int.from_bytes(digest, "big") & _HALF_MASK
+
+    def _feistel(self, n):
+        left, right = n >> _HALF_BITS, n & _HALF_MASK
+        for i in range(_ROUNDS):
+            left, right = right, left ^ self._round(i, right)
+        return (left << _HALF_BITS) | right
+
+    def __call__(self, n):
+        if not 0 <= n < SPACE:
+            raise ValueError(f"{n} is outside the code space")
+        # The Feistel network permutes 2**36 values; walking the cycle until
+        # we land back inside SPACE keeps it a bijection on range(SPACE).
+        n = self._feistel(n)
+        while n >= SPACE:
+            n = self._feistel(n)
+        return n
+
+
+class CodeAllocator:
+    def __init__(self, path=counter_file, key=None, block_size=1024):
+        self.path = Path(path)
+        self.block_size = block_size
+        self.permute = Permutation(key if key is not None else load_key())
+        self._lock = FileLock(self.path)
+        self._local = threading.local()
+
+    def reserve(self, count):
+        """Atomically take `count` numbers from the shared counter and
+        return them as a range. Safe across threads and processes."""
+        with self._lock as fd:
+            raw = os.read(fd, 8)
+            if raw and len(raw) != 8:
+                raise RuntimeError(f"{self.path} is corrupt; refusing to reuse codes")
+            start = struct.unpack("<Q", raw)[0] if raw else 0
+            end = start + count
+            if end > SPACE:
+                raise RuntimeError("short code space exhausted")
+            os.lseek(fd, 0, os.SEEK_SET)
+            os.write(fd, struct.pack("<Q", end))
+            os.fsync(fd)
+        return range(start, end)
+
+    def next_number(self):
+        local = self._local
+        block = getattr(local, "block", None)
+        if block is None or local.pos >= len(block):
+            local.block = block = self.reserve(self.block_size)
+            local.pos = 0
+        n = block[local.pos]
+        local.pos += 1
+        return n
+
+    def next_code(self):
+        return base62(self.permute(self.next_number()))
+
+    def codes(self, count):
+        """`count` fresh codes from one reservation, for bulk inserts."""
+        return [base62(self.permute(n)) for n in self.reserve(count)]
@@ -0,0 +1,235 @@
+"""
+CLICK ANALYTICS
+---------------
+Counts redirects per code without touching the link database.
+
+record() bumps an in-memory counter under a lock that is only ever held
+for a dict update or a dict swap. It never does I/O and never looks at
+the clock. Every `flush_interval` seconds a background thread swaps the
+pending counts out and appends them, one line per code, to clicks.log:
+
+    {"d": "2026-10-18", "c": "Xy28Lm", "n": 42}
+
+Lines carry the day they were flushed on, so per-day buckets are accurate
+to within one flush interval.
+
+Once clicks.log passes `compact_bytes`, the flush that crossed the limit
+folds it into clicks.snapshot.json (totals and per-day counts) and starts
+an empty log. Startup reads the snapshot plus that short log, so it stays
+fast however long the server has been counting. The log's first line
+names the snapshot it continues:
+
+    {"snapshot": "9f1c2a7e"}
+
+A log whose header doesn't match the snapshot was already folded into it
+(a crash between writing the snapshot and replacing the log) and is
+skipped.
+
+    python analytics.py top -n 10
+    python analytics.py series Xy28Lm --days 7
+"""
+
+import argparse
+import atexit
+import datetime
+import heapq
+import json
+import os
+import threading
+import uuid
+from collections import Counter, defaultdict
+from pathlib import Path
+
+from storage import FileLock, lock_path
+
+clicks_file = Path("clicks.log")
+
+
+def snapshot_path(path):
+    return path.with_name(path.stem + ".snapshot.json")
+
+
+class ClickCounter:
+    def __init__(self, path=clicks_file, flush_interval=5.0, background=True,
+                 compact_bytes=4 << 20):
+        self.path = Path(path)
+        self.snapshot = snapshot_path(self.path)
+        self.flush_interval = flush_interval
+        self.compact_bytes = compact_bytes
+
+        self._pending = {}
+        self._lock = threading.Lock()           # guards _pending only
+        self._flush_lock = threading.Lock()     # guards the file and aggregates
+        # Other processes (the CLI, a second server) append to the same log
+        # and may compact it.
+        self._file_lock = FileLock(lock_path(self.path))
+
+        self.totals, self.daily, _ = self._read()
+
+        self._stop = threading.Event()
+        self._thread = None
+        if background:
+            self._thread = threading.Thread(target=self._flusher, daemon=True)
+            self._thread.start()
+        atexit.register(self.flush)
+
+    # -- files --------------------------------------------------------
+
+    def _read(self):
+        """Snapshot + log -> (totals, daily, snapshot id)."""
+        totals, daily, snapshot_id = Counter(), defaultdict(Counter), None
+        try:
+            with open(self.snapshot, "r", encoding="utf-8") as f:
+                saved = json.load(f)
+        except FileNotFoundError:
+            pass
+        else:
+            snapshot_id = saved["id"]
+            totals.update(saved["totals"])
+            for day, counts in saved["daily"].items():
+                daily[day].update(counts)
+
+        if not self.path.exists():
+            return totals, daily, snapshot_id
+        with open(self.path, "rb") as f:
+            for n, line in enumerate(f):
+                try:
+                    entry = json.loads(line)
+                except ValueError:
+                    continue
+                if n == 0 and "snapshot" in entry:
+                    if entry["snapshot"] != snapshot_id:
+                        break       # already folded into the snapshot
+                    continue
+                if n == 0 and snapshot_id is not None:
+                    break           # a log from before the snapshot
+                totals[entry["c"]] += entry["n"]
+                daily[entry["d"]][entry["c"]] += entry["n"]
+        return totals, daily, snapshot_id
+
+    def _header(self, snapshot_id):
+        if snapshot_id is None:
+            return b""
+        return json.dumps({"snapshot": snapshot_id}).encode("utf-8") + b"\n"
+
+    def _replace(self, path, data):
+        tmp = path.with_name(path.name + ".tmp")
+        with open(tmp, "wb") as f:
+            f.write(data)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp, path)
+
+    def _compact(self):
+        """Fold snapshot + log into a new snapshot and start an empty log.
+        Reads both from disk, since other processes may have appended
+        clicks this one never saw. Callers hold both locks."""
+        totals, daily, _ = self._read()
+        snapshot_id = uuid.uuid4().hex[:8]
+        saved = {"id": snapshot_id, "totals": totals, "daily": daily}
+        self._replace(self.snapshot, json.dumps(saved, separators=(",", ":")).encode("utf-8"))
+        self._replace(self.path, self._header(snapshot_id))
+        self.totals, self.daily = totals, daily
+
+    # -- hot path -------------------------------------------------------
+
+    def record(self, code):
+        with self._lock:
+            pending = self._pending
+            pending[code] = pending.get(code, 0) + 1
+
+    # -- background -----------------------------------------------------
+
+    def flush(self):
+        with self._lock:
+            pending, self._pending = self._pending, {}
+        if not pending:
+            return
+        day = datetime.date.today().isoformat()
+        data = "".join(
+            json.dumps({"d": day, "c": code, "n": n}, separators=(",", ":")) + "\n"
+            for code, n in pending.items()
+        ).encode("utf-8")
+        with self._flush_lock, self._file_lock:
+            with open(self.path, "ab") as f:
+                if f.tell() == 0 and self.snapshot.exists():
+                    # The log was deleted by hand; say which snapshot it
+                    # continues, or the next startup would skip it.
+                    f.write(self._header(self._read()[2]))
+                f.write(data)
+                size = f.tell()
+            self.totals.update(pending)
+            self.daily[day].update(pending)
+            if size >= self.compact_bytes:
+                self._compact()
+
+    def _flusher(self):
+        while not self._stop.wait(self.flush_interval):
+            try:
+                self.flush()
+            except Exception as error:
+                print(f"[ANALYTICS] Flush failed: {type(error).__name__}: {error}")
+
+    def close(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+        self.flush()
+
+    # -- queries --------------------------------------------------------
+
+    def _unflushed(self):
+        with self._lock:
+            return dict(self._pending)
+
+    def top(self, n=10, day=None):
+        """The `n` most clicked codes, overall or on one ISO `day`."""
+        with self._flush_lock:
+            counts = Counter(self.daily.get(day, {}) if day else self.totals)
+        if day is None or day == datetime.date.today().isoformat():
+            counts.update(self._unflushed())
+        return heapq.nlargest(n, counts.items(), key=lambda item: item[1])
+
+    def series(self, code, days=30):
+        """[(iso_day, clicks), ...] for the last `days` days, oldest first."""
+        today = datetime.date.today()
+        result = []
+        with self._flush_lock:
+            for back in range(days - 1, -1, -1):
+                day = (today - datetime.timedelta(days=back)).isoformat()
+                result.append([day, self.daily.get(day, {}).get(code, 0)])
+        if result:
+            result[-1][1] += self._unflushed().get(code, 0)
+        return [tuple(item) for item in result]
+
+    def total(self, code):
+        with self._flush_lock:
+            count = self.totals.get(code, 0)
+        return count + self._unflushed().get(code, 0)
+
+
+def parse_args():
+    p = argparse.ArgumentParser(description="Query click analytics")
+    sub = p.add_subparsers(dest="command", required=True)
+    top = sub.add_parser("top", help="Most clicked codes")
+    top.add_argument("-n", type=int, default=10)
+    top.add_argument("--day", help="ISO date, e.g. 2026-10-18")
+    series = sub.add_parser("series", help="Clicks per day for one code")
+    series.add_argument("code")
+    series.add_argument("--days", type=int, default=30)
+    return p.parse_args()
+
+
+def main():
+    args = parse_args()
+    clicks = ClickCounter(background=False)
+    if args.command == "top":
+        for code, n in clicks.top(args.n, args.day):
+            print(f"{code}  {n}")
+    else:
+        for day, n in clicks.series(args.code, args.days):
+            print(f"{day}  {n}")
+
+
+if __name__ == "__main__":
+    main()
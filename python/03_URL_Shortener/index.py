@@ -0,0 +1,353 @@
+"""
+MEMORY-MAPPED READ INDEX
+------------------------
+A read-only, on-disk snapshot of the link table that lookups can use through
+mmap, without parsing the whole database into a dict:
+
+    database.idx/
+        manifest.json       count, shard list, and how much of the log it covers
+        urls.dat            every URL, UTF-8, back to back
+        codes-NNN.idx       one shard per first character of the code (NNN = its
+                            ordinal), fixed-width records sorted by code:
+                                code (8 bytes, NUL padded) | url offset (u64) | url length (u32)
+        urls-NN.idx         reverse index, sharded by the top 4 bits of the URL
+                            hash, sorted fixed-width records:
+                                blake2b-64(url) (u64)      | code (8 bytes)
+
+Lookups binary-search one shard, so opening the index costs the same at a
+thousand or a hundred million links, only touched pages get read in, and
+every server process maps the same page-cache pages.
+
+Build it from the log (or database.json) with:
+
+    python index.py build
+"""
+
+import argparse
+import hashlib
+import json
+import mmap
+import os
+import secrets
+import shutil
+import struct
+import time
+from pathlib import Path
+
+index_dir = Path("database.idx")
+
+VERSION = 1
+CODE_WIDTH = 8
+CODE_RECORD = struct.Struct(">8sQI")
+URL_RECORD = struct.Struct(">Q8s")
+OPEN_RETRIES = 20
+
+
+def code_shard(code):
+    return f"codes-{ord(code[0]):03d}.idx"
+
+
+def url_hash(url):
+    return int.from_bytes(hashlib.blake2b(url.encode("utf-8"), digest_size=8).digest(), "big")
+
+
+def url_shard(h):
+    return f"urls-{h >> 60:02d}.idx"
+
+
+def pack_code(code):
+    raw = code.encode("ascii")
+    if len(raw) > CODE_WIDTH:
+        raise ValueError(f"code {code!r} is longer than {CODE_WIDTH} characters")
+    return raw.ljust(CODE_WIDTH, b"\0")
+
+
+# ---------------------------------------------------------
+# Building
+# ---------------------------------------------------------
+
+def _sort_shard(path, record):
+    data = path.read_bytes()
+    size = record.size
+    rows = sorted(data[i:i + size] for i in range(0, len(data), size))
+    path.write_bytes(b"".join(rows))
+
+
+def build_index(records, out_dir=index_dir, source=None):
+    """
+    Write an index for `records`, an iterable of (code, url-or-None) in the
+    order they happened, so later records win. Memory use is bounded by the
+    largest shard, not the whole table.
+    """
+    out_dir = Path(out_dir)
+    # Not mkdtemp(): its 0700 would stay on the index after the rename and
+    # lock out servers running as other users. mkdir() applies the umask.
+    work = out_dir.with_name(f"{out_dir.name}.{os.getpid()}.{secrets.token_hex(4)}")
+    work.mkdir()
+    try:
+        # Pass 1: route records to per-shard spill files, keeping their order.
+        spills = {}
+        for code, url in records:
+            name = code_shard(code)
+            if name not in spills:
+                spills[name] = open(work / (name + ".spill"), "w", encoding="utf-8")
+            spills[name].write(json.dumps([code, url]) + "\n")
+        for f in spills.values():
+            f.close()
+
+        # Pass 2: resolve each shard in memory, append its URLs to urls.dat
+        # and write its sorted code records plus the reverse entries.
+        count = 0
+        reverse = {}
+        with open(work / "urls.dat", "wb") as urls:
+            for name in sorted(spills):
+                spill = work / (name + ".spill")
+                latest = {}
+                with open(spill, encoding="utf-8") as f:
+                    for line in f:
+                        code, url = json.loads(line)
+                        latest[code] = url
+                spill.unlink()
+
+                rows = []
+                for code in sorted(latest):
+                    url = latest[code]
+                    if url is None:
+                        continue
+                    raw = url.encode("utf-8")
+                    rows.append(CODE_RECORD.pack(pack_code(code), urls.tell(), len(raw)))
+                    urls.write(raw)
+
+                    h = url_hash(url)
+                    shard = url_shard(h)
+                    if shard not in reverse:
+                        reverse[shard] = open(work / shard, "wb")
+                    reverse[shard].write(URL_RECORD.pack(h, pack_code(code)))
+                (work / name).write_bytes(b"".join(rows))
+                count += len(rows)
+
+        for f in reverse.values():
+            f.close()
+        for shard in reverse:
+            _sort_shard(work / shard, URL_RECORD)
+
+        manifest = {
+            "version": VERSION,
+            "count": count,
+            "code_shards": sorted(spills),
+            "url_shards": sorted(reverse),
+            "source": source or {},
+        }
+        (work / "manifest.json").write_text(json.dumps(manifest, indent=2))
+
+        # Swap the finished directory in. Open readers keep working: they
+        # mapped every file of the old build when they opened it, and
+        # those files are only unlinked.
+        old = None
+        if out_dir.exists():
+            old = out_dir.with_name(out_dir.name + ".old")
+            shutil.rmtree(old, ignore_errors=True)
+            os.replace(out_dir, old)
+        os.replace(work, out_dir)
+        if old is not None:
+            shutil.rmtree(old, ignore_errors=True)
+        return manifest
+    except BaseException:
+        shutil.rmtree(work, ignore_errors=True)
+        raise
+
+
+def build_from_log(log_path, out_dir=index_dir):
+    log_path = Path(log_path)
+    st = log_path.stat()
+    # `offset` ends up as the number of bytes the index covers, so the
+    # storage engine knows where to resume replaying the log.
+    source = {"engine": "log", "ino": st.st_ino, "offset": 0}
+
+    def records():
+        with open(log_path, "rb") as f:
+            for line in f:
+                if source["offset"] + len(line) > st.st_size or not line.endswith(b"\n"):
+                    break
+                source["offset"] += len(line)
+                record = json.loads(line)
+                yield record["c"], None if record.get("d") else record["u"]
+
+    return build_index(records(), out_dir, source)
+
+
+def build_from_json(json_path, out_dir=index_dir):
+    with open(json_path, "r") as f:
+        db = json.load(f)
+    return build_index(db.items(), out_dir, {"engine": "json"})
+
+
+# ---------------------------------------------------------
+# Reading
+# ---------------------------------------------------------
+
+def _map(f):
+    size = os.fstat(f.fileno()).st_size
+    return mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) if size else b""
+
+
+class _Shard:
+    def __init__(self, f, record):
+        self.record = record
+        self.size = record.size
+        self.map = _map(f)
+        self.count = len(self.map) // self.size
+
+    def lower_bound(self, key):
+        width = len(key)
+        lo, hi = 0, self.count
+        data, size = self.map, self.size
+        while lo < hi:
+            mid = (lo + hi) // 2
+            start = mid * size
+            if data[start:start + width] < key:
+                lo = mid + 1
+            else:
+                hi = mid
+        return lo
+
+    def row(self, i):
+        start = i * self.size
+        return self.record.unpack(self.map[start:start + self.size])
+
+    def rows(self):
+        for i in range(self.count):
+            yield self.row(i)
+
+
+class MmapIndex:
+    """
+    Every file of the index is opened and mapped here, up front (mapping
+    reads nothing yet), so a rebuild swapping in a new directory can never
+    leave this reader with shards from one build and urls.dat from another.
+    Where the OS allows it, the files are opened relative to one handle on
+    the directory, which pins a single build even mid-swap.
+    """
+
+    def __init__(self, path=index_dir):
+        self.path = Path(path)
+        for attempt in range(OPEN_RETRIES):
+            try:
+                self._open()
+                break
+            except FileNotFoundError:
+                # build_index() is between its two renames; the new
+                # directory is about to appear.
+                if attempt == OPEN_RETRIES - 1:
+                    raise
+                time.sleep(0.01)
+
+    def _open(self):
+        dir_fd = None
+        if os.open in os.supports_dir_fd:
+            dir_fd = os.open(self.path, os.O_RDONLY)
+
+        def open_file(name):
+            if dir_fd is None:
+                return open(self.path / name, "rb")
+            return open(name, "rb", opener=lambda name, flags: os.open(name, flags, dir_fd=dir_fd))
+
+        try:
+            with open_file("manifest.json") as f:
+                st = os.fstat(f.fileno())
+                manifest = json.loads(f.read())
+            if manifest.get("version") != VERSION:
+                raise ValueError(f"{self.path}: unsupported index version {manifest.get('version')}")
+            with open_file("urls.dat") as f:
+                urls = _map(f)
+            shards = {}
+            for names, record in ((manifest["code_shards"], CODE_RECORD), (manifest["url_shards"], URL_RECORD)):
+                for name in names:
+                    with open_file(name) as f:
+                        shards[name] = _Shard(f, record)
+        finally:
+            if dir_fd is not None:
+                os.close(dir_fd)
+
+        self.manifest = manifest
+        self.generation = (st.st_ino, st.st_mtime_ns)
+        self.count = manifest["count"]
+        self._code_names = set(manifest["code_shards"])
+        self._url_names = set(manifest["url_shards"])
+        self._urls = urls
+        self._shards = shards
+
+    def _url_at(self, offset, length):
+        return self._urls[offset:offset + length].decode("utf-8")
+
+    def get(self, code):
+        if not code:
+            return None
+        name = code_shard(code)
+        if name not in self._code_names:
+            return None
+        try:
+            key = pack_code(code)
+        except (UnicodeEncodeError, ValueError):
+            return None
+        shard = self._shards[name]
+        i = shard.lower_bound(key)
+        if i < shard.count:
+            raw, offset, length = shard.row(i)
+            if raw == key:
+                return self._url_at(offset, length)
+        return None
+
+    def __contains__(self, code):
+        return self.get(code) is not None
+
+    def __len__(self):
+        return self.count
+
+    def code_for(self, url):
+        h = url_hash(url)
+        name = url_shard(h)
+        if name not in self._url_names:
+            return None
+        shard = self._shards[name]
+        i = shard.lower_bound(h.to_bytes(8, "big"))
+        while i < shard.count:
+            row_hash, raw = shard.row(i)
+            if row_hash != h:
+                break
+            code = raw.rstrip(b"\0").decode("ascii")
+            if self.get(code) == url:
+                return code
+            i += 1
+        return None
+
+    def items(self):
+        for name in sorted(self._code_names):
+            for raw, offset, length in self._shards[name].rows():
+                yield raw.rstrip(b"\0").decode("ascii"), self._url_at(offset, length)
+
+
+def parse_args():
+    p = argparse.ArgumentParser(description="Build the memory-mapped read index")
+    sub = p.add_subparsers(dest="command", required=True)
+    build = sub.add_parser("build")
+    build.add_argument("--from-json", action="store_true",
+                       help="Index database.json instead of database.log")
+    build.add_argument("--output", default=str(index_dir))
+    return p.parse_args()
+
+
+def main():
+    from storage import db_file, log_file
+
+    args = parse_args()
+    if args.from_json:
+        manifest = build_from_json(db_file, args.output)
+    else:
+        manifest = build_from_log(log_file, args.output)
+    print(f"Indexed {manifest['count']} links into {args.output}/ "
+          f"({len(manifest['code_shards'])} code shards).")
+
+
+if __name__ == "__main__":
+    main()
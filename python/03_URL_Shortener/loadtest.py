@@ -0,0 +1,173 @@
+"""
+LOAD GENERATOR
+--------------
+Hammers the redirect server with keep-alive connections and reports
+throughput and latency percentiles:
+
+    python loadtest.py --spawn                    # start a throwaway server
+    python loadtest.py --url http://127.0.0.1:8080 --connections 64 --duration 10
+
+Each run first shortens `--seed` URLs through POST /shorten, then spends
+`--duration` seconds issuing GET /<code> (plus `--write-ratio` of POSTs).
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import random
+import re
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+from urllib.parse import urlsplit
+
+
+HERE = Path(__file__).resolve().parent
+
+
+async def read_response(reader):
+    head = await reader.readuntil(b"\r\n\r\n")
+    status = int(head.split(b" ", 2)[1])
+    length = 0
+    for line in head.split(b"\r\n")[1:]:
+        if line.lower().startswith(b"content-length:"):
+            length = int(line.split(b":", 1)[1])
+    body = await reader.readexactly(length) if length else b""
+    return status, body
+
+
+def shorten_request(host, url):
+    body = json.dumps({"url": url}).encode("utf-8")
+    head = (
+        f"POST /shorten HTTP/1.1\r\nHost: {host}\r\n"
+        f"Content-Type: application/json\r\nContent-Length: {len(body)}\r\n\r\n"
+    )
+    return head.encode("latin-1") + body
+
+
+async def seed(host, port, count):
+    reader, writer = await asyncio.open_connection(host, port)
+    codes = []
+    for i in range(count):
+        writer.write(shorten_request(host, f"https://example.com/page/{i}"))
+        status, body = await read_response(reader)
+        if status != 201:
+            raise RuntimeError(f"seeding failed with HTTP {status}")
+        codes.append(json.loads(body)["code"])
+    writer.close()
+    return codes
+
+
+async def worker(host, port, codes, deadline, write_ratio, latencies, errors):
+    reader, writer = await asyncio.open_connection(host, port)
+    gets = [f"GET /{code} HTTP/1.1\r\nHost: {host}\r\n\r\n".encode("latin-1") for code in codes]
+    n = 0
+    try:
+        while time.perf_counter() < deadline:
+            if write_ratio and random.random() < write_ratio:
+                request = shorten_request(host, f"https://example.com/new/{n}")
+            else:
+                request = random.choice(gets)
+            n += 1
+            start = time.perf_counter()
+            writer.write(request)
+            status, _ = await read_response(reader)
+            latencies.append(time.perf_counter() - start)
+            if status >= 400:
+                errors.append(status)
+    finally:
+        writer.close()
+
+
+def percentile(sorted_values, pct):
+    if not sorted_values:
+        return 0.0
+    index = min(len(sorted_values) - 1, int(round(pct / 100 * (len(sorted_values) - 1))))
+    return sorted_values[index]
+
+
+async def run(host, port, args):
+    codes = await seed(host, port, args.seed)
+    latencies, errors = [], []
+    start = time.perf_counter()
+    deadline = start + args.duration
+    await asyncio.gather(*(
+        worker(host, port, codes, deadline, args.write_ratio, latencies, errors)
+        for _ in range(args.connections)
+    ))
+    elapsed = time.perf_counter() - start
+
+    latencies.sort()
+    report = {
+        "requests": len(latencies),
+        "errors": len(errors),
+        "seconds": round(elapsed, 3),
+        "rps": round(len(latencies) / elapsed, 1),
+        "p50_ms": round(percentile(latencies, 50) * 1000, 3),
+        "p99_ms": round(percentile(latencies, 99) * 1000, 3),
+        "max_ms": round(latencies[-1] * 1000, 3) if latencies else 0.0,
+    }
+    return report
+
+
+def spawn_server(workdir):
+    env = dict(os.environ, PYTHONUNBUFFERED="1")
+    proc = subprocess.Popen(
+        [sys.executable, str(HERE / "server.py"), "--port", "0"],
+        cwd=workdir, env=env, stdout=subprocess.PIPE, text=True,
+    )
+    line = proc.stdout.readline()
+    match = re.search(r":(\d+)\s*$", line)
+    if not match:
+        proc.kill()
+        raise RuntimeError(f"server did not start: {line!r}")
+    return proc, int(match.group(1))
+
+
+def parse_args():
+    p = argparse.ArgumentParser(description="Load test the shortener redirect server")
+    p.add_argument("--url", default="http://127.0.0.1:8080")
+    p.add_argument("--spawn", action="store_true",
+                   help="Start server.py on a free port with an empty temp database")
+    p.add_argument("--connections", type=int, default=32)
+    p.add_argument("--duration", type=float, default=5.0)
+    p.add_argument("--seed", type=int, default=1000, help="Codes to create before the run")
+    p.add_argument("--write-ratio", type=float, default=0.0,
+                   help="Fraction of requests that are POST /shorten")
+    p.add_argument("--json", action="store_true", help="Print the report as JSON")
+    return p.parse_args()
+
+
+def main():
+    args = parse_args()
+    proc = None
+    tmp = None
+    if args.spawn:
+        tmp = tempfile.TemporaryDirectory()
+        proc, port = spawn_server(tmp.name)
+        host = "127.0.0.1"
+    else:
+        parts = urlsplit(args.url)
+        host, port = parts.hostname, parts.port or 80
+
+    try:
+        report = asyncio.run(run(host, port, args))
+    finally:
+        if proc is not None:
+            proc.terminate()
+            proc.wait()
+            tmp.cleanup()
+
+    if args.json:
+        print(json.dumps(report))
+        return
+    print(f"Requests : {report['requests']} in {report['seconds']}s ({report['errors']} errors)")
+    print(f"Rate     : {report['rps']} req/s")
+    print(f"Latency  : p50 {report['p50_ms']} ms | p99 {report['p99_ms']} ms | max {report['max_ms']} ms")
+
+
+if __name__ == "__main__":
+    main()
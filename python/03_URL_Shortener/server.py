@@ -0,0 +1,248 @@
+"""
+ASYNC REDIRECT SERVER
+---------------------
+A small asyncio HTTP/1.1 server in front of ShortenerStore:
+
+    GET  /<code>    -> 301 (or 302) redirect to the original URL
+    POST /shorten   -> 201 {"code": ..., "short_url": ...}
+                       body: {"url": "..."} as JSON, or url=... as a form
+    GET  /_stats/top?n=10[&day=2026-10-18]   -> most clicked codes
+    GET  /_stats/<code>?days=30              -> clicks per day for one code
+
+Lookups are served from the store's in-memory index on the event loop.
+Writes and periodic refreshes run on a single background thread so disk
+I/O never blocks other connections. Connections are kept alive by default.
+"""
+
+import argparse
+import asyncio
+import json
+from concurrent.futures import ThreadPoolExecutor
+from http import HTTPStatus
+from urllib.parse import parse_qs, quote, urlsplit, urlunsplit
+
+from analytics import ClickCounter
+from shortener import ShortenerStore
+
+
+MAX_BODY = 64 * 1024
+
+
+def build_response(status, body=b"", headers=None, keep_alive=True):
+    status = HTTPStatus(status)
+    lines = [f"HTTP/1.1 {status.value} {status.phrase}"]
+    for name, value in (headers or {}).items():
+        lines.append(f"{name}: {value}")
+    lines.append(f"Content-Length: {len(body)}")
+    lines.append("Connection: keep-alive" if keep_alive else "Connection: close")
+    return ("\r\n".join(lines) + "\r\n\r\n").encode("latin-1") + body
+
+
+def json_response(status, payload, keep_alive):
+    body = json.dumps(payload).encode("utf-8")
+    return build_response(status, body, {"Content-Type": "application/json"}, keep_alive)
+
+
+def parse_shorten_body(body, content_type):
+    """The URL to shorten, or None if there is none. Raises ValueError for
+    anything that isn't a plain http(s) URL."""
+    if content_type.startswith("application/json"):
+        data = json.loads(body or b"{}")
+        if not isinstance(data, dict):
+            raise ValueError("expected a JSON object")
+        url = data.get("url")
+    else:
+        url = parse_qs(body.decode("utf-8")).get("url", [None])[0]
+    if not url:
+        return None
+    if not isinstance(url, str):
+        raise ValueError("url must be a string")
+    if any(ord(ch) < 32 or ord(ch) == 127 for ch in url):
+        raise ValueError("control characters in url")
+    parts = urlsplit(url)
+    if parts.scheme.lower() not in ("http", "https") or not parts.hostname:
+        raise ValueError("not an http(s) url")
+    return url
+
+
+def location(url):
+    """`url` made safe for a Location header: the host IDNA-encoded, the
+    rest percent-encoded (existing %XX escapes are kept). Links stored
+    before URLs were checked go through here too."""
+    parts = urlsplit(url)
+    userinfo, at, hostport = parts.netloc.rpartition("@")
+    if hostport.startswith("["):                # IPv6 literal
+        host, port = hostport, ""
+    else:
+        host, _, port = hostport.partition(":")
+    try:
+        host = host.encode("idna").decode("ascii")
+    except UnicodeError:
+        host = quote(host, safe="")
+    netloc = (quote(userinfo, safe="%:!$&'()*+,;=") + at if at else "") + host + (":" + quote(port) if port else "")
+    return urlunsplit((
+        quote(parts.scheme, safe="+.-"),
+        netloc,
+        quote(parts.path, safe="%/:@!$&'()*+,;=~"),
+        quote(parts.query, safe="%/?:@!$&'()*+,;=~"),
+        quote(parts.fragment, safe="%/?:@!$&'()*+,;=~"),
+    ))
+
+
+class RedirectServer:
+    def __init__(self, store, base_url="http://short.ly", redirect_status=301,
+                 refresh_interval=1.0):
+        self.store = store
+        self.base_url = base_url.rstrip("/")
+        self.redirect_status = redirect_status
+        self.refresh_interval = refresh_interval
+        # One writer thread: storage engines expect writes to be serialised.
+        self.writer = ThreadPoolExecutor(max_workers=1, thread_name_prefix="shortener-io")
+
+    async def handle_connection(self, reader, writer):
+        try:
+            while True:
+                try:
+                    head = await reader.readuntil(b"\r\n\r\n")
+                except (asyncio.IncompleteReadError, asyncio.LimitOverrunError, ConnectionError):
+                    break
+
+                request_line, *header_lines = head.decode("latin-1").split("\r\n")
+                try:
+                    method, target, version = request_line.split(" ", 2)
+                except ValueError:
+                    writer.write(build_response(400, keep_alive=False))
+                    break
+
+                headers = {}
+                for line in header_lines:
+                    if ":" in line:
+                        name, value = line.split(":", 1)
+                        headers[name.strip().lower()] = value.strip()
+
+                connection = headers.get("connection", "").lower()
+                if version == "HTTP/1.0":
+                    keep_alive = connection == "keep-alive"
+                else:
+                    keep_alive = connection != "close"
+
+                try:
+                    length = int(headers.get("content-length", 0) or 0)
+                except ValueError:
+                    length = -1
+                if length < 0:
+                    writer.write(build_response(400, keep_alive=False))
+                    break
+                if length > MAX_BODY:
+                    writer.write(build_response(413, keep_alive=False))
+                    break
+                try:
+                    body = await reader.readexactly(length) if length else b""
+                except (asyncio.IncompleteReadError, ConnectionError):
+                    break
+
+                try:
+                    response = await self.dispatch(method, target, headers, body, keep_alive)
+                except Exception as error:
+                    # A bug or a failed write must still get an answer, not
+                    # a dropped connection.
+                    print(f"[SERVER] {method} {target} failed: {type(error).__name__}: {error}", flush=True)
+                    keep_alive = False
+                    response = build_response(500, keep_alive=False)
+                writer.write(response)
+                await writer.drain()
+                if not keep_alive:
+                    break
+        finally:
+            writer.close()
+
+    async def dispatch(self, method, target, headers, body, keep_alive):
+        path, _, query = target.partition("?")
+
+        if method == "POST" and path == "/shorten":
+            try:
+                url = parse_shorten_body(body, headers.get("content-type", ""))
+            except ValueError as error:          # UnicodeDecodeError is one too
+                return json_response(400, {"error": f"invalid url: {error}"}, keep_alive)
+            if not url:
+                return json_response(400, {"error": "missing url"}, keep_alive)
+            loop = asyncio.get_running_loop()
+            code = await loop.run_in_executor(self.writer, self.store.shorten, url)
+            return json_response(201, {"code": code, "short_url": f"{self.base_url}/{code}"}, keep_alive)
+
+        if method == "GET" and path.startswith("/_stats/"):
+            return self.stats(path[len("/_stats/"):], parse_qs(query), keep_alive)
+
+        if method == "GET":
+            code = path.lstrip("/")
+            if not code:
+                return json_response(200, self.store.stats(), keep_alive)
+            url = self.store.retrieve(code)
+            if url is None:
+                return build_response(404, b"Not Found", {"Content-Type": "text/plain"}, keep_alive)
+            return build_response(self.redirect_status, headers={"Location": location(url)}, keep_alive=keep_alive)
+
+        return build_response(405, headers={"Allow": "GET, POST"}, keep_alive=keep_alive)
+
+    def stats(self, what, params, keep_alive):
+        clicks = self.store.clicks
+        if clicks is None:
+            return json_response(404, {"error": "analytics disabled"}, keep_alive)
+        try:
+            if what == "top":
+                n = int(params.get("n", ["10"])[0])
+                day = params.get("day", [None])[0]
+                return json_response(200, clicks.top(n, day), keep_alive)
+            days = int(params.get("days", ["30"])[0])
+        except ValueError:
+            return json_response(400, {"error": "bad query"}, keep_alive)
+        return json_response(200, {"code": what, "total": clicks.total(what),
+                                   "days": clicks.series(what, days)}, keep_alive)
+
+    async def refresher(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            await asyncio.sleep(self.refresh_interval)
+            await loop.run_in_executor(self.writer, self.store.refresh)
+
+    async def serve(self, host, port):
+        server = await asyncio.start_server(self.handle_connection, host, port)
+        refresher = asyncio.create_task(self.refresher())
+        bound = server.sockets[0].getsockname()
+        print(f"[SERVER] Redirecting on http://{bound[0]}:{bound[1]}", flush=True)
+        try:
+            async with server:
+                await server.serve_forever()
+        finally:
+            refresher.cancel()
+            self.writer.shutdown(wait=True)
+
+
+def parse_args():
+    p = argparse.ArgumentParser(description="Async redirect server for the URL shortener")
+    p.add_argument("--host", default="127.0.0.1")
+    p.add_argument("--port", type=int, default=8080)
+    p.add_argument("--status", type=int, choices=[301, 302], default=301,
+                   help="Redirect status code")
+    p.add_argument("--base-url", default="http://short.ly")
+    p.add_argument("--cache-size", type=int, default=100_000)
+    p.add_argument("--no-analytics", action="store_true", help="Don't count clicks")
+    return p.parse_args()
+
+
+def main():
+    args = parse_args()
+    # The server refreshes on its own schedule, off the event loop.
+    clicks = None if args.no_analytics else ClickCounter()
+    store = ShortenerStore(cache_size=args.cache_size, refresh_interval=None, clicks=clicks)
+    server = RedirectServer(store, base_url=args.base_url, redirect_status=args.status)
+    try:
+        asyncio.run(server.serve(args.host, args.port))
+    except KeyboardInterrupt:
+        print("\n[SERVER] Stopping.")
+    finally:
+        store.close()
+
+
+if __name__ == "__main__":
+    main()
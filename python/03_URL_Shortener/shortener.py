@@ -1,40 +1,276 @@
+import argparse
+import csv
 import json
 import string
 import random
-from pathlib import Path
+import sys
+import threading
+import time
+from collections import OrderedDict
 
-db_file = Path("database.json")
+from allocator import CodeAllocator
+from analytics import ClickCounter
+from storage import JsonStorage, db_file, open_storage
 
 def load_db():
-    if db_file.exists():
-        return {}
-    with open(db_file, "r") as f:
-        return json.load(f)
+    return JsonStorage(db_file).load()
 
 def save_db(db):
-    with open(db_file, "w") as f:
-        json.dump(db, f)
+    JsonStorage(db_file).save(db)
 
 def generate_code(length=6):
     characters = string.ascii_letters + string.digits
     return "".join(random.choice(characters) for _ in range(length))
 
-def shorten_url(url):
-    db = load_db()
+class ShortenerStore:
+    """
+    Long-lived view of the database for servers and other repeat callers.
+
+    The storage engine is opened once and kept in memory. The most requested
+    codes sit in a bounded LRU in front of it, and at most once every
+    `refresh_interval` seconds the store checks the file's generation
+    (mtime/size or inode/size) to pick up changes made by other processes.
+    """
+
+    def __init__(self, storage=None, cache_size=100_000, refresh_interval=1.0,
+                 allocator=None, clicks=None):
+        self.storage = storage if storage is not None else open_storage()
+        self.allocator = allocator if allocator is not None else CodeAllocator()
+        self.clicks = clicks
+        self.cache_size = cache_size
+        self.refresh_interval = refresh_interval
+        self.cache = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.by_url = None          # url -> code, built on first bulk insert
+        self._lock = threading.Lock()
+        self._next_check = time.monotonic() + (refresh_interval or 0)
+
+    def refresh(self):
+        """Re-check the file on disk now; drops the LRU if it changed."""
+        if self.storage.refresh():
+            with self._lock:
+                self.cache.clear()
+                self.by_url = None
+
+    def _maybe_refresh(self):
+        # refresh_interval=None leaves refreshing to the caller (the async
+        # server does it off the event loop).
+        if self.refresh_interval is None:
+            return
+        now = time.monotonic()
+        if now < self._next_check:
+            return
+        self._next_check = now + self.refresh_interval
+        self.refresh()
+
+    def retrieve(self, code):
+        self._maybe_refresh()
+        with self._lock:
+            url = self.cache.get(code)
+            if url is not None:
+                self.cache.move_to_end(code)
+                self.hits += 1
+            else:
+                self.misses += 1
+
+        if url is None:
+            url = self.storage.get(code)
+            if url is None:
+                return None
+            with self._lock:
+                self.cache[code] = url
+                if len(self.cache) > self.cache_size:
+                    self.cache.popitem(last=False)
+
+        if self.clicks is not None:
+            self.clicks.record(code)
+        return url
+
+    def shorten(self, url):
+        code = self.allocator.next_code()
+        # Allocated codes never repeat; this only skips over random codes
+        # written by older versions of this script.
+        while code in self.storage:
+            code = self.allocator.next_code()
+        self.storage.put(code, url)
+        if self.by_url is not None:
+            self.by_url.setdefault(url, code)
+        return code
+
+    def shorten_many(self, urls):
+        """
+        Shorten a batch of URLs with a single durable write.
+
+        URLs that already have a code (in the store or earlier in the batch)
+        reuse it. Returns the codes in the same order as `urls`.
+        """
+        # Engines with their own reverse index (mmap) answer directly;
+        # otherwise build a url -> code dict once and keep it up to date.
+        known = getattr(self.storage, "code_for", None)
+        if known is None:
+            if self.by_url is None:
+                by_url = {}
+                for code, url in self.storage.items():
+                    by_url.setdefault(url, code)
+                self.by_url = by_url
+            known = self.by_url.get
+
+        codes = []
+        new = {}
+        for url in urls:
+            code = known(url) or new.get(url)
+            if code is None:
+                new[url] = None
+            codes.append(code)
 
-    while True:
-        code = generate_code()
-        if code not in db:
-            break
-    db[code] = url
-    save_db(db)
-    return code
+        fresh = [code for code in self.allocator.codes(len(new)) if code not in self.storage]
+        while len(fresh) < len(new):
+            fresh.extend(code for code in self.allocator.codes(len(new) - len(fresh))
+                         if code not in self.storage)
+        for url, code in zip(new, fresh):
+            new[url] = code
+
+        self.storage.put_many((code, url) for url, code in new.items())
+        if self.by_url is not None:
+            self.by_url.update(new)
+        return [code if code is not None else new[url] for url, code in zip(urls, codes)]
+
+    def export(self):
+        """Yield (code, url) for every link in the store."""
+        yield from self.storage.items()
+
+    def stats(self):
+        lookups = self.hits + self.misses
+        return {
+            "codes": len(self.storage),
+            "cached": len(self.cache),
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / lookups if lookups else 0.0,
+        }
+
+    def close(self):
+        if self.clicks is not None:
+            self.clicks.close()
+        self.storage.close()
+
+
+_store = None
+
+def get_store(clicks=False):
+    global _store
+    if _store is None:
+        _store = ShortenerStore()
+    if clicks and _store.clicks is None:
+        # Only lookups count clicks, so shorten/import/export never load
+        # the analytics files.
+        _store.clicks = ClickCounter()
+    return _store
+
+def shorten_url(url):
+    return get_store().shorten(url)
 
 def retrieve_url(short_code):
-    db = load_db()
-    return db.get(short_code, None)
+    return get_store(clicks=True).retrieve(short_code)
 
-if __name__ == "__main__":
+def shorten_many(urls):
+    return get_store().shorten_many(list(urls))
+
+
+# ---------------------------------------------------------
+# Bulk import / export
+# ---------------------------------------------------------
+
+def read_urls(f, fmt):
+    """Stream URLs out of a CSV (a "url" column, or the first column) or a
+    JSONL file (objects with a "url" key, or bare JSON strings)."""
+    if fmt == "jsonl":
+        for line in f:
+            line = line.strip()
+            if line:
+                item = json.loads(line)
+                yield item["url"] if isinstance(item, dict) else item
+        return
+
+    rows = csv.reader(f)
+    first = next(rows, None)
+    if first is None:
+        return
+    header = [cell.strip().lower() for cell in first]
+    column = header.index("url") if "url" in header else 0
+    if "url" not in header and first:
+        yield first[0]
+    for row in rows:
+        if len(row) > column and row[column]:
+            yield row[column]
+
+
+def batched(items, size):
+    batch = []
+    for item in items:
+        batch.append(item)
+        if len(batch) == size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+def guess_format(path, fmt):
+    if fmt:
+        return fmt
+    return "jsonl" if str(path).endswith((".jsonl", ".ndjson")) else "csv"
+
+
+def import_urls(path, fmt=None, batch_size=50_000, mapping=None):
+    store = get_store()
+    fmt = guess_format(path, fmt)
+    total = 0
+    with open(path, newline="", encoding="utf-8") as f:
+        out = csv.writer(mapping) if mapping else None
+        if out:
+            out.writerow(["url", "code"])
+        for batch in batched(read_urls(f, fmt), batch_size):
+            codes = store.shorten_many(batch)
+            total += len(batch)
+            if out:
+                out.writerows(zip(batch, codes))
+            print(f"[IMPORT] {total} URLs", file=sys.stderr)
+    return total
+
+
+def export_urls(f, fmt="jsonl"):
+    count = 0
+    if fmt == "csv":
+        out = csv.writer(f)
+        out.writerow(["code", "url"])
+        for count, row in enumerate(get_store().export(), 1):
+            out.writerow(row)
+    else:
+        for count, (code, url) in enumerate(get_store().export(), 1):
+            f.write(json.dumps({"code": code, "url": url}) + "\n")
+    return count
+
+
+def parse_args():
+    p = argparse.ArgumentParser(description="Offline URL shortener")
+    sub = p.add_subparsers(dest="command")
+
+    imp = sub.add_parser("import", help="Shorten every URL in a CSV/JSONL file")
+    imp.add_argument("file")
+    imp.add_argument("--format", choices=["csv", "jsonl"], help="Default: from the file extension")
+    imp.add_argument("--batch-size", type=int, default=50_000)
+    imp.add_argument("--mapping", help="Write url,code pairs to this CSV file")
+
+    exp = sub.add_parser("export", help="Stream every code and URL out of the store")
+    exp.add_argument("file", nargs="?", help="Default: stdout")
+    exp.add_argument("--format", choices=["csv", "jsonl"], default="jsonl")
+
+    return p.parse_args()
+
+
+def interactive():
     print("1) Shorten URL")
     print("2) Retrieve URL")
     choice = input("Enter your choice: ")
@@ -47,4 +283,28 @@ if __name__ == "__main__":
         url = retrieve_url(code)
         print(f"original URL: {url}")
     else:
-        print("Invalid choice")
\ No newline at end of file
+        print("Invalid choice")
+
+
+def main():
+    args = parse_args()
+    if args.command == "import":
+        mapping = open(args.mapping, "w", newline="", encoding="utf-8") if args.mapping else None
+        try:
+            total = import_urls(args.file, args.format, args.batch_size, mapping)
+        finally:
+            if mapping:
+                mapping.close()
+        print(f"Imported {total} URLs.")
+    elif args.command == "export":
+        if args.file:
+            with open(args.file, "w", newline="", encoding="utf-8") as f:
+                count = export_urls(f, args.format)
+            print(f"Exported {count} links to {args.file}.")
+        else:
+            export_urls(sys.stdout, args.format)
+    else:
+        interactive()
+
+if __name__ == "__main__":
+    main()
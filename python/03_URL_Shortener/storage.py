@@ -0,0 +1,501 @@
+import copy
+import json
+import os
+import threading
+from pathlib import Path
+
+from index import MmapIndex, build_from_log, index_dir
+
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+    import msvcrt
+
+db_file = Path("database.json")
+log_file = Path("database.log")
+
+# "json" keeps everything in database.json (rewritten on every save),
+# "log" appends one record per write to database.log, and "mmap" is the log
+# with older records served from the database.idx/ index.
+ENGINE = os.environ.get("SHORTENER_ENGINE", "json")
+
+
+class FileLock:
+    """
+    Exclusive advisory lock on `path`, held across threads and processes.
+
+        with FileLock("database.json.lock") as fd:
+            ...
+
+    The fd of the (created if missing) lock file is returned so callers can
+    keep small state, like the code counter, in the lock file itself.
+    """
+
+    def __init__(self, path):
+        self.path = Path(path)
+        self._thread_lock = threading.Lock()
+        self._fd = None
+
+    def __enter__(self):
+        self._thread_lock.acquire()
+        try:
+            self._fd = os.open(self.path, os.O_RDWR | os.O_CREAT, 0o644)
+            if fcntl is not None:
+                fcntl.flock(self._fd, fcntl.LOCK_EX)
+            else:
+                msvcrt.locking(self._fd, msvcrt.LK_LOCK, 1)
+        except BaseException:
+            if self._fd is not None:
+                os.close(self._fd)
+                self._fd = None
+            self._thread_lock.release()
+            raise
+        return self._fd
+
+    def __exit__(self, *exc):
+        try:
+            if fcntl is not None:
+                fcntl.flock(self._fd, fcntl.LOCK_UN)
+            else:
+                os.lseek(self._fd, 0, os.SEEK_SET)
+                msvcrt.locking(self._fd, msvcrt.LK_UNLCK, 1)
+        finally:
+            os.close(self._fd)
+            self._fd = None
+            self._thread_lock.release()
+
+
+def lock_path(path):
+    return path.with_name(path.name + ".lock")
+
+
+class JsonStorage:
+    """
+    The original single-file store: database.json holds one big dict.
+
+    The dict is parsed once and kept in memory; refresh() re-reads it only
+    when the file's mtime/size says somebody else rewrote it.
+    """
+
+    def __init__(self, path=db_file):
+        self.path = Path(path)
+        self._file_lock = FileLock(lock_path(self.path))
+        self._generation = None
+        self.db = {}
+        self.refresh()
+
+    def load(self):
+        if not self.path.exists():
+            return {}
+        with open(self.path, "r") as f:
+            return json.load(f)
+
+    def save(self, db):
+        # Write next to the real file and swap it in, so a crash mid-dump
+        # leaves the previous database intact instead of a truncated one.
+        tmp = self.path.with_name(self.path.name + ".tmp")
+        with open(tmp, "w") as f:
+            json.dump(db, f)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp, self.path)
+        self._generation = self.generation()
+
+    def generation(self):
+        try:
+            st = self.path.stat()
+        except FileNotFoundError:
+            return None
+        return (st.st_mtime_ns, st.st_size)
+
+    def refresh(self):
+        """Reload if the file changed on disk. Returns True if it did."""
+        generation = self.generation()
+        if generation == self._generation:
+            return False
+        self.db = self.load()
+        self._generation = generation
+        return True
+
+    def get(self, code):
+        return self.db.get(code)
+
+    def put(self, code, url):
+        # Re-read under the lock so a save from another process between our
+        # last refresh and this write is merged instead of overwritten.
+        with self._file_lock:
+            self.refresh()
+            self.db[code] = url
+            self.save(self.db)
+
+    def put_many(self, pairs):
+        with self._file_lock:
+            self.refresh()
+            self.db.update(pairs)
+            self.save(self.db)
+
+    def __contains__(self, code):
+        return code in self.db
+
+    def __len__(self):
+        return len(self.db)
+
+    def items(self):
+        return list(self.db.items())
+
+    def close(self):
+        pass
+
+
+class LogStorage:
+    """
+    Append-only log of one JSON record per line:
+
+        {"c": "Xy28Lm", "u": "https://google.com"}
+        {"c": "Xy28Lm", "d": 1}                      <- tombstone
+
+    The whole log is replayed into an in-memory dict on startup, writes are a
+    single append, and a background thread rewrites the log without the
+    overwritten/deleted records once they make up most of the file.
+    """
+
+    def __init__(self, path=log_file, fsync=False, compact_ratio=0.5,
+                 compact_min=1024, background=True):
+        self.path = Path(path)
+        self.fsync = fsync
+        self.compact_ratio = compact_ratio
+        self.compact_min = compact_min
+
+        self._lock = threading.Lock()
+        self._compacting = threading.Lock()
+        # Serialises appends against compactions in other processes, which
+        # swap a new file in under the same name.
+        self._file_lock = FileLock(lock_path(self.path))
+
+        # _offset is how far into the current log file (identified by inode)
+        # the index has been replayed; refresh() picks up records other
+        # processes appended after that point.
+        self._ino = None
+        self._reset()
+        self._replay(repair=True)
+        self._fh = open(self.path, "ab")
+        self._ino = os.fstat(self._fh.fileno()).st_ino
+
+        self._wakeup = threading.Event()
+        self._closed = False
+        self._thread = None
+        if background:
+            self._thread = threading.Thread(target=self._compactor, daemon=True)
+            self._thread.start()
+
+    # -- replay ---------------------------------------------------------
+
+    def _reset(self):
+        self.index = {}
+        self.records = 0
+        self._offset = 0
+
+    def _reload(self):
+        """Replay the log from scratch without emptying what readers see
+        in the meantime: the new tables are built on a shallow copy and
+        swapped in at the end. Callers hold self._lock."""
+        fresh = copy.copy(self)
+        fresh._reset()
+        fresh._replay()
+        self._adopt(fresh)
+
+    def _adopt(self, fresh):
+        self.records = fresh.records
+        self._offset = fresh._offset
+        self.index = fresh.index
+
+    def _apply(self, record):
+        if record.get("d"):
+            self.index.pop(record["c"], None)
+        else:
+            self.index[record["c"]] = record["u"]
+        self.records += 1
+
+    def _replay(self, repair=False):
+        if not self.path.exists():
+            return
+        good = self._offset
+        with open(self.path, "rb") as f:
+            f.seek(good)
+            for line in f:
+                if not line.endswith(b"\n"):
+                    break
+                try:
+                    self._apply(json.loads(line))
+                except (ValueError, KeyError):
+                    break
+                good += len(line)
+        self._offset = good
+        # A crash can only tear the last append; cut it off at startup so
+        # new records don't get glued onto half a line.
+        if repair and good != self.path.stat().st_size:
+            with open(self.path, "r+b") as f:
+                f.truncate(good)
+
+    def generation(self):
+        try:
+            st = self.path.stat()
+        except FileNotFoundError:
+            return None
+        return (st.st_ino, st.st_size)
+
+    def refresh(self):
+        """Pick up records appended by other processes, or reload from
+        scratch if the log was replaced by a compaction elsewhere.
+        Returns True if anything changed."""
+        generation = self.generation()
+        if generation is None:
+            return False
+        ino, size = generation
+        with self._lock:
+            if ino == self._ino and size == self._offset:
+                return False
+            if ino != self._ino:
+                self._fh.close()
+                self._fh = open(self.path, "ab")
+                self._ino = os.fstat(self._fh.fileno()).st_ino
+                self._reload()
+            else:
+                self._replay()
+            return True
+
+    # -- writes ---------------------------------------------------------
+
+    def _append(self, record):
+        self._append_many([record], self.fsync)
+
+    def _append_many(self, records, fsync):
+        data = b"".join(json.dumps(record, separators=(",", ":")).encode("utf-8") + b"\n"
+                        for record in records)
+        with self._file_lock:
+            generation = self.generation()
+            if generation is not None and generation[0] != self._ino:
+                # Compacted by another process: our fd points at the old,
+                # unlinked file, so appending there would lose the record.
+                self.refresh()
+            with self._lock:
+                end = os.fstat(self._fh.fileno()).st_size
+                self._fh.write(data)
+                self._fh.flush()
+                if fsync:
+                    os.fsync(self._fh.fileno())
+                for record in records:
+                    self._apply(record)
+                if end == self._offset:
+                    self._offset += len(data)
+                garbage = self.records - len(self.index)
+        if self.records >= self.compact_min and garbage > self.records * self.compact_ratio:
+            self._wakeup.set()
+
+    def put(self, code, url):
+        self._append({"c": code, "u": url})
+
+    def put_many(self, pairs):
+        """Append a whole batch with one write and one fsync."""
+        records = [{"c": code, "u": url} for code, url in pairs]
+        if records:
+            self._append_many(records, fsync=True)
+
+    def delete(self, code):
+        if code in self:
+            self._append({"c": code, "d": 1})
+
+    # -- reads ----------------------------------------------------------
+
+    def get(self, code):
+        return self.index.get(code)
+
+    def __contains__(self, code):
+        return code in self.index
+
+    def __len__(self):
+        return len(self.index)
+
+    def items(self):
+        return list(self.index.items())
+
+    # -- compaction -----------------------------------------------------
+
+    def compact(self):
+        """Rewrite the log with only live records. Writers are only blocked
+        while the tail written during the rewrite is copied over."""
+        with self._compacting:
+            with self._lock:
+                snapshot = list(self.index.items())
+                offset = self._offset
+
+            tmp = self.path.with_name(f"{self.path.name}.compact.{os.getpid()}")
+            with open(tmp, "wb") as out:
+                for code, url in snapshot:
+                    out.write(json.dumps({"c": code, "u": url}, separators=(",", ":")).encode("utf-8") + b"\n")
+
+                with self._file_lock, self._lock:
+                    generation = self.generation()
+                    if generation is None or generation[0] != self._ino:
+                        # Another process compacted first; ours is stale.
+                        out.close()
+                        tmp.unlink()
+                        return
+                    self._replay()
+                    with open(self.path, "rb") as old:
+                        old.seek(offset)
+                        tail = old.read()
+                    out.write(tail)
+                    out.flush()
+                    os.fsync(out.fileno())
+                    self._fh.close()
+                    os.replace(tmp, self.path)
+                    self._fh = open(self.path, "ab")
+                    self._ino = os.fstat(self._fh.fileno()).st_ino
+                    self._offset = self._fh.tell()
+                    self.records = len(snapshot) + tail.count(b"\n")
+
+    def _compactor(self):
+        while True:
+            self._wakeup.wait()
+            self._wakeup.clear()
+            if self._closed:
+                return
+            # Whatever goes wrong, keep the thread alive: if it died the
+            # log would never be compacted again.
+            try:
+                self.compact()
+            except Exception as error:
+                print(f"[STORAGE] Compaction failed: {type(error).__name__}: {error}")
+
+    def close(self):
+        self._closed = True
+        self._wakeup.set()
+        if self._thread is not None:
+            self._thread.join()
+        with self._lock:
+            self._fh.close()
+
+
+class IndexedLogStorage(LogStorage):
+    """
+    The log engine on top of a memory-mapped index (see index.py).
+
+    Only the part of the log written after the index was built is replayed
+    into memory; everything older is looked up in the index's mmapped
+    shards. Startup time and RSS stay flat as the table grows. The log is
+    not compacted in the background here: rebuilding the index
+    (`python index.py build`, or compact()) is what keeps the replayed tail
+    short.
+    """
+
+    def __init__(self, path=log_file, index_path=None, **kwargs):
+        self.index_path = Path(index_path) if index_path is not None else index_dir
+        kwargs["background"] = False
+        super().__init__(path, **kwargs)
+
+    def _manifest_generation(self):
+        try:
+            st = (self.index_path / "manifest.json").stat()
+        except FileNotFoundError:
+            return None
+        return (st.st_ino, st.st_mtime_ns)
+
+    def _reset(self):
+        super()._reset()
+        self.deleted = set()
+        self.delta_by_url = {}
+        self.base = None
+        self._base_generation = None
+        if self._manifest_generation() is None:
+            return
+        base = MmapIndex(self.index_path)
+        self._base_generation = base.generation
+        source = base.manifest["source"]
+        if source.get("engine") == "log":
+            generation = self.generation()
+            if generation is None or generation[0] != source["ino"] or generation[1] < source["offset"]:
+                print(f"[STORAGE] {self.index_path} was built from a different log; ignoring it")
+                return
+            self._offset = source["offset"]
+        self.base = base
+
+    def _adopt(self, fresh):
+        # Base first: until the index is swapped too, a miss in the old
+        # tail falls through to the new base, which holds all of it.
+        self.base = fresh.base
+        self._base_generation = fresh._base_generation
+        self.deleted = fresh.deleted
+        self.delta_by_url = fresh.delta_by_url
+        super()._adopt(fresh)
+
+    def _apply(self, record):
+        code = record["c"]
+        if record.get("d"):
+            self.deleted.add(code)
+        else:
+            self.deleted.discard(code)
+            self.delta_by_url.setdefault(record["u"], code)
+        super()._apply(record)
+
+    def refresh(self):
+        generation = self._manifest_generation()
+        # None while build_index() swaps directories: keep the old base
+        # until the new one is in place.
+        if generation is not None and generation != self._base_generation:
+            with self._lock:
+                self._reload()
+            return True
+        return super().refresh()
+
+    def get(self, code):
+        url = self.index.get(code)
+        if url is not None or self.base is None or code in self.deleted:
+            return url
+        return self.base.get(code)
+
+    def __contains__(self, code):
+        return self.get(code) is not None
+
+    def __len__(self):
+        # Approximate: codes rewritten since the index build count twice.
+        base = len(self.base) if self.base is not None else 0
+        return base + len(self.index) - len(self.deleted)
+
+    def code_for(self, url):
+        code = self.delta_by_url.get(url)
+        if code is not None and self.index.get(code) == url:
+            return code
+        if self.base is not None:
+            code = self.base.code_for(url)
+            if code is not None and self.get(code) == url:
+                return code
+        return None
+
+    def items(self):
+        if self.base is not None:
+            for code, url in self.base.items():
+                if code not in self.index and code not in self.deleted:
+                    yield code, url
+        yield from list(self.index.items())
+
+    def compact(self):
+        """Fold the replayed tail into a freshly built index."""
+        with self._compacting:
+            build_from_log(self.path, self.index_path)
+            self.refresh()
+
+
+ENGINES = {
+    "json": JsonStorage,
+    "log": LogStorage,
+    "mmap": IndexedLogStorage,
+}
+
+
+def open_storage(engine=None, **kwargs):
+    engine = engine or ENGINE
+    if engine not in ENGINES:
+        raise ValueError(f"Unknown storage engine: {engine!r} (choose from {', '.join(ENGINES)})")
+    return ENGINES[engine](**kwargs)
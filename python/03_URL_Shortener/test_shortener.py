@@ -0,0 +1,292 @@
+import json
+import threading
+
+import pytest
+
+from allocator import SPACE, CodeAllocator, Permutation, load_key
+from index import MmapIndex, build_from_log, build_index
+from storage import IndexedLogStorage, JsonStorage, LogStorage
+
+
+def open_engine(engine, tmp_path):
+    if engine == "json":
+        return JsonStorage(tmp_path / "database.json")
+    if engine == "log":
+        return LogStorage(tmp_path / "database.log", background=False)
+    return IndexedLogStorage(tmp_path / "database.log", index_path=tmp_path / "database.idx")
+
+
+# ---------------------------------------------------------
+# Storage engines
+# ---------------------------------------------------------
+
+@pytest.mark.parametrize("engine", ["json", "log", "mmap"])
+def test_put_get_survive_reopen(engine, tmp_path):
+    store = open_engine(engine, tmp_path)
+    store.put("Aaaaaa", "https://a.example")
+    store.put_many([("Bbbbbb", "https://b.example"), ("Cccccc", "https://c.example")])
+    store.put("Aaaaaa", "https://a2.example")
+    assert store.get("Aaaaaa") == "https://a2.example"
+    assert store.get("Zzzzzz") is None
+    store.close()
+
+    store = open_engine(engine, tmp_path)
+    assert store.get("Aaaaaa") == "https://a2.example"
+    assert dict(store.items()) == {"Aaaaaa": "https://a2.example",
+                                   "Bbbbbb": "https://b.example",
+                                   "Cccccc": "https://c.example"}
+    store.close()
+
+
+@pytest.mark.parametrize("engine", ["log", "mmap"])
+def test_delete_survives_reopen_and_index_rebuild(engine, tmp_path):
+    store = open_engine(engine, tmp_path)
+    store.put_many([("Aaaaaa", "https://a.example"), ("Bbbbbb", "https://b.example")])
+    if engine == "mmap":
+        store.compact()                 # Aaaaaa now lives in the index
+    store.delete("Aaaaaa")
+    assert store.get("Aaaaaa") is None and "Aaaaaa" not in store
+    store.close()
+
+    store = open_engine(engine, tmp_path)
+    assert store.get("Aaaaaa") is None
+    assert store.get("Bbbbbb") == "https://b.example"
+    store.close()
+
+
+def test_log_replay_cuts_off_a_torn_last_record(tmp_path):
+    path = tmp_path / "database.log"
+    store = LogStorage(path, background=False)
+    store.put("Aaaaaa", "https://a.example")
+    store.close()
+    with open(path, "ab") as f:
+        f.write(b'{"c":"Bbbbbb","u":"https://b.ex')      # crash mid-append
+
+    store = LogStorage(path, background=False)
+    assert store.get("Bbbbbb") is None
+    store.put("Cccccc", "https://c.example")
+    store.close()
+    assert path.read_bytes().count(b"\n") == 2
+    store = LogStorage(path, background=False)
+    assert dict(store.items()) == {"Aaaaaa": "https://a.example", "Cccccc": "https://c.example"}
+    store.close()
+
+
+def test_compaction_drops_overwritten_records(tmp_path):
+    path = tmp_path / "database.log"
+    store = LogStorage(path, background=False)
+    for i in range(100):
+        store.put("Aaaaaa", f"https://a.example/{i}")
+    store.put("Bbbbbb", "https://b.example")
+    store.delete("Bbbbbb")
+    store.compact()
+    assert path.read_bytes().count(b"\n") == 1
+    assert store.get("Aaaaaa") == "https://a.example/99"
+    store.put("Cccccc", "https://c.example")          # appends to the new file
+    store.close()
+
+    store = LogStorage(path, background=False)
+    assert dict(store.items()) == {"Aaaaaa": "https://a.example/99", "Cccccc": "https://c.example"}
+    store.close()
+
+
+def test_handle_adopts_another_handles_compaction(tmp_path):
+    path = tmp_path / "database.log"
+    ours = LogStorage(path, background=False)
+    theirs = LogStorage(path, background=False)
+    ours.put_many([(f"A{i:05d}", f"https://a.example/{i}") for i in range(50)])
+    theirs.refresh()
+    theirs.put("Bbbbbb", "https://b.example")
+    theirs.compact()                  # swaps a new file in under our feet
+
+    ours.put("Cccccc", "https://c.example")         # must land in the new file
+    assert ours.get("Bbbbbb") == "https://b.example"
+    theirs.refresh()
+    assert theirs.get("Cccccc") == "https://c.example"
+    ours.close()
+    theirs.close()
+
+    store = LogStorage(path, background=False)
+    assert len(store) == 52
+    store.close()
+
+
+def test_compaction_while_another_handle_writes(tmp_path):
+    path = tmp_path / "database.log"
+    writer = LogStorage(path, background=False)
+    compactor = LogStorage(path, background=False)
+    done = threading.Event()
+
+    def write():
+        for i in range(2000):
+            writer.put(f"W{i % 300:05d}", f"https://w.example/{i}")
+        done.set()
+
+    thread = threading.Thread(target=write)
+    thread.start()
+    while not done.is_set():
+        compactor.refresh()
+        compactor.compact()
+    thread.join()
+    writer.close()
+    compactor.close()
+
+    store = LogStorage(path, background=False)
+    expected = {f"W{n:05d}": f"https://w.example/{i}" for i, n in ((i, i % 300) for i in range(2000))}
+    assert dict(store.items()) == expected
+    store.close()
+
+
+# ---------------------------------------------------------
+# Memory-mapped index
+# ---------------------------------------------------------
+
+def test_index_round_trip(tmp_path):
+    records = [(f"{c}{i:05d}", f"https://{c}.example/{i}") for c in "aZ09" for i in range(200)]
+    records.append(("a00003", None))                  # later records win, None deletes
+    build_index(records, tmp_path / "database.idx")
+    ix = MmapIndex(tmp_path / "database.idx")
+    assert len(ix) == 799
+    assert ix.get("Z00007") == "https://Z.example/7"
+    assert ix.get("a00003") is None and ix.get("b00001") is None and ix.get("") is None
+    assert ix.code_for("https://9.example/150") == "900150"
+    assert ix.code_for("https://nowhere.example") is None
+    latest = dict(records)
+    assert dict(ix.items()) == {code: url for code, url in latest.items() if url is not None}
+
+
+def test_open_index_keeps_reading_its_own_build(tmp_path):
+    out = tmp_path / "database.idx"
+    build_index([("Aaaaaa", "example/a"), ("Bbbbbb", "example/b")], out)
+    ix = MmapIndex(out)
+    assert ix.get("Aaaaaa") == "example/a"
+    build_index([("Aaaaaa", "rebuilt/a-longer"), ("Bbbbbb", "rebuilt/b-much-longer")], out)
+
+    # Never a mix of the two builds (shards from the new one, urls.dat
+    # from the old), and never an error for the files that moved.
+    assert ix.get("Bbbbbb") == "example/b"
+    assert ix.code_for("example/b") == "Bbbbbb"
+    assert MmapIndex(out).get("Bbbbbb") == "rebuilt/b-much-longer"
+
+
+def test_indexed_storage_picks_up_a_rebuild(tmp_path):
+    log, out = tmp_path / "database.log", tmp_path / "database.idx"
+    reader = IndexedLogStorage(log, index_path=out)
+    writer = IndexedLogStorage(log, index_path=out)
+    writer.put_many([(f"A{i:05d}", f"https://a.example/{i}") for i in range(100)])
+    build_from_log(log, out)
+    writer.put("Bbbbbb", "https://b.example")         # after the index build
+
+    assert reader.refresh()
+    assert reader.base is not None and len(reader.index) == 1
+    assert reader.get("A00042") == "https://a.example/42"
+    assert reader.get("Bbbbbb") == "https://b.example"
+    reader.close()
+    writer.close()
+
+
+# ---------------------------------------------------------
+# Code allocation
+# ---------------------------------------------------------
+
+def test_permutation_is_a_bijection_inside_the_code_space():
+    permute = Permutation(b"test-key")
+    numbers = list(range(20000)) + list(range(SPACE - 20000, SPACE))
+    outputs = [permute(n) for n in numbers]
+    assert len(set(outputs)) == len(numbers)
+    assert all(0 <= n < SPACE for n in outputs)
+    assert outputs != sorted(outputs)                  # doesn't look sequential
+    assert Permutation(b"other-key")(0) != outputs[0]
+    with pytest.raises(ValueError):
+        permute(SPACE)
+
+
+def test_allocators_sharing_a_counter_never_repeat_a_code(tmp_path):
+    counter = tmp_path / "database.counter"
+    first = CodeAllocator(counter, key=b"k", block_size=16)
+    second = CodeAllocator(counter, key=b"k", block_size=16)
+    assert first.reserve(10) == range(0, 10)
+    assert second.reserve(5) == range(10, 15)
+
+    codes = []
+    lock = threading.Lock()
+
+    def take(allocator):
+        mine = [allocator.next_code() for _ in range(500)]
+        with lock:
+            codes.extend(mine)
+
+    threads = [threading.Thread(target=take, args=(a,)) for a in (first, second) * 4]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    codes += first.codes(100)
+    assert len(codes) == len(set(codes)) == 4100
+
+
+def test_key_is_created_once_and_reused(tmp_path, monkeypatch):
+    monkeypatch.delenv("SHORTENER_KEY", raising=False)
+    path = tmp_path / "database.key"
+    key = load_key(path)
+    assert key and load_key(path) == key
+    assert [p.name for p in tmp_path.iterdir()] == ["database.key"]
+    path.write_bytes(b"")
+    with pytest.raises(RuntimeError):
+        load_key(path)
+
+
+# ---------------------------------------------------------
+# Redirect server
+# ---------------------------------------------------------
+
+def make_server(tmp_path):
+    from server import RedirectServer
+    from shortener import ShortenerStore
+    store = ShortenerStore(storage=JsonStorage(tmp_path / "database.json"), refresh_interval=None,
+                           allocator=CodeAllocator(tmp_path / "database.counter", key=b"k"))
+    return RedirectServer(store)
+
+
+def request(server, method, target, body=b"", content_type="application/x-www-form-urlencoded"):
+    import asyncio
+    raw = asyncio.run(server.dispatch(method, target, {"content-type": content_type}, body, True))
+    head, _, payload = raw.partition(b"\r\n\r\n")
+    lines = head.decode("latin-1").split("\r\n")
+    headers = dict(line.split(": ", 1) for line in lines[1:])
+    return int(lines[0].split()[1]), headers, payload
+
+
+@pytest.mark.parametrize("body", [
+    b"url=https://evil.com/%0D%0ASet-Cookie:%20a=b",
+    b"url=javascript:alert(1)",
+    b"url=ftp://files.example/x",
+    b"url=https://",
+])
+def test_shorten_rejects_unsafe_urls(tmp_path, body):
+    status, _, payload = request(make_server(tmp_path), "POST", "/shorten", body)
+    assert status == 400 and b"invalid url" in payload
+
+
+def test_shorten_rejects_json_that_is_not_an_object(tmp_path):
+    status, _, _ = request(make_server(tmp_path), "POST", "/shorten", b'["https://a.example"]',
+                           "application/json")
+    assert status == 400
+
+
+def test_redirect_location_is_ascii_and_single_line(tmp_path):
+    server = make_server(tmp_path)
+    status, _, payload = request(server, "POST", "/shorten",
+                                 '{"url": "https://bücher.example/straße?q=ä ö#top"}'.encode("utf-8"),
+                                 "application/json")
+    assert status == 201
+    code = json.loads(payload)["code"]
+    # A link stored before URLs were checked still can't inject headers.
+    server.store.storage.put("Legacy", "https://evil.com/\r\nSet-Cookie: a=b")
+
+    status, headers, _ = request(server, "GET", f"/{code}")
+    assert status == 301
+    assert headers["Location"] == "https://xn--bcher-kva.example/stra%C3%9Fe?q=%C3%A4%20%C3%B6#top"
+    status, headers, _ = request(server, "GET", "/Legacy")
+    assert status == 301 and list(headers) == ["Location", "Content-Length", "Connection"]
+    assert "\r" not in headers["Location"] and "\n" not in headers["Location"]
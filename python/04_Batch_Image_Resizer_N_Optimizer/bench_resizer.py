@@ -0,0 +1,197 @@
+"""
+Benchmarks for the resizer on a synthetic image corpus.
+
+    python bench_resizer.py executors --count 200 --size 3000x2000 --workers 8
+    python bench_resizer.py decode --count 20 --size 6000x4000 --width 1080
+    python bench_resizer.py renditions --count 50 --sizes 320,640,1080,2048
+
+Generates noisy JPEGs into a temp folder (or --corpus DIR, reused between
+runs).
+
+`executors` times serial, thread and process execution with the same
+options. `decode` compares the old full-size decode + exif_transpose +
+copy + thumbnail path with the draft-mode path resize_image() uses now.
+Each variant runs in a fresh process, so its peak RSS can be reported.
+`renditions` compares one run per width with a single --sizes run.
+"""
+
+import argparse
+import concurrent.futures
+import multiprocessing
+import os
+import shutil
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+from PIL import Image, ImageOps
+
+from resizer import STAGES, run_jobs, parse_sizes, exif_orientation, prepare_decode, resize_image, TRANSPOSED_ORIENTATIONS
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+
+def make_corpus(folder: Path, count, size):
+    folder.mkdir(parents=True, exist_ok=True)
+    w, h = size
+    existing = sorted(folder.glob("*.jpg"))
+    if len(existing) >= count:
+        return existing[:count]
+    for i in range(len(existing), count):
+        noise = Image.effect_noise((w, h), 40 + i % 30)
+        gradient = Image.linear_gradient("L").resize((w, h))
+        img = Image.merge("RGB", (noise, gradient, gradient.transpose(Image.FLIP_LEFT_RIGHT)))
+        img.save(folder / f"img_{i:05d}.jpg", quality=92)
+    return sorted(folder.glob("*.jpg"))[:count]
+
+
+def bench(files, root_in, mode, workers, options, chunksize):
+    out = Path(tempfile.mkdtemp(prefix=f"bench_{mode}_"))
+    try:
+        jobs = [(f, root_in, out, options) for f in files]
+        start = time.perf_counter()
+        stage_totals = {}
+        ok = 0
+        for _, (success, _, timings, _) in run_jobs(jobs, mode, 1 if mode == "serial" else workers, chunksize):
+            ok += success
+            for name, seconds in timings.items():
+                stage_totals[name] = stage_totals.get(name, 0.0) + seconds
+        return time.perf_counter() - start, ok, stage_totals
+    finally:
+        shutil.rmtree(out, ignore_errors=True)
+
+
+def parse_size(text):
+    w, h = text.lower().split("x")
+    return int(w), int(h)
+
+
+def legacy_load(path, width):
+    """The pre-draft pipeline: full decode, rotate, copy, thumbnail."""
+    with Image.open(path) as im:
+        im = ImageOps.exif_transpose(im)
+        img = im.copy()
+        img.thumbnail((width, int(im.height * width / im.width)), Image.LANCZOS)
+        return img.size
+
+
+def draft_load(path, width):
+    with Image.open(path) as im:
+        target_w, target_h = width, None
+        orientation = exif_orientation(im)
+        if orientation in TRANSPOSED_ORIENTATIONS:
+            target_w, target_h = target_h, target_w
+        prepare_decode(im, target_w, target_h)
+        im.load()
+        out = resize_image(im, target_w, target_h)
+        if orientation != 1:
+            out = ImageOps.exif_transpose(out)
+        return out.size
+
+
+def _decode_run(variant, files, width):
+    load = legacy_load if variant == "legacy" else draft_load
+    start = time.perf_counter()
+    for f in files:
+        load(f, width)
+    seconds = time.perf_counter() - start
+    return seconds, peak_rss_mb()
+
+
+def peak_rss_mb():
+    # VmHWM belongs to this process image only; ru_maxrss on Linux also
+    # counts what the parent had resident when it forked us.
+    try:
+        with open("/proc/self/status") as f:
+            for line in f:
+                if line.startswith("VmHWM:"):
+                    return int(line.split()[1]) / 1024
+    except OSError:
+        pass
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # macOS reports bytes, other Unixes KiB.
+    return peak / (1024 * 1024) if sys.platform == "darwin" else peak / 1024
+
+
+def bench_decode(files, width):
+    print(f"\n{'variant':<8} {'seconds':>8} {'img/s':>8} {'peak RSS':>10}")
+    for variant in ("legacy", "draft"):
+        ctx = multiprocessing.get_context("spawn")
+        with concurrent.futures.ProcessPoolExecutor(1, mp_context=ctx) as ex:
+            seconds, peak = ex.submit(_decode_run, variant, files, width).result()
+        rss = f"{peak:8.0f}MB" if peak is not None else "     n/a"
+        print(f"{variant:<8} {seconds:8.2f} {len(files) / seconds:8.1f} {rss:>10}")
+
+
+def bench_renditions(files, root_in, sizes, workers, chunksize):
+    base = {"height": None, "quality": 85, "watermark": None,
+            "preserve_exif": False, "format": "jpg", "overwrite": True}
+    start = time.perf_counter()
+    for width in sizes:
+        bench(files, root_in, "serial", workers, dict(base, width=width), chunksize)
+    separate = time.perf_counter() - start
+    single, _, _ = bench(files, root_in, "serial", workers, dict(base, width=None, sizes=sizes), chunksize)
+    print(f"\n{len(sizes)} separate runs: {separate:8.2f}s")
+    print(f"one --sizes run:  {single:8.2f}s  ({separate / single:.1f}x faster)")
+
+
+def main():
+    p = argparse.ArgumentParser(description="Benchmark the resizer")
+    p.add_argument("what", nargs="?", choices=["executors", "decode", "renditions"], default="executors")
+    p.add_argument("--count", type=int, default=100)
+    p.add_argument("--size", type=parse_size, default=(3000, 2000))
+    p.add_argument("--workers", type=int, default=os.cpu_count() or 4)
+    p.add_argument("--chunksize", type=int, default=8)
+    p.add_argument("--width", type=int, default=1080)
+    p.add_argument("--sizes", type=parse_sizes, default=[320, 640, 1080, 2048])
+    p.add_argument("--watermark", default=None)
+    p.add_argument("--modes", default="serial,thread,process")
+    p.add_argument("--corpus", help="Folder to create/reuse the synthetic images in")
+    args = p.parse_args()
+
+    tmp = None
+    if args.corpus:
+        root_in = Path(args.corpus).resolve()
+    else:
+        tmp = tempfile.mkdtemp(prefix="bench_corpus_")
+        root_in = Path(tmp)
+
+    try:
+        print(f"Generating {args.count} images of {args.size[0]}x{args.size[1]}…")
+        files = make_corpus(root_in, args.count, args.size)
+
+        if args.what == "decode":
+            bench_decode(files, args.width)
+            return
+        if args.what == "renditions":
+            bench_renditions(files, root_in, args.sizes, args.workers, args.chunksize)
+            return
+
+        options = {
+            "width": args.width,
+            "height": None,
+            "quality": 85,
+            "watermark": args.watermark,
+            "preserve_exif": False,
+            "format": "jpg",
+            "overwrite": True,
+        }
+
+        print(f"\n{'mode':<8} {'seconds':>8} {'img/s':>8}  " + " ".join(f"{s:>9}" for s in STAGES))
+        for mode in args.modes.split(","):
+            seconds, ok, stage_totals = bench(files, root_in, mode, args.workers, options, args.chunksize)
+            per_stage = " ".join(f"{stage_totals.get(s, 0.0) / max(ok, 1) * 1000:7.1f}ms" for s in STAGES)
+            print(f"{mode:<8} {seconds:8.2f} {ok / seconds:8.1f}  {per_stage}")
+    finally:
+        if tmp:
+            shutil.rmtree(tmp, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main()
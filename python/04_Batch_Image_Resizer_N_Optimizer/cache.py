@@ -0,0 +1,237 @@
+"""
+Incremental rebuild cache for resizer.py.
+
+A small SQLite manifest in the output folder remembers, for every source
+image: its size, mtime and content hash, a hash of the options that affect
+the output, and the output files it produced (one per rendition and
+format). On the next run:
+
+* size + mtime + options unchanged and outputs present -> skipped after a stat
+* touched but byte-identical (same content hash)      -> skipped after a hash
+* same content as another source already built with
+  the same options                                    -> output copied, not re-encoded
+* anything else                                       -> rebuilt
+
+Changing --width, --sizes, --quality, --format, --watermark, ... changes the options
+hash, which invalidates every entry automatically.
+"""
+
+import concurrent.futures
+import hashlib
+import json
+import os
+import secrets
+import shutil
+import sqlite3
+from pathlib import Path
+
+CACHE_NAME = ".resizer-cache.sqlite"
+
+# Options that change the bytes we write. Anything else (workers, overwrite,
+# executor, …) must not invalidate the cache.
+OUTPUT_OPTIONS = ("width", "height", "sizes", "quality", "format", "watermark", "preserve_exif",
+                  "target_kb", "max_ssim_loss")
+
+HASH_CHUNK = 1 << 20
+PLAN_BATCH = 256
+
+
+def temp_output(dst):
+    """
+    Create an empty temp file next to `dst`, to be renamed over it once
+    written. Returns (fd, path). mkstemp() would make it 0600 and the rename
+    keeps that; created with 0666 here, the kernel applies the umask just as
+    open(dst, "wb") would, without this process ever changing its umask.
+    """
+    tmp = dst.with_name(f".{dst.name}.{secrets.token_hex(6)}.tmp")
+    fd = os.open(tmp, os.O_WRONLY | os.O_CREAT | os.O_EXCL | getattr(os, "O_BINARY", 0), 0o666)
+    return fd, tmp
+
+
+def options_key(options):
+    relevant = {name: options.get(name) for name in OUTPUT_OPTIONS}
+    blob = json.dumps(relevant, sort_keys=True, default=str).encode("utf-8")
+    return hashlib.blake2b(blob, digest_size=16).hexdigest()
+
+
+def file_hash(path):
+    h = hashlib.blake2b(digest_size=20)
+    with open(path, "rb") as f:
+        while True:
+            chunk = f.read(HASH_CHUNK)
+            if not chunk:
+                break
+            h.update(chunk)
+    return h.hexdigest()
+
+
+def _outputs(column):
+    """The `output` column holds a JSON list of paths relative to root_out
+    (older manifests stored a single bare path)."""
+    try:
+        outputs = json.loads(column)
+    except ValueError:
+        return [column]
+    return outputs if isinstance(outputs, list) else [column]
+
+
+def _all_exist(paths):
+    return all(Path(path).exists() for path in paths)
+
+
+def _batches(items, size):
+    batch = []
+    for item in items:
+        batch.append(item)
+        if len(batch) == size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+class BuildCache:
+    def __init__(self, root_out: Path, options, hash_workers=4):
+        self.root_out = Path(root_out)
+        self.okey = options_key(options)
+        self.hash_workers = hash_workers
+        self.db = sqlite3.connect(str(self.root_out / CACHE_NAME))
+        self.db.execute("PRAGMA journal_mode=WAL")
+        self.db.execute("PRAGMA synchronous=NORMAL")
+        self.db.execute("""
+            CREATE TABLE IF NOT EXISTS sources (
+                src      TEXT PRIMARY KEY,
+                size     INTEGER,
+                mtime_ns INTEGER,
+                hash     TEXT,
+                options  TEXT,
+                output   TEXT
+            )""")
+        self.db.execute("CREATE INDEX IF NOT EXISTS by_content ON sources (hash, options)")
+        # Qualities picked by --target-kb / --max-ssim-loss, per content and
+        # rendition, so rebuilding the same image doesn't search again.
+        self.db.execute("""
+            CREATE TABLE IF NOT EXISTS qualities (
+                hash      TEXT,
+                options   TEXT,
+                rendition TEXT,
+                quality   INTEGER,
+                PRIMARY KEY (hash, options, rendition)
+            )""")
+        self._pending = 0
+        # Content hashes handed out as "build" whose job hasn't finished;
+        # the caller removes each one with finished().
+        self._in_flight = set()
+
+    def _row(self, key):
+        return self.db.execute(
+            "SELECT size, mtime_ns, hash, options, output FROM sources WHERE src = ?", (key,)
+        ).fetchone()
+
+    def _built_elsewhere(self, content_hash, key):
+        for (column,) in self.db.execute(
+            "SELECT output FROM sources WHERE hash = ? AND options = ? AND src != ?",
+            (content_hash, self.okey, key),
+        ):
+            paths = [self.root_out / output for output in _outputs(column)]
+            if _all_exist(paths):
+                return paths
+        return None
+
+    def plan(self, items, overwrite=False):
+        """
+        For each (key, src, dsts, payload) yield (payload, action, info):
+
+            ("fresh", None)                  nothing to do
+            ("copy", (st, hash, from_paths)) same content already built; copy it
+            ("build", (st, hash))            encode it, then record() it
+            ("wait", (st, hash))             same content is being built right
+                                             now; copy from it once it's done
+
+        Call finished(hash) when a "build" job is done, so memory only
+        holds the hashes still being built.
+        """
+        # hashlib releases the GIL on large buffers, so threads help here.
+        with concurrent.futures.ThreadPoolExecutor(self.hash_workers) as ex:
+            for batch in _batches(items, PLAN_BATCH):
+                needs_hash = []
+                for item in batch:
+                    key, src, dsts, payload = item
+                    st = src.stat()
+                    row = self._row(key)
+                    if (not overwrite and row and row[0] == st.st_size and row[1] == st.st_mtime_ns
+                            and row[3] == self.okey and _all_exist(dsts)):
+                        yield payload, "fresh", None
+                    else:
+                        needs_hash.append((item, st, row))
+
+                hashes = ex.map(lambda entry: file_hash(entry[0][1]), needs_hash)
+                for ((key, src, dsts, payload), st, row), content_hash in zip(needs_hash, hashes):
+                    if (not overwrite and row and row[2] == content_hash and row[3] == self.okey
+                            and _all_exist(dsts)):
+                        self.record(key, st, content_hash, dsts)
+                        yield payload, "fresh", None
+                        continue
+                    if not overwrite:
+                        existing = self._built_elsewhere(content_hash, key)
+                        if existing is not None:
+                            yield payload, "copy", (st, content_hash, existing)
+                            continue
+                    if content_hash in self._in_flight:
+                        yield payload, "wait", (st, content_hash)
+                        continue
+                    self._in_flight.add(content_hash)
+                    yield payload, "build", (st, content_hash)
+
+    def finished(self, content_hash):
+        self._in_flight.discard(content_hash)
+
+    def record(self, key, st, content_hash, dsts):
+        output = json.dumps([Path(dst).relative_to(self.root_out).as_posix() for dst in dsts])
+        self.db.execute(
+            "INSERT OR REPLACE INTO sources (src, size, mtime_ns, hash, options, output) VALUES (?, ?, ?, ?, ?, ?)",
+            (key, st.st_size, st.st_mtime_ns, content_hash, self.okey, output),
+        )
+        self._pending += 1
+        if self._pending >= 1000:
+            self.commit()
+
+    def qualities(self, content_hash):
+        return dict(self.db.execute(
+            "SELECT rendition, quality FROM qualities WHERE hash = ? AND options = ?",
+            (content_hash, self.okey),
+        ))
+
+    def record_qualities(self, content_hash, qualities):
+        self.db.executemany(
+            "INSERT OR REPLACE INTO qualities (hash, options, rendition, quality) VALUES (?, ?, ?, ?)",
+            [(content_hash, self.okey, rendition, q) for rendition, q in qualities.items()],
+        )
+
+    def find_output(self, content_hash):
+        return self._built_elsewhere(content_hash, "")
+
+    def copy_output(self, key, st, content_hash, from_paths, dsts):
+        # Same options, so both lists are in the same rendition/format order.
+        dsts[0].parent.mkdir(parents=True, exist_ok=True)
+        for from_path, dst in zip(from_paths, dsts):
+            # Copy under a temp name and rename, like resizer.write_output.
+            fd, tmp = temp_output(dst)
+            os.close(fd)
+            try:
+                shutil.copyfile(from_path, tmp)
+                os.utime(tmp, (st.st_atime, st.st_mtime))
+                os.replace(tmp, dst)
+            except BaseException:
+                if os.path.exists(tmp):
+                    os.unlink(tmp)
+                raise
+        self.record(key, st, content_hash, dsts)
+
+    def commit(self):
+        self.db.commit()
+        self._pending = 0
+
+    def close(self):
+        self.commit()
+        self.db.close()
@@ -1,25 +1,31 @@
 import tkinter as tk
-from tkinter import filedialog, messagebox
-from resizer import process_images
+from tkinter import filedialog, messagebox, ttk
+from jobs import JobRunner, PAUSED, DONE, FAILED, CANCELLED, FINISHED
 from pathlib import Path
 
+# Batches run in the background; the Tk loop only polls for progress.
+runner = JobRunner(max_concurrent=1)
+current = None   # the job the progress bar and buttons follow
+
 def select_input():
     path = filedialog.askdirectory()
-    input_entry.set(path)
+    input_var.set(path)
 
 def select_output():
     path = filedialog.askdirectory()
-    output_entry.set(path)
+    output_var.set(path)
 
 def start_processing():
-    input_path = Path(input_entry.get())
-    output_path = Path(output_entry.get())
+    global current
+    input_path = Path(input_var.get())
+    output_path = Path(output_var.get())
 
     if not input_path.exists():
         messagebox.showerror("Error", "Invalid input folder")
         return
 
-    process_images(
+    # Starting again while a batch runs queues the new one behind it.
+    job = runner.submit(
         input_path, output_path,
         width=1080,
         height=None,
@@ -29,22 +35,91 @@ def start_processing():
         workers=4,
         recursive=True
     )
+    if current is None or current.state in FINISHED:
+        current = job
+
+def toggle_pause():
+    if current is None:
+        return
+    if current.state == PAUSED:
+        current.resume()
+    else:
+        current.pause()
+
+def cancel_processing():
+    if current is not None:
+        current.cancel()
+
+def describe(status):
+    text = f"Job {status['id']}: {status['state']} — {status['done']}"
+    if status["total"] is not None:
+        text += f" / {status['total']}"
+    text += f" images, {status['rate']:.1f} img/s"
+    if status["eta"] is not None:
+        text += f", ETA {int(status['eta'] // 60)}:{int(status['eta'] % 60):02d}"
+    return text
+
+def poll():
+    global current
+    if current is not None:
+        finished = None
+        for status in current.drain():
+            status_var.set(describe(status))
+            if status["total"]:
+                progress.config(mode="determinate", maximum=status["total"], value=status["done"])
+            if status["state"] in FINISHED:
+                finished = status
 
-    messagebox.showinfo("Done", "Processing Completed!")
+        pause_button.config(text="Resume" if current.state == PAUSED else "Pause")
+
+        if finished:
+            if finished["state"] == DONE:
+                s = current.summary
+                messagebox.showinfo("Done", f"Processing Completed!\n\n✔ {s.success}  ↺ {s.skipped}  "
+                                            f"⧉ {s.copied}  ✖ {s.failed}")
+            elif finished["state"] == FAILED:
+                messagebox.showerror("Error", finished["error"])
+            elif finished["state"] == CANCELLED:
+                status_var.set(f"Job {finished['id']} cancelled")
+            # Follow the next queued batch, if any.
+            queued = runner.active()
+            current = queued[0] if queued else None
+            progress.config(value=0)
+
+    root.after(200, poll)
 
 root = tk.Tk()
 root.title("Image Resizer & Optimizer")
+input_var = tk.StringVar()
+output_var = tk.StringVar()
+status_var = tk.StringVar(value="Idle")
 
 tk.Label(root, text="Input Folder").pack()
-input_entry = tk.Entry(root, width=40)
+input_entry = tk.Entry(root, width=40, textvariable=input_var)
 input_entry.pack()
 tk.Button(root, text="Browse", command=select_input).pack()
 
 tk.Label(root, text="Output Folder").pack()
-output_entry = tk.Entry(root, width=40)
+output_entry = tk.Entry(root, width=40, textvariable=output_var)
 output_entry.pack()
 tk.Button(root, text="Browse", command=select_output).pack()
 
 tk.Button(root, text="Start", command=start_processing).pack(pady=10)
 
+progress = ttk.Progressbar(root, length=300)
+progress.pack(padx=10)
+tk.Label(root, textvariable=status_var).pack()
+
+controls = tk.Frame(root)
+controls.pack(pady=10)
+pause_button = tk.Button(controls, text="Pause", command=toggle_pause)
+pause_button.pack(side=tk.LEFT, padx=5)
+tk.Button(controls, text="Cancel", command=cancel_processing).pack(side=tk.LEFT, padx=5)
+
+def on_close():
+    runner.shutdown(cancel=True)
+    root.destroy()
+
+root.protocol("WM_DELETE_WINDOW", on_close)
+root.after(200, poll)
 root.mainloop()
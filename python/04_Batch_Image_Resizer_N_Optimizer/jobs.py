@@ -0,0 +1,203 @@
+"""
+Background batch jobs for the GUI and the web UI.
+
+    runner = JobRunner(max_concurrent=1)
+    job = runner.submit("input", "output", width=1080, workers=4)
+
+    for event in job.drain():       # never blocks; call it from a UI timer
+        print(event["state"], event["done"], event["total"], event["eta"])
+
+    job.pause(); job.resume(); job.cancel()
+
+Each job runs resizer.process_images() on a background thread, which fans
+out to its own worker pool as usual. Jobs beyond `max_concurrent` wait in
+the order they were submitted.
+
+Pausing stops handing out new images; the few already in flight still
+finish. Cancelling does the same and then ends the job. Its journal stays
+in the output folder, so submit(..., resume=True) picks it up again.
+"""
+
+import concurrent.futures
+import itertools
+import queue
+import threading
+import time
+from pathlib import Path
+
+from resizer import iter_images, process_images
+
+QUEUED = "queued"
+RUNNING = "running"
+PAUSED = "paused"
+CANCELLED = "cancelled"
+DONE = "done"
+FAILED = "failed"
+FINISHED = (CANCELLED, DONE, FAILED)
+
+EVENT_INTERVAL = 0.2    # seconds between progress events while running
+
+
+class JobCancelled(Exception):
+    pass
+
+
+class Job:
+    def __init__(self, job_id, input_dir, output_dir, options):
+        self.id = job_id
+        self.input_dir = Path(input_dir)
+        self.output_dir = Path(output_dir)
+        self.options = options          # keyword arguments for process_images
+        self.state = QUEUED
+        self.done = 0
+        self.total = None               # filled in by a counting pass
+        self.started = None
+        self.finished = None
+        self.summary = None
+        self.error = None
+        self.events = queue.Queue()
+
+        self._lock = threading.Lock()   # guards state changes
+        self._cancel = threading.Event()
+        self._unpaused = threading.Event()
+        self._unpaused.set()
+        self._paused_for = 0.0
+        self._last_event = 0.0
+
+    # -- controls (any thread) ------------------------------------------
+
+    def pause(self):
+        if self.state in (QUEUED, RUNNING):
+            self._unpaused.clear()
+
+    def resume(self):
+        self._unpaused.set()
+
+    def cancel(self):
+        self._cancel.set()
+        self._unpaused.set()
+        self._set_state(CANCELLED, only_from=(QUEUED,))
+
+    # -- status ---------------------------------------------------------
+
+    def status(self):
+        elapsed = 0.0
+        if self.started is not None:
+            elapsed = (self.finished or time.monotonic()) - self.started - self._paused_for
+        rate = self.done / elapsed if elapsed > 0 else 0.0
+        eta = None
+        if rate and self.total is not None and self.state not in FINISHED:
+            eta = max(self.total - self.done, 0) / rate
+        return {
+            "id": self.id,
+            "state": self.state,
+            "done": self.done,
+            "total": self.total,
+            "elapsed": elapsed,
+            "rate": rate,
+            "eta": eta,
+            "error": self.error,
+        }
+
+    def drain(self):
+        """All events queued since the last call, without blocking."""
+        while True:
+            try:
+                yield self.events.get_nowait()
+            except queue.Empty:
+                return
+
+    # -- runner side ----------------------------------------------------
+
+    def _set_state(self, state, only_from=None):
+        """Move to `state` if the job is in one of `only_from` (any state
+        but a finished one by default). Check and change happen under one
+        lock, so cancel() and the runner can't both win; an event is sent
+        only when the state really changed. Returns whether it did."""
+        with self._lock:
+            allowed = only_from if only_from is not None else (QUEUED, RUNNING, PAUSED)
+            if self.state == state or self.state not in allowed:
+                return False
+            self.state = state
+            self._last_event = time.monotonic()
+            self.events.put(self.status())
+        return True
+
+    def _progress(self, n):
+        """process_images' progress callback: runs between images, so it is
+        where pausing blocks and cancelling unwinds the batch."""
+        if self._cancel.is_set():
+            raise JobCancelled()
+        self.done += n
+        if time.monotonic() - self._last_event >= EVENT_INTERVAL:
+            self._last_event = time.monotonic()
+            self.events.put(self.status())
+
+        if not self._unpaused.is_set():
+            paused_at = time.monotonic()
+            self._set_state(PAUSED, only_from=(RUNNING,))
+            self._unpaused.wait()
+            self._paused_for += time.monotonic() - paused_at
+            if self._cancel.is_set():
+                raise JobCancelled()
+            self._set_state(RUNNING, only_from=(PAUSED,))
+
+    def _count(self):
+        # A second, metadata-only walk; the batch itself streams discovery
+        # and never knows the total up front.
+        count = 0
+        for _ in iter_images(self.input_dir.resolve(), self.options.get("recursive", False),
+                             exclude=[self.output_dir.resolve()]):
+            if self.state in FINISHED:
+                return
+            count += 1
+        self.total = count
+
+
+class JobRunner:
+    def __init__(self, max_concurrent=1):
+        self._pool = concurrent.futures.ThreadPoolExecutor(max_concurrent, thread_name_prefix="resizer-job")
+        self._jobs = {}
+        self._ids = itertools.count(1)
+
+    def submit(self, input_dir, output_dir, **options):
+        """Queue a batch; `options` are process_images() keyword arguments."""
+        job = Job(next(self._ids), input_dir, output_dir, options)
+        self._jobs[job.id] = job
+        job.events.put(job.status())
+        self._pool.submit(self._run, job)
+        return job
+
+    def _run(self, job):
+        if not job._set_state(RUNNING, only_from=(QUEUED,)):
+            return                      # cancelled while it waited
+        job.started = time.monotonic()
+        if not (job.options.get("resume") or job.options.get("retry_failed")):
+            threading.Thread(target=job._count, daemon=True).start()
+        try:
+            job.summary = process_images(job.input_dir, job.output_dir, progress=job._progress, **job.options)
+            state = DONE
+        except JobCancelled:
+            state = CANCELLED
+        except Exception as e:
+            job.error = str(e)
+            state = FAILED
+        job.finished = time.monotonic()
+        if state == DONE and job.total is not None:
+            job.total = max(job.total, job.done)
+        job._set_state(state)
+
+    def get(self, job_id):
+        return self._jobs.get(job_id)
+
+    def jobs(self):
+        return list(self._jobs.values())
+
+    def active(self):
+        return [job for job in self._jobs.values() if job.state not in FINISHED]
+
+    def shutdown(self, cancel=True):
+        if cancel:
+            for job in self.active():
+                job.cancel()
+        self._pool.shutdown(wait=True)
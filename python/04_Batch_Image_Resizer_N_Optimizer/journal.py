@@ -0,0 +1,177 @@
+"""
+Job journal for resizer.py runs, so a run that dies can be resumed.
+
+`.resizer-journal.log` in the output folder is an append-only text file,
+one entry per line:
+
+    H\t{"options": ..., "input": ...}     header, first line of every run
+    Q\tphotos/a.jpg                       found by discovery
+    L\t12345                              discovery finished (item count)
+    D\tphotos/a.jpg                       done (built, copied or up to date)
+    F\tcannot identify image\tphotos/b.jpg failed (error first, path last)
+
+Paths are relative to the input folder. Entries are buffered and appended
+in batches (every `flush_every` entries or `flush_interval` seconds), so a
+crash loses at most one batch, and those items are simply done again.
+
+Loading only keeps the done/failed paths in memory. The queued paths are
+streamed from the file a second time, so resuming a million-file run
+starts in about a second and without rescanning the input tree.
+"""
+
+import datetime
+import json
+import time
+from pathlib import Path
+
+JOURNAL_NAME = ".resizer-journal.log"
+
+
+class JournalMismatch(Exception):
+    """The journal on disk belongs to a different input folder or options."""
+
+
+def _clean(text):
+    return " ".join(str(text).split())
+
+
+class JournalState:
+    def __init__(self, header, listed, done, failed):
+        self.header = header        # dict from the H line, or None
+        self.listed = listed        # True once discovery ran to the end
+        self.done = done            # set of relative paths
+        self.failed = failed        # {relative path: error}
+
+
+class JobJournal:
+    def __init__(self, path, flush_every=1000, flush_interval=2.0):
+        self.path = Path(path)
+        self.flush_every = flush_every
+        self.flush_interval = flush_interval
+        self._buffer = []
+        self._last_flush = time.monotonic()
+        self._file = None
+
+    # -- reading --------------------------------------------------------
+
+    def load(self):
+        """Replay the journal. Returns None if there is none."""
+        if not self.path.exists():
+            return None
+        header, listed, done, failed = None, False, set(), {}
+        with open(self.path, "r", encoding="utf-8", errors="surrogateescape") as f:
+            for line in f:
+                kind, _, rest = line.rstrip("\n").partition("\t")
+                if kind == "D":
+                    done.add(rest)
+                    failed.pop(rest, None)
+                elif kind == "F":
+                    # The error has no tabs (see record()), the path might.
+                    error, _, rel = rest.partition("\t")
+                    failed[rel] = error
+                elif kind == "L":
+                    listed = True
+                elif kind == "H":
+                    try:
+                        header = json.loads(rest)
+                    except ValueError:
+                        header = None
+        return JournalState(header, listed, done, failed)
+
+    def queued(self, skip):
+        """Stream queued paths that aren't in `skip`, each once."""
+        with open(self.path, "r", encoding="utf-8", errors="surrogateescape") as f:
+            for line in f:
+                if line.startswith("Q\t"):
+                    rel = line[2:].rstrip("\n")
+                    if rel not in skip:
+                        skip.add(rel)
+                        yield rel
+
+    # -- writing --------------------------------------------------------
+
+    def start(self, header):
+        """Begin a new journal for a fresh run."""
+        self.close()
+        self._file = open(self.path, "w", encoding="utf-8", errors="surrogateescape")
+        self._write(f"H\t{json.dumps(header)}\n")
+        self.flush()
+
+    def reopen(self):
+        """Keep appending to the existing journal (resume / retry)."""
+        self.close()
+        self._file = open(self.path, "a", encoding="utf-8", errors="surrogateescape")
+
+    def _write(self, entry):
+        self._buffer.append(entry)
+        if (len(self._buffer) >= self.flush_every
+                or time.monotonic() - self._last_flush >= self.flush_interval):
+            self.flush()
+
+    def listing(self, files, root_in):
+        """Pass `files` through, recording each as queued and the end of
+        the listing once it's exhausted."""
+        count = 0
+        for f in files:
+            rel = f.relative_to(root_in).as_posix()
+            if "\n" not in rel:
+                self._write(f"Q\t{rel}\n")
+            count += 1
+            yield f
+        self._write(f"L\t{count}\n")
+
+    def record(self, rel, error=None):
+        if "\n" in rel:
+            return
+        if error is None:
+            self._write(f"D\t{rel}\n")
+        else:
+            self._write(f"F\t{_clean(error)}\t{rel}\n")
+
+    def flush(self):
+        if self._buffer and self._file is not None:
+            self._file.write("".join(self._buffer))
+            self._file.flush()
+        self._buffer = []
+        self._last_flush = time.monotonic()
+
+    def close(self):
+        if self._file is not None:
+            self.flush()
+            self._file.close()
+            self._file = None
+
+
+def failed_from_log(log_path, root_in, day=None):
+    """
+    Sources under `root_in` that errors.log reports as failed on `day`
+    (today by default). Lines look like:
+
+        2026-10-18 12:00:00,123 -- ERROR -- /in/b.jpg → ERROR: ...
+    """
+    day = day or datetime.date.today().isoformat()
+    root_in = Path(root_in)
+    found, seen = [], set()
+    try:
+        f = open(log_path, "r", encoding="utf-8", errors="replace")
+    except OSError:
+        return found
+    with f:
+        for line in f:
+            if not line.startswith(day):
+                continue
+            _, sep, rest = line.partition(" -- ERROR -- ")
+            if not sep:
+                continue
+            src, sep, _ = rest.partition(" → ERROR: ")
+            if not sep:
+                continue
+            path = Path(src)
+            try:
+                rel = path.relative_to(root_in).as_posix()
+            except ValueError:
+                continue
+            if rel not in seen and path.is_file():
+                seen.add(rel)
+                found.append(rel)
+    return found
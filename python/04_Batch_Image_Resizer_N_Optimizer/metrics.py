@@ -0,0 +1,154 @@
+"""
+Run metrics for resizer.py.
+
+Workers already send back per-stage timings with every result, so metrics
+are collected in the parent process no matter which executor ran the job.
+Metrics.add() folds each result into:
+
+* a latency histogram per stage and one for the whole image
+* bytes read and written (and the resulting compression ratio)
+* the N slowest images with their stage breakdown
+
+and write() saves it as JSON or in the Prometheus text format (for a
+node_exporter textfile collector, or just to diff between runs).
+"""
+
+import heapq
+import json
+import time
+
+# Seconds; same spirit as the Prometheus client's defaults, one step finer.
+BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+
+class Histogram:
+    def __init__(self, buckets=BUCKETS):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)     # last one is +Inf
+        self.count = 0
+        self.sum = 0.0
+
+    def observe(self, value):
+        i = 0
+        while i < len(self.buckets) and value > self.buckets[i]:
+            i += 1
+        self.counts[i] += 1
+        self.count += 1
+        self.sum += value
+
+    def cumulative(self):
+        """[(le, count), ...] as Prometheus expects, ending with +Inf."""
+        total, out = 0, []
+        for le, n in zip(list(self.buckets) + ["+Inf"], self.counts):
+            total += n
+            out.append((le, total))
+        return out
+
+    def quantile(self, q):
+        """Upper bound of the bucket holding the q-th quantile."""
+        if not self.count:
+            return None
+        rank = q * self.count
+        for le, total in self.cumulative():
+            if total >= rank:
+                return le if le != "+Inf" else None
+        return None
+
+    def to_dict(self):
+        return {
+            "count": self.count,
+            "sum": round(self.sum, 6),
+            "p50_le": self.quantile(0.5),
+            "p99_le": self.quantile(0.99),
+            "buckets": {str(le): n for le, n in self.cumulative()},
+        }
+
+
+class Metrics:
+    def __init__(self, slowest=20):
+        self.started = time.time()
+        self.stages = {}
+        self.image = Histogram()
+        self.results = {"success": 0, "failed": 0, "skipped": 0, "copied": 0}
+        self.bytes_in = 0
+        self.bytes_out = 0
+        self.keep_slowest = slowest
+        self._slowest = []          # min-heap of (seconds, seq, file, timings)
+        self._seq = 0
+
+    def add(self, src, result):
+        ok, _, timings, info = result
+        self.results["success" if ok else "failed"] += 1
+        for name, seconds in timings.items():
+            if name not in self.stages:
+                self.stages[name] = Histogram()
+            self.stages[name].observe(seconds)
+
+        total = sum(timings.values())
+        self.image.observe(total)
+        if ok:
+            self.bytes_in += info.get("bytes_in", 0)
+            self.bytes_out += info.get("bytes_out", 0)
+
+        self._seq += 1
+        entry = (total, self._seq, str(src), timings)
+        if len(self._slowest) < self.keep_slowest:
+            heapq.heappush(self._slowest, entry)
+        elif total > self._slowest[0][0]:
+            heapq.heapreplace(self._slowest, entry)
+
+    def slowest(self):
+        return [
+            {"file": f, "seconds": round(seconds, 6),
+             "stages": {name: round(s, 6) for name, s in timings.items()}}
+            for seconds, _, f, timings in sorted(self._slowest, reverse=True)
+        ]
+
+    def to_dict(self):
+        return {
+            "wall_seconds": round(time.time() - self.started, 3),
+            "images": dict(self.results),
+            "bytes_in": self.bytes_in,
+            "bytes_out": self.bytes_out,
+            "compression_ratio": round(self.bytes_in / self.bytes_out, 4) if self.bytes_out else None,
+            "image_seconds": self.image.to_dict(),
+            "stages": {name: h.to_dict() for name, h in sorted(self.stages.items())},
+            "slowest": self.slowest(),
+        }
+
+    def to_prometheus(self):
+        lines = []
+
+        def histogram(name, help_text, hists):
+            lines.append(f"# HELP {name} {help_text}")
+            lines.append(f"# TYPE {name} histogram")
+            for labels, h in hists:
+                sep = "," if labels else ""
+                for le, n in h.cumulative():
+                    lines.append(f'{name}_bucket{{{labels}{sep}le="{le}"}} {n}')
+                suffix = f"{{{labels}}}" if labels else ""
+                lines.append(f"{name}_sum{suffix} {h.sum:.6f}")
+                lines.append(f"{name}_count{suffix} {h.count}")
+
+        histogram("resizer_stage_seconds", "Time per image spent in each pipeline stage.",
+                  [(f'stage="{name}"', h) for name, h in sorted(self.stages.items())])
+        histogram("resizer_image_seconds", "Total processing time per image.", [("", self.image)])
+
+        lines.append("# HELP resizer_images_total Images by outcome.")
+        lines.append("# TYPE resizer_images_total counter")
+        for kind, n in self.results.items():
+            lines.append(f'resizer_images_total{{result="{kind}"}} {n}')
+        lines.append("# HELP resizer_bytes_in_total Source bytes of processed images.")
+        lines.append("# TYPE resizer_bytes_in_total counter")
+        lines.append(f"resizer_bytes_in_total {self.bytes_in}")
+        lines.append("# HELP resizer_bytes_out_total Bytes written for processed images.")
+        lines.append("# TYPE resizer_bytes_out_total counter")
+        lines.append(f"resizer_bytes_out_total {self.bytes_out}")
+        return "\n".join(lines) + "\n"
+
+    def write(self, path, fmt="json"):
+        with open(path, "w", encoding="utf-8") as f:
+            if fmt == "prometheus":
+                f.write(self.to_prometheus())
+            else:
+                json.dump(self.to_dict(), f, indent=2)
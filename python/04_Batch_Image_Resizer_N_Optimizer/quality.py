@@ -0,0 +1,140 @@
+"""
+Per-image quality search for lossy outputs (JPEG, WebP).
+
+Instead of one --quality for the whole batch, pick for every image:
+
+* --target-kb N        the highest quality whose file is at most N KiB
+* --max-ssim-loss L    the lowest quality whose SSIM against the unencoded
+                       image is at least 1 - L (0.01 is hard to tell apart)
+
+With both, the SSIM choice is used unless it's over the size budget.
+
+Everything is encoded in memory. Large images are first searched on a
+probe: a mosaic of tiles cut from across the image at full resolution, so
+texture and compression artifacts look the way they will in the output.
+SSIM is judged on the probe alone. For a size target the probe gives a
+first guess (bytes grow with pixel count at the same texture) that is
+then refined on the full image within a few quality steps. The encode
+that wins the size search is returned too, so it needn't be redone.
+"""
+
+import io
+
+from PIL import Image, ImageMath
+
+QMIN, QMAX = 30, 95
+PROBE_TILE = 64            # multiple of 16, so tiles line up with JPEG MCUs
+PROBE_GRID = 4             # 4 x 4 tiles -> a 256 x 256 probe
+WINDOW = 4                 # full-size encodes refine the probe's guess ± this
+SSIM_BLOCK = 8
+C1 = (0.01 * 255) ** 2
+C2 = (0.03 * 255) ** 2
+
+# unsafe_eval replaced eval in Pillow 10.3; our expressions are constants.
+_eval = getattr(ImageMath, "unsafe_eval", None) or ImageMath.eval
+
+
+def encode(im, save_params, quality):
+    buffer = io.BytesIO()
+    im.save(buffer, **dict(save_params, quality=quality))
+    return buffer.getvalue()
+
+
+def highest_fitting(fits, lo, hi):
+    """Largest q in [lo, hi] with fits(q), for fits true up to some point."""
+    best = None
+    while lo <= hi:
+        mid = (lo + hi) // 2
+        if fits(mid):
+            best, lo = mid, mid + 1
+        else:
+            hi = mid - 1
+    return best
+
+
+def lowest_fitting(fits, lo, hi):
+    """Smallest q in [lo, hi] with fits(q), for fits true from some point on."""
+    best = None
+    while lo <= hi:
+        mid = (lo + hi) // 2
+        if fits(mid):
+            best, hi = mid, mid - 1
+        else:
+            lo = mid + 1
+    return best
+
+
+def make_probe(im):
+    tile, grid = PROBE_TILE, PROBE_GRID
+    if im.width * im.height <= 4 * (tile * grid) ** 2:
+        return im
+    probe = Image.new(im.mode, (tile * grid, tile * grid))
+    for row in range(grid):
+        for col in range(grid):
+            # Tile centres spread evenly over the image.
+            x = (im.width - tile) * (2 * col + 1) // (2 * grid)
+            y = (im.height - tile) * (2 * row + 1) // (2 * grid)
+            probe.paste(im.crop((x, y, x + tile, y + tile)), (col * tile, row * tile))
+    return probe
+
+
+def luma(im):
+    return im.convert("L").convert("F")
+
+
+def ssim(x, y):
+    """Mean SSIM of two same-size luma ("F") images over 8x8 blocks."""
+    block = max(1, min(SSIM_BLOCK, *x.size))
+    mx, my = x.reduce(block), y.reduce(block)
+    xx = _eval("a * a", a=x).reduce(block)
+    yy = _eval("b * b", b=y).reduce(block)
+    xy = _eval("a * b", a=x, b=y).reduce(block)
+
+    total, n = 0.0, 0
+    for ux, uy, sxx, syy, sxy in zip(mx.getdata(), my.getdata(), xx.getdata(), yy.getdata(), xy.getdata()):
+        vx, vy, cov = sxx - ux * ux, syy - uy * uy, sxy - ux * uy
+        total += ((2 * ux * uy + C1) * (2 * cov + C2)) / ((ux * ux + uy * uy + C1) * (vx + vy + C2))
+        n += 1
+    return total / n
+
+
+def choose_quality(im, save_params, target_kb=None, max_ssim_loss=None):
+    """Return (quality, encoded bytes at that quality or None)."""
+    probe = make_probe(im)
+    best = QMAX
+
+    if max_ssim_loss is not None:
+        reference = luma(probe)
+
+        def good_enough(q):
+            with Image.open(io.BytesIO(encode(probe, save_params, q))) as decoded:
+                return 1.0 - ssim(reference, luma(decoded)) <= max_ssim_loss
+
+        best = lowest_fitting(good_enough, QMIN, QMAX) or QMAX
+
+    if target_kb is None:
+        return best, None
+
+    target = target_kb * 1024
+    encoded = {}
+
+    def fits(q):
+        if q not in encoded:
+            encoded[q] = encode(im, save_params, q)
+        return len(encoded[q]) <= target
+
+    if probe is im:
+        chosen = highest_fitting(fits, QMIN, best)
+    else:
+        ratio = (im.width * im.height) / (probe.width * probe.height)
+        guess = highest_fitting(lambda q: len(encode(probe, save_params, q)) * ratio <= target,
+                                QMIN, best) or QMIN
+        if fits(guess):
+            chosen = highest_fitting(fits, guess, min(best, guess + WINDOW))
+        else:
+            floor = max(QMIN, guess - WINDOW)
+            chosen = highest_fitting(fits, floor, guess - 1) or highest_fitting(fits, QMIN, floor - 1)
+
+    # Nothing fits: the smallest file we are willing to make.
+    chosen = chosen or QMIN
+    return chosen, encoded.get(chosen)
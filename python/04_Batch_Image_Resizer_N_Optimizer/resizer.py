@@ -2,21 +2,58 @@ import argparse
 from pathlib import Path
 from PIL import Image, ImageOps, ImageDraw, ImageFont, PngImagePlugin
 from tqdm import tqdm
-import io
 import os
+import math
+import time
 import logging
 import concurrent.futures
+import cProfile
+import functools
+import pstats
+from contextlib import contextmanager
+from cache import BuildCache, options_key, temp_output
+from journal import JOURNAL_NAME, JobJournal, JournalMismatch, failed_from_log
+from quality import choose_quality
+from metrics import Metrics
 import piexif  # for safe EXIF handling (install via pip install piexif)
 
 
 IMAGE_EXTS = {".jpg", ".jpeg", ".png", ".webp", ".tiff", ".bmp", ".gif"}
+OUTPUT_FORMATS = ("jpg", "jpeg", "png", "webp")
+STAGES = ("decode", "resize", "orient", "watermark", "search", "encode", "write")
+
+# Decode JPEGs (via DCT scaling) and pre-shrink others (via Image.reduce)
+# to no less than this multiple of the final size, then finish with LANCZOS.
+# 2.0 matches what Image.thumbnail does, so output quality is unchanged.
+REDUCING_GAP = 2.0
+
+# EXIF orientations that swap width and height.
+TRANSPOSED_ORIENTATIONS = {5, 6, 7, 8}
+
+ERROR_LOG = "errors.log"
 
 logging.basicConfig(
-    filename="errors.log",
+    filename=ERROR_LOG,
     level=logging.ERROR,
     format="%(asctime)s -- %(levelname)s -- %(message)s"
 )
 
+def parse_sizes(text):
+    try:
+        sizes = [int(part) for part in text.split(",") if part.strip()]
+    except ValueError:
+        raise argparse.ArgumentTypeError(f"invalid sizes: {text!r}")
+    if not sizes or min(sizes) <= 0:
+        raise argparse.ArgumentTypeError(f"invalid sizes: {text!r}")
+    return sizes
+
+def parse_formats(text):
+    formats = [part.strip().lower() for part in text.split(",") if part.strip()]
+    for fmt in formats:
+        if fmt not in OUTPUT_FORMATS:
+            raise argparse.ArgumentTypeError(f"unsupported format {fmt!r} (choose from {', '.join(OUTPUT_FORMATS)})")
+    return formats or None
+
 def parse_args():
     p = argparse.ArgumentParser(description="Advanced Image Resizer & Optimizer")
     p.add_argument("-i", "--input", required=True)
@@ -24,181 +61,773 @@ def parse_args():
 
     p.add_argument("--width", type=int)
     p.add_argument("--height", type=int)
+    p.add_argument("--sizes", type=parse_sizes, default=None,
+                   help="Comma-separated widths, e.g. 320,640,1080 (one decode per image; overrides --width/--height)")
 
     p.add_argument("--quality", type=int, default=85)
+    p.add_argument("--target-kb", type=float, default=None,
+                   help="Pick the JPEG/WebP quality per image: highest that fits in this many KiB")
+    p.add_argument("--max-ssim-loss", type=float, default=None,
+                   help="Pick the JPEG/WebP quality per image: lowest with SSIM >= 1 - this (e.g. 0.01)")
     p.add_argument("--watermark", type=str, default=None)
     p.add_argument("--preserve-exif", action="store_true")
     p.add_argument("--recursive", action="store_true")
     p.add_argument("--workers", type=int, default=1)
+    p.add_argument("--executor", choices=["thread", "process", "auto"], default="auto",
+                   help="Worker pool for --workers > 1 (auto: processes on multi-core machines)")
+    p.add_argument("--chunksize", type=int, default=8,
+                   help="Images handed to a process worker at a time")
     p.add_argument("--overwrite", action="store_true")
-
-    p.add_argument("--format", type=str, choices=["jpg", "jpeg", "png", "webp"],
-                  help="Force output format")
+    p.add_argument("--fsync", action="store_true",
+                   help="fsync every output before renaming it into place (slower, survives power loss)")
+    p.add_argument("--metrics", metavar="FILE",
+                   help="Write run metrics (stage histograms, bytes, slowest files) to FILE")
+    p.add_argument("--metrics-format", choices=["json", "prometheus"], default="json")
+    p.add_argument("--profile", metavar="DIR",
+                   help="Run workers under cProfile and merge their stats into DIR/merged.prof")
+    resume = p.add_mutually_exclusive_group()
+    resume.add_argument("--resume", action="store_true",
+                        help="Continue an interrupted run from the job journal in the output folder")
+    resume.add_argument("--retry-failed", action="store_true",
+                        help="Only redo images that failed (per the journal and today's errors.log)")
+    p.add_argument("--no-journal", action="store_true",
+                   help="Don't keep a job journal in the output folder")
+    p.add_argument("--no-cache", action="store_true",
+                   help="Don't use/update the incremental build cache in the output folder")
+
+    p.add_argument("--format", type=parse_formats, default=None,
+                  help="Force output format(s), comma-separated: jpg, jpeg, png, webp")
 
     return p.parse_args()
 
+def _scan_dir(folder, exclude):
+    files, dirs = [], []
+    try:
+        with os.scandir(folder) as it:
+            for entry in it:
+                if entry.is_dir(follow_symlinks=False):
+                    if entry.path not in exclude:
+                        dirs.append(entry.path)
+                elif os.path.splitext(entry.name)[1].lower() in IMAGE_EXTS:
+                    files.append(Path(entry.path))
+    except OSError as e:
+        logging.error(f"{folder} → ERROR: {e}")
+    files.sort()
+    return files, dirs
+
+def iter_images(root: Path, recursive: bool, exclude=(), workers=8):
+    """
+    Yield image paths as they are found instead of listing the whole tree
+    first. Subfolders are scanned in parallel with os.scandir; folders in
+    `exclude` (e.g. an output folder inside the input) are not entered.
+    """
+    exclude = {str(p) for p in exclude}
+    if not recursive:
+        yield from _scan_dir(root, exclude)[0]
+        return
+
+    with concurrent.futures.ThreadPoolExecutor(workers) as ex:
+        pending = {ex.submit(_scan_dir, root, exclude)}
+        while pending:
+            done, pending = concurrent.futures.wait(pending, return_when=concurrent.futures.FIRST_COMPLETED)
+            for fut in done:
+                files, dirs = fut.result()
+                for d in dirs:
+                    pending.add(ex.submit(_scan_dir, d, exclude))
+                yield from files
+
 def gather_images(root: Path, recursive: bool):
-    if recursive:
-        return [p for p in root.rglob("*") if p.suffix.lower() in IMAGE_EXTS]
-    return [p for p in root.iterdir() if p.suffix.lower() in IMAGE_EXTS]
+    return list(iter_images(root, recursive))
 
-def resize_image(im: Image.Image, target_w, target_h):
+def _round_aspect(number, key):
+    return max(min(math.floor(number), math.ceil(number), key=key), 1)
+
+def target_size(size, target_w, target_h):
+    """The size resize_image() produces: fit inside the box, keep the aspect
+    ratio, never upscale (same rounding as Image.thumbnail)."""
+    w, h = size
     if not target_w and not target_h:
-        return im
+        return size
 
     if target_w and not target_h:
-        scale = target_w / im.width
-        target_h = int(im.height * scale)
+        target_h = max(1, int(h * target_w / w))
     elif target_h and not target_w:
-        scale = target_h / im.height
-        target_w = int(im.width * scale)
-
-    img = im.copy()
-    img.thumbnail((target_w, target_h), Image.LANCZOS)
-    return img
+        target_w = max(1, int(w * target_h / h))
 
-def apply_watermark(im, text):
-    if not text:
-        return im
+    x, y = math.floor(target_w), math.floor(target_h)
+    if x >= w and y >= h:
+        return size
 
-    if im.mode != "RGBA":
-        base = im.convert("RGBA")
+    aspect = w / h
+    if x / y >= aspect:
+        x = _round_aspect(y * aspect, key=lambda n: abs(aspect - n / y))
     else:
-        base = im.copy()
+        y = _round_aspect(x / aspect, key=lambda n: 0 if n == 0 else abs(aspect - x / n))
+    return (x, y)
 
-    txt_layer = Image.new("RGBA", base.size, (255, 255, 255, 0))
-    draw = ImageDraw.Draw(txt_layer)
+def resize_image(im: Image.Image, target_w, target_h):
+    size = target_size(im.size, target_w, target_h)
+    if size == im.size:
+        return im
+    # resize() returns a new image, so no defensive copy of the full-size
+    # source is needed; reducing_gap lets it shrink by an integer factor
+    # first and run LANCZOS on the smaller image.
+    return im.resize(size, Image.LANCZOS, reducing_gap=REDUCING_GAP)
 
-    fontsize = max(16, base.size[0] // 30)
+def exif_orientation(im):
     try:
-        font = ImageFont.truetype("arial.ttf", fontsize)
-    except:
-        font = ImageFont.load_default()
-
-    tw, th = draw.textsize(text, font=font)
+        return im.getexif().get(0x0112, 1)
+    except Exception:
+        return 1
+
+def prepare_decode(im, target_w, target_h):
+    """
+    Ask the JPEG decoder for a DCT-scaled (1/2, 1/4, 1/8) image that is still
+    at least REDUCING_GAP times the final size. Must run before load().
+    `target_w`/`target_h` are in stored (pre-rotation) orientation.
+    """
+    if im.format != "JPEG" or not (target_w or target_h):
+        return
+    w, h = target_size(im.size, target_w, target_h)
+    if (w, h) == im.size:
+        return
+    im.draft(None, (math.ceil(w * REDUCING_GAP), math.ceil(h * REDUCING_GAP)))
 
-    x = base.width - tw - 20
-    y = base.height - th - 20
+@functools.lru_cache(maxsize=None)
+def load_font(fontsize):
+    try:
+        return ImageFont.truetype("arial.ttf", fontsize)
+    except OSError:
+        return ImageFont.load_default()
+
+@functools.lru_cache(maxsize=64)
+def watermark_overlay(text, fontsize):
+    """
+    The watermark box as a small RGBA patch, rendered once per (text, font
+    size). The font size follows the image width, so images of similar
+    width share one patch.
+    """
+    font = load_font(fontsize)
+    _, _, tw, th = ImageDraw.Draw(Image.new("RGBA", (1, 1))).textbbox((0, 0), text, font=font)
+    patch = Image.new("RGBA", (tw + 11, th + 11), (0, 0, 0, 128))
+    ImageDraw.Draw(patch).text((5, 5), text, fill=(255, 255, 255, 200), font=font)
+    return patch
+
+def apply_watermark(im, text, inplace=False):
+    """
+    Stamp `text` in the bottom-right corner. Only that corner is composited;
+    with `inplace` an RGB/RGBA image is modified instead of copied.
+    """
+    if not text:
+        return im
 
-    draw.rectangle((x - 5, y - 5, x + tw + 5, y + th + 5), fill=(0, 0, 0, 128))
-    draw.text((x, y), text, fill=(255, 255, 255, 200), font=font)
+    patch = watermark_overlay(text, max(16, im.width // 30))
+    # Same placement as before: text 20px from the corner, 5px padding.
+    x = im.width - patch.width - 14
+    y = im.height - patch.height - 14
+    if x < 0 or y < 0:
+        patch = patch.crop((max(0, -x), max(0, -y), patch.width, patch.height))
+        x, y = max(0, x), max(0, y)
+
+    if im.mode == "RGB":
+        out = im if inplace else im.copy()
+        out.paste(patch, (x, y), patch)
+        return out
+    if im.mode == "RGBA":
+        out = im if inplace else im.copy()
+        out.alpha_composite(patch, (x, y))
+        return out
+
+    base = im.convert("RGBA")
+    base.alpha_composite(patch, (x, y))
+    return base.convert(im.mode)
+
+@contextmanager
+def stage(timings, name):
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        timings[name] = timings.get(name, 0.0) + time.perf_counter() - start
+
+def renditions(options):
+    """
+    [(label, width, height), ...] largest first. With `sizes` every entry is
+    a target width and gets a `-<width>w` suffix; otherwise there is one
+    unlabelled rendition for --width/--height.
+    """
+    sizes = options.get("sizes")
+    if not sizes:
+        return [(None, options["width"], options["height"])]
+    return [(size, size, None) for size in sorted(set(sizes), reverse=True)]
+
+def output_formats(src, options):
+    fmt = options.get("format")
+    if not fmt:
+        return [src.suffix[1:]]
+    return [fmt] if isinstance(fmt, str) else list(fmt)
+
+def rendition_path(src, root_in, root_out, label, ext):
+    out = root_out / src.relative_to(root_in)
+    stem = out.stem if label is None else f"{out.stem}-{label}w"
+    return out.with_name(f"{stem}.{ext}")
+
+def output_paths(src, root_in, root_out, options):
+    """Every file process_one() writes for `src`: renditions x formats."""
+    return [rendition_path(src, root_in, root_out, label, ext)
+            for label, _, _ in renditions(options)
+            for ext in output_formats(src, options)]
+
+def save_params_for(ext, options, exif=None, png_info=None):
+    save_params = {}
+    if ext.lower() in ["jpg", "jpeg"]:
+        save_params.update({
+            "format": "JPEG",
+            "quality": options["quality"],
+            "optimize": True,
+        })
+        if exif:
+            save_params["exif"] = exif
+
+    elif ext.lower() == "png":
+        save_params["format"] = "PNG"
+        if png_info:
+            save_params["pnginfo"] = PngImagePlugin.PngInfo()
+
+    elif ext.lower() == "webp":
+        save_params.update({
+            "format": "WEBP",
+            "quality": options["quality"],
+        })
+    else:
+        save_params["format"] = ext.upper()
+    return save_params
 
-    return Image.alpha_composite(base, txt_layer).convert(im.mode)
+def fsync_dir(folder):
+    # Makes a rename durable on POSIX; directories can't be opened on Windows.
+    try:
+        fd = os.open(folder, os.O_RDONLY)
+    except OSError:
+        return
+    try:
+        os.fsync(fd)
+    finally:
+        os.close(fd)
+
+def encodable(im, save_params):
+    if save_params["format"] == "JPEG" and im.mode not in ("RGB", "L", "CMYK"):
+        # e.g. a transparent PNG also requested as JPEG
+        return im.convert("RGB")
+    return im
+
+def write_output(im, dst: Path, save_params, fsync=False, timings=None, data=None):
+    """
+    Encode straight into a temp file next to `dst`, then rename it into
+    place, so `dst` is either complete or absent, never truncated.
+    `data` is an encoding of `im` that already exists (from the quality
+    search) and is written as is. Returns the number of bytes written.
+    """
+    timings = {} if timings is None else timings
+    fd, tmp = temp_output(dst)
+    try:
+        with os.fdopen(fd, "wb") as f:
+            if data is not None:
+                with stage(timings, "write"):
+                    f.write(data)
+            else:
+                with stage(timings, "encode"):
+                    encodable(im, save_params).save(f, **save_params)
+            size = f.tell()
+            with stage(timings, "write"):
+                if fsync:
+                    f.flush()
+                    os.fsync(f.fileno())
+        with stage(timings, "write"):
+            os.replace(tmp, dst)
+            if fsync:
+                fsync_dir(dst.parent)
+    except BaseException:
+        try:
+            os.unlink(tmp)
+        except OSError:
+            pass
+        raise
+    return size
+
+def quality_search(options):
+    return options.get("target_kb") is not None or options.get("max_ssim_loss") is not None
+
+def rendition_key(label, ext):
+    return f"{label or ''}:{ext.lower()}"
 
 def process_one(job):
+    """
+    Process one image into all of its renditions and formats, decoding it
+    once. Returns (ok, error_or_None, per-stage seconds, info). `info` has
+    bytes_in/bytes_out and `qualities`, mapping rendition_key() to the
+    quality a search picked. Qualities already known for this source come
+    in options["qualities"].
+    """
     src, root_in, root_out, options = job
+    timings = {}
+    chosen = {}
+    info = {"qualities": chosen, "bytes_in": 0, "bytes_out": 0}
 
-    rel = src.relative_to(root_in)
-    ext = options["format"] if options["format"] else src.suffix[1:]
-    dst = (root_out / rel).with_suffix("." + ext)
-
-    dst.parent.mkdir(parents=True, exist_ok=True)
+    plan = renditions(options)
+    formats = output_formats(src, options)
+    outputs = output_paths(src, root_in, root_out, options)
+    outputs[0].parent.mkdir(parents=True, exist_ok=True)
 
-    if dst.exists() and not options["overwrite"]:
-        return False, "exists"
+    if not options["overwrite"] and all(dst.exists() for dst in outputs):
+        return False, "exists", timings, info
 
     try:
         with Image.open(src) as im:
-            # Fix orientation
-            im = ImageOps.exif_transpose(im)
-
-            # Extract EXIF safely
-            exif_original = None
-            if options["preserve_exif"] and "exif" in im.info:
-                exif_original = im.info["exif"]
+            # Work in the file's stored orientation until after the first
+            # resize, so a rotated photo's target box has to be swapped.
+            orientation = exif_orientation(im)
+            _, target_w, target_h = plan[0]
+            if orientation in TRANSPOSED_ORIENTATIONS:
+                target_w, target_h = target_h, target_w
+
+            with stage(timings, "decode"):
+                # Decode only as much as the largest rendition needs.
+                prepare_decode(im, target_w, target_h)
+                im.load()
 
             # Extract PNG metadata if PNG
             png_info = None
             if src.suffix.lower() == ".png":
                 png_info = im.info  # preserves ICC profile, gamma, etc
 
-            # Resize
-            im2 = resize_image(im, options["width"], options["height"])
-
-            # Watermark
-            if options["watermark"]:
-                im2 = apply_watermark(im2, options["watermark"])
-
-            # Save safely
-            buffer = io.BytesIO()
-
-            save_params = {}
-            if ext.lower() in ["jpg", "jpeg"]:
-                save_params.update({
-                    "format": "JPEG",
-                    "quality": options["quality"],
-                    "optimize": True,
-                })
-                if exif_original:
-                    save_params["exif"] = exif_original
-
-            elif ext.lower() == "png":
-                save_params["format"] = "PNG"
-                if png_info:
-                    save_params["pnginfo"] = PngImagePlugin.PngInfo()
-
-            elif ext.lower() == "webp":
-                save_params.update({
-                    "format": "WEBP",
-                    "quality": options["quality"],
-                })
-            else:
-                save_params["format"] = ext.upper()
-
-            im2.save(buffer, **save_params)
-
-            buffer.seek(0)
-            with open(dst, "wb") as f:
-                f.write(buffer.read())
+            current = im
+            exif_original = None
+            for i, (label, width, height) in enumerate(plan):
+                # Each rendition is downscaled from the previous (larger)
+                # one, never from the full-size source again.
+                with stage(timings, "resize"):
+                    if i == 0:
+                        current = resize_image(im, target_w, target_h)
+                    else:
+                        current = resize_image(current, width, height)
+
+                if i == 0:
+                    # Fix orientation once, on the largest rendition
+                    if orientation != 1:
+                        with stage(timings, "orient"):
+                            current = ImageOps.exif_transpose(current)
+
+                    # Extract EXIF safely (after transpose, so Orientation is reset)
+                    if options["preserve_exif"] and "exif" in current.info:
+                        exif_original = current.info["exif"]
+
+                # Watermark a copy, so smaller renditions come from clean
+                # pixels; the last one can be stamped in place.
+                out = current
+                if options["watermark"]:
+                    with stage(timings, "watermark"):
+                        out = apply_watermark(current, options["watermark"], inplace=i == len(plan) - 1)
+
+                for ext in formats:
+                    dst = rendition_path(src, root_in, root_out, label, ext)
+                    if dst.exists() and not options["overwrite"]:
+                        continue
+
+                    save_params = save_params_for(ext, options, exif_original, png_info)
+                    data = None
+                    if "quality" in save_params and quality_search(options):
+                        key = rendition_key(label, ext)
+                        quality = options.get("qualities", {}).get(key)
+                        if quality is None:
+                            with stage(timings, "search"):
+                                quality, data = choose_quality(encodable(out, save_params), save_params,
+                                                               options.get("target_kb"),
+                                                               options.get("max_ssim_loss"))
+                            chosen[key] = quality
+                        save_params["quality"] = quality
+
+                    info["bytes_out"] += write_output(out, dst, save_params, options.get("fsync", False),
+                                                      timings, data)
 
         # Copy timestamps
         st = src.stat()
-        os.utime(dst, (st.st_atime, st.st_mtime))
+        for dst in outputs:
+            os.utime(dst, (st.st_atime, st.st_mtime))
+        info["bytes_in"] = st.st_size
 
-        return True, None
+        return True, None, timings, info
 
     except Exception as e:
         logging.error(f"{src} → ERROR: {e}")
-        return False, str(e)
-def main():
-    args = parse_args()
-
-    root_in = Path(args.input).resolve()
-    root_out = Path(args.output).resolve()
-    root_out.mkdir(parents=True, exist_ok=True)
-
-    files = gather_images(root_in, args.recursive)
+        return False, str(e), timings, info
+
+def resolve_executor(kind, workers):
+    if workers <= 1:
+        return "serial"
+    if kind == "auto":
+        # Decode, LANCZOS and JPEG optimize are CPU-bound and partly hold the
+        # GIL, so real cores only get used with separate processes.
+        return "process" if (os.cpu_count() or 1) > 1 else "thread"
+    return kind
+
+_profiler = None
+
+def process_chunk(jobs):
+    profile_dir = jobs[0][3].get("profile") if jobs else None
+    if not profile_dir:
+        return [process_one(job) for job in jobs]
+
+    # One profiler per worker process, dumped after every chunk: pool
+    # workers are shut down without a hook we could dump from.
+    global _profiler
+    if _profiler is None:
+        _profiler = cProfile.Profile()
+    _profiler.enable()
+    try:
+        return [process_one(job) for job in jobs]
+    finally:
+        _profiler.disable()
+        _profiler.dump_stats(os.path.join(profile_dir, f"worker-{os.getpid()}.prof"))
+
+def merge_profiles(profile_dir):
+    """Combine every worker's dump into profile_dir/merged.prof."""
+    files = sorted(str(f) for f in Path(profile_dir).glob("worker-*.prof"))
     if not files:
-        print("No images found.")
+        return None
+    merged = Path(profile_dir) / "merged.prof"
+    pstats.Stats(*files).dump_stats(merged)
+    return merged
+
+def chunked(items, size):
+    chunk = []
+    for item in items:
+        chunk.append(item)
+        if len(chunk) == size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+def run_jobs(jobs, executor="auto", workers=1, chunksize=8, window=None):
+    """
+    Yield (job, result) pairs as jobs finish. `jobs` may be a lazy generator:
+    at most `window` tasks (default 4 per worker) are in flight at once, so
+    memory stays flat however many images there are.
+    """
+    kind = resolve_executor(executor, workers)
+    if kind == "serial":
+        for job in jobs:
+            yield job, process_chunk([job])[0]
         return
 
+    if kind == "thread":
+        pool = concurrent.futures.ThreadPoolExecutor(workers)
+        tasks = ([job] for job in jobs)
+    else:
+        # Jobs are only paths and the options dict, so they pickle cheaply;
+        # sending them in chunks cuts per-task IPC.
+        pool = concurrent.futures.ProcessPoolExecutor(workers)
+        tasks = chunked(jobs, chunksize)
+
+    window = window or workers * 4
+    with pool:
+        in_flight = {}
+        for task in tasks:
+            if len(in_flight) >= window:
+                done, _ = concurrent.futures.wait(in_flight, return_when=concurrent.futures.FIRST_COMPLETED)
+                for fut in done:
+                    yield from zip(in_flight.pop(fut), fut.result())
+            in_flight[pool.submit(process_chunk, task)] = task
+        for fut in concurrent.futures.as_completed(in_flight):
+            yield from zip(in_flight[fut], fut.result())
+
+class Summary:
+    """Running totals for a batch, updated one result at a time."""
+
+    def __init__(self):
+        self.success = 0
+        self.failed = 0
+        self.skipped = 0
+        self.copied = 0
+        self.stage_totals = {}
+        self.metrics = Metrics()
+
+    def add(self, result, src=None):
+        ok, _, timings = result[:3]
+        if ok:
+            self.success += 1
+        else:
+            self.failed += 1
+        for name, seconds in timings.items():
+            self.stage_totals[name] = self.stage_totals.get(name, 0.0) + seconds
+        self.metrics.add(src, result)
+
+    def write_metrics(self, path, fmt="json"):
+        self.metrics.results.update(skipped=self.skipped, copied=self.copied)
+        self.metrics.write(path, fmt)
+
+def print_stage_report(stage_totals, processed):
+    if not processed:
+        return
+    total = sum(stage_totals.values()) or 1.0
+    print("\nPer-stage time (summed over workers):")
+    for name in STAGES:
+        seconds = stage_totals.get(name, 0.0)
+        print(f"  {name:<10} {seconds:8.2f}s  {seconds / processed * 1000:8.1f} ms/img  {seconds / total:6.1%}")
+
+def run_batch(root_in: Path, root_out: Path, options, recursive=False, executor="auto",
+              workers=1, chunksize=8, use_cache=True, progress=None, files=None, journal=None):
+    """
+    Stream a whole folder through the pipeline: discovery, cache planning
+    and processing are chained generators, so the first image starts right
+    away and nothing is ever held per-file for the whole run.
+    `progress(n)` is called as images are accounted for. `files` replaces
+    discovery (resume / retry); every outcome is recorded in `journal`.
+    """
+    root_out.mkdir(parents=True, exist_ok=True)
+    summary = Summary()
+    tick = progress or (lambda n: None)
+
+    def finished(f, result=None):
+        if journal is not None:
+            error = None if result is None or result[0] or result[1] == "exists" else result[1]
+            journal.record(f.relative_to(root_in).as_posix(), error)
+        tick(1)
+
+    if files is None:
+        files = iter_images(root_in, recursive, exclude=[root_out])
+        if journal is not None:
+            files = journal.listing(files, root_in)
+
+    if not use_cache:
+        jobs = ((f, root_in, root_out, options) for f in files)
+        for job, result in run_jobs(jobs, executor, workers, chunksize):
+            summary.add(result, job[0])
+            finished(job[0], result)
+        return summary
+
+    cache = BuildCache(root_out, options)
+    # The cache decides what is stale, so rebuilds must replace outputs.
+    rebuild_options = dict(options, overwrite=True)
+    building = {}     # src -> (key, dst, st, hash), only for jobs in flight
+    waiting = {}      # hash -> duplicates of a job in flight
+
+    def job_for(f, content_hash):
+        if not quality_search(options):
+            return (f, root_in, root_out, rebuild_options)
+        # Same content, same options: reuse the qualities searched before.
+        return (f, root_in, root_out, dict(rebuild_options, qualities=cache.qualities(content_hash)))
+
+    def planned_jobs():
+        items = ((f.relative_to(root_in).as_posix(), f, dsts, (f, dsts))
+                 for f in files
+                 for dsts in [output_paths(f, root_in, root_out, options)])
+        for (f, dsts), action, info in cache.plan(items, overwrite=options["overwrite"]):
+            key = f.relative_to(root_in).as_posix()
+            if action == "fresh":
+                summary.skipped += 1
+                finished(f)
+            elif action == "copy":
+                st, content_hash, from_path = info
+                cache.copy_output(key, st, content_hash, from_path, dsts)
+                summary.copied += 1
+                finished(f)
+            elif action == "wait":
+                waiting.setdefault(info[1], []).append((key, f, dsts, info))
+            else:
+                building[f] = (key, dsts) + info
+                yield job_for(f, info[1])
+
+    def settle_duplicates(content_hash):
+        # Duplicates of an image that just finished: copy its output, or
+        # build them normally if it failed.
+        for key, f, dsts, (st, _) in waiting.pop(content_hash, []):
+            from_path = cache.find_output(content_hash)
+            if from_path is not None:
+                cache.copy_output(key, st, content_hash, from_path, dsts)
+                summary.copied += 1
+                finished(f)
+            else:
+                result = process_one(job_for(f, content_hash))
+                summary.add(result, f)
+                if result[0]:
+                    cache.record(key, st, content_hash, dsts)
+                    cache.record_qualities(content_hash, result[3]["qualities"])
+                finished(f, result)
+
+    try:
+        for job, result in run_jobs(planned_jobs(), executor, workers, chunksize):
+            key, dsts, st, content_hash = building.pop(job[0])
+            summary.add(result, job[0])
+            if result[0]:
+                cache.record(key, st, content_hash, dsts)
+                cache.record_qualities(content_hash, result[3]["qualities"])
+            finished(job[0], result)
+            cache.finished(content_hash)
+            settle_duplicates(content_hash)
+    finally:
+        cache.close()
+    return summary
+
+def journal_files(journal, root_in, root_out, options, recursive, resume=False, retry_failed=False):
+    """
+    Get `journal` ready for this run and return the images to process, or
+    None to discover them as usual.
+    """
+    header = {"input": str(root_in), "options": options_key(options), "recursive": recursive}
+    state = journal.load() if (resume or retry_failed) else None
+    if state is not None and state.header and any(state.header.get(k) != header[k] for k in header):
+        raise JournalMismatch(f"{journal.path} is from a run with a different input folder or options; "
+                         "run again without --resume/--retry-failed")
+
+    if retry_failed:
+        rels = dict.fromkeys(state.failed if state else ())
+        rels.update(dict.fromkeys(failed_from_log(ERROR_LOG, root_in)))
+        print(f"[JOURNAL] Retrying {len(rels)} failed image(s)")
+        if state is not None:
+            journal.reopen()
+        else:
+            journal.start(header)
+        return [f for f in (root_in / rel for rel in rels) if f.is_file()]
+
+    if state is None:
+        if resume:
+            print("[JOURNAL] Nothing to resume, starting a fresh run")
+        journal.start(header)
+        return None
+
+    print(f"[JOURNAL] Resuming: {len(state.done)} done, {len(state.failed)} failed earlier "
+          f"(--retry-failed to redo those)")
+    skip = state.done | set(state.failed)
+    journal.reopen()
+    if state.listed:
+        # The work list is complete: no rescan, just what's left of it.
+        return (f for f in (root_in / rel for rel in journal.queued(skip)) if f.is_file())
+    # Discovery never finished, so rescan, passing over what's accounted for.
+    found = iter_images(root_in, recursive, exclude=[root_out])
+    return journal.listing((f for f in found if f.relative_to(root_in).as_posix() not in skip), root_in)
+
+def process_images(input_dir, output_dir, width=None, height=None, quality=85, format=None,
+                   watermark=None, workers=1, recursive=False, sizes=None, preserve_exif=False,
+                   overwrite=False, executor="auto", chunksize=8, use_cache=True, progress=None,
+                   fsync=False, target_kb=None, max_ssim_loss=None, profile=None,
+                   journal=True, resume=False, retry_failed=False):
+    """
+    Library entry point used by the CLI, gui.py and web_ui.py. `sizes` is a
+    list of widths to render in one pass; `format` is one format or a list.
+    With `profile` (a folder) every worker is run under cProfile and the
+    dumps are merged into <profile>/merged.prof. Unless `journal` is False
+    the run is journalled in the output folder; `resume` continues an
+    interrupted run and `retry_failed` redoes only the images that failed.
+    Returns the run's Summary.
+    """
     options = {
-        "width": args.width,
-        "height": args.height,
-        "quality": args.quality,
-        "watermark": args.watermark,
-        "preserve_exif": args.preserve_exif,
-        "format": args.format,
-        "overwrite": args.overwrite
+        "width": width,
+        "height": height,
+        "sizes": sizes,
+        "quality": quality,
+        "watermark": watermark,
+        "preserve_exif": preserve_exif,
+        "format": format,
+        "overwrite": overwrite,
+        "fsync": fsync,
+        "target_kb": target_kb,
+        "max_ssim_loss": max_ssim_loss,
     }
 
-    jobs = [(f, root_in, root_out, options) for f in files]
+    profiler = None
+    if profile:
+        profile = Path(profile).resolve()
+        profile.mkdir(parents=True, exist_ok=True)
+        for old in profile.glob("worker-*.prof"):
+            old.unlink()
+        kind = resolve_executor(executor, workers)
+        if kind == "serial":
+            # Everything runs in this process: profile the whole run once
+            # and dump once, instead of after every one-image chunk.
+            profiler = cProfile.Profile()
+        else:
+            options["profile"] = str(profile)
+        if kind == "thread":
+            # cProfile only sees the thread that enabled it.
+            print("[PROFILE] Using process workers instead of threads")
+            executor = "process"
+
+    root_in, root_out = Path(input_dir).resolve(), Path(output_dir).resolve()
+    root_out.mkdir(parents=True, exist_ok=True)
+    jobs_journal, files = None, None
+    if journal or resume or retry_failed:
+        jobs_journal = JobJournal(root_out / JOURNAL_NAME)
+        files = journal_files(jobs_journal, root_in, root_out, options, recursive, resume, retry_failed)
 
-    if args.workers > 1:
-        with concurrent.futures.ThreadPoolExecutor(args.workers) as ex:
-            results = list(tqdm(ex.map(process_one, jobs), total=len(jobs)))
-    else:
-        results = []
-        for j in tqdm(jobs):
-            results.append(process_one(j))
+    if profiler is not None:
+        profiler.enable()
+    try:
+        summary = run_batch(root_in, root_out, options, recursive, executor, workers, chunksize,
+                            use_cache, progress, files, jobs_journal)
+    finally:
+        if profiler is not None:
+            profiler.disable()
+            profiler.dump_stats(profile / f"worker-{os.getpid()}.prof")
+        if jobs_journal is not None:
+            jobs_journal.close()
+    summary.profile = merge_profiles(profile) if profile else None
+    return summary
 
-    success = sum(1 for r,_ in results if r)
-    failed  = sum(1 for r,_ in results if not r)
+def main():
+    args = parse_args()
+
+    bar = tqdm(unit="img")
+    try:
+        summary = process_images(
+            args.input, args.output,
+            width=args.width,
+            height=args.height,
+            quality=args.quality,
+            format=args.format,
+            watermark=args.watermark,
+            workers=args.workers,
+            recursive=args.recursive,
+            sizes=args.sizes,
+            preserve_exif=args.preserve_exif,
+            overwrite=args.overwrite,
+            executor=args.executor,
+            chunksize=args.chunksize,
+            use_cache=not args.no_cache,
+            progress=bar.update,
+            fsync=args.fsync,
+            target_kb=args.target_kb,
+            max_ssim_loss=args.max_ssim_loss,
+            profile=args.profile,
+            journal=not args.no_journal,
+            resume=args.resume,
+            retry_failed=args.retry_failed,
+        )
+    except JournalMismatch as e:
+        print(f"\n[JOURNAL] {e}")
+        return
+    finally:
+        bar.close()
+
+    if not (summary.success or summary.failed or summary.skipped or summary.copied):
+        print("No images found.")
+        return
 
     print("\nCompleted.")
-    print(f"✔ Success: {success}")
-    print(f"✖ Failed: {failed}")
+    print(f"✔ Success: {summary.success}")
+    if not args.no_cache:
+        print(f"↺ Up to date: {summary.skipped}")
+        print(f"⧉ Copied duplicates: {summary.copied}")
+    print(f"✖ Failed: {summary.failed}")
     print("→ See errors.log for details")
+    print_stage_report(summary.stage_totals, summary.success)
+
+    if args.metrics:
+        summary.write_metrics(args.metrics, args.metrics_format)
+        print(f"\n[METRICS] Written to {args.metrics}")
+    if summary.profile:
+        print(f"\n[PROFILE] Merged worker profiles into {summary.profile}")
+        pstats.Stats(str(summary.profile)).sort_stats("tottime").print_stats(15)
 
 
 if __name__ == "__main__":
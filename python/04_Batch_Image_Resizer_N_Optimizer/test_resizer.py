@@ -18,3 +18,222 @@ def test_watermark():
     img = Image.new("RGB", (800, 600))
     out = apply_watermark(img, "Test Watermark")
     assert out.size == img.size
+
+def test_cache_key_ignores_runtime_options():
+    from cache import options_key
+    base = {"width": 1080, "height": None, "quality": 85, "format": None,
+            "watermark": None, "preserve_exif": False, "overwrite": False}
+    assert options_key(base) == options_key(dict(base, overwrite=True))
+    assert options_key(base) != options_key(dict(base, width=640))
+    assert options_key(base) != options_key(dict(base, watermark="Arya"))
+
+def test_sizes_render_every_width_and_format(tmp_path):
+    from resizer import process_images
+    src = tmp_path / "in"
+    src.mkdir()
+    Image.new("RGB", (2000, 1000), "red").save(src / "photo.jpg")
+    summary = process_images(src, tmp_path / "out", sizes=[320, 1080, 640], format=["jpg", "webp"])
+    assert summary.success == 1
+    for width in (320, 640, 1080):
+        for ext in ("jpg", "webp"):
+            with Image.open(tmp_path / "out" / f"photo-{width}w.{ext}") as im:
+                assert im.size == (width, width // 2)
+
+def test_watermark_only_touches_corner():
+    img = Image.new("RGB", (800, 600), "white")
+    out = apply_watermark(img, "Test Watermark")
+    assert img.getpixel((799, 599)) == (255, 255, 255)   # source left alone
+    assert out.getpixel((0, 0)) == (255, 255, 255)
+    assert out.getpixel((780, 580)) != (255, 255, 255)
+    assert apply_watermark(img, "Test Watermark", inplace=True) is img
+
+def test_failed_encode_leaves_no_output(tmp_path):
+    from resizer import write_output
+    dst = tmp_path / "out.jpg"
+    with pytest.raises(Exception):
+        write_output(Image.new("RGB", (10, 10)), dst, {"format": "NOT-A-FORMAT"})
+    assert list(tmp_path.iterdir()) == []
+
+def test_target_kb_picks_highest_quality_that_fits():
+    from quality import choose_quality, encode
+    img = Image.effect_noise((1200, 800), 30).convert("RGB")
+    params = {"format": "JPEG"}
+    q, data = choose_quality(img, params, target_kb=400)
+    assert len(data) <= 400 * 1024
+    assert q == 95 or len(encode(img, params, q + 1)) > 400 * 1024
+
+def test_metrics_histograms_and_slowest():
+    from metrics import Metrics
+    m = Metrics(slowest=1)
+    m.add("a.jpg", (True, None, {"decode": 0.002, "encode": 0.03}, {"bytes_in": 1000, "bytes_out": 250}))
+    m.add("b.jpg", (True, None, {"decode": 0.2, "encode": 0.03}, {"bytes_in": 1000, "bytes_out": 250}))
+    report = m.to_dict()
+    assert report["compression_ratio"] == 4.0
+    assert report["stages"]["decode"]["buckets"]["0.0025"] == 1
+    assert report["stages"]["decode"]["buckets"]["+Inf"] == 2
+    assert [s["file"] for s in report["slowest"]] == ["b.jpg"]
+    assert 'resizer_stage_seconds_count{stage="encode"} 2' in m.to_prometheus()
+
+def test_journal_resume_skips_done_and_failed(tmp_path):
+    from journal import JobJournal
+    journal = JobJournal(tmp_path / "journal.log", flush_every=1)
+    journal.start({"input": "in"})
+    list(journal.listing([tmp_path / n for n in ("a.jpg", "b.jpg", "c.jpg")], tmp_path))
+    journal.record("a.jpg")
+    journal.record("b.jpg", "cannot\tidentify\nimage")
+    journal.close()
+
+    state = JobJournal(tmp_path / "journal.log").load()
+    assert state.listed and state.done == {"a.jpg"}
+    assert state.failed == {"b.jpg": "cannot identify image"}
+    skip = state.done | set(state.failed)
+    assert list(JobJournal(tmp_path / "journal.log").queued(skip)) == ["c.jpg"]
+
+def test_outputs_get_umask_mode_not_mkstemp_mode(tmp_path):
+    import os
+    import stat
+    from resizer import process_images
+    src = tmp_path / "in"
+    src.mkdir()
+    Image.new("RGB", (400, 200), "red").save(src / "a.jpg")
+    Image.new("RGB", (400, 200), "red").save(src / "b.jpg")      # same content: copied from a.jpg
+    previous = os.umask(0o027)
+    try:
+        summary = process_images(src, tmp_path / "out", width=100)
+    finally:
+        os.umask(previous)
+    assert (summary.success, summary.copied) == (1, 1)
+    for name in ("a.jpg", "b.jpg"):
+        assert stat.S_IMODE((tmp_path / "out" / name).stat().st_mode) == 0o640
+
+@pytest.mark.parametrize("size", [(1000, 500), (333, 1000), (1001, 999), (1919, 1079), (7, 2999), (2999, 7), (640, 641)])
+@pytest.mark.parametrize("box", [(100, 100), (97, 300), (300, 97), (1, 50), (640, 480)])
+def test_target_size_matches_thumbnail(size, box):
+    from resizer import target_size
+    img = Image.new("L", size)
+    img.thumbnail(box)
+    assert target_size(size, *box) == img.size
+
+def test_rotated_jpeg_is_resized_to_its_displayed_width(tmp_path):
+    from resizer import process_images
+    src = tmp_path / "in"
+    src.mkdir()
+    # Stored 800x400, left half red; orientation 6 displays it as 400x800
+    # with the red half on top.
+    img = Image.new("RGB", (800, 400), "blue")
+    img.paste("red", (0, 0, 400, 400))
+    exif = Image.Exif()
+    exif[0x0112] = 6
+    img.save(src / "portrait.jpg", exif=exif.tobytes())
+
+    summary = process_images(src, tmp_path / "out", width=100, preserve_exif=True)
+    assert summary.success == 1
+    with Image.open(tmp_path / "out" / "portrait.jpg") as out:
+        assert out.size == (100, 200)
+        assert out.getexif().get(0x0112, 1) == 1
+        top, bottom = out.getpixel((50, 20)), out.getpixel((50, 180))
+        assert top[0] > 200 and top[2] < 60           # red on top, as displayed
+        assert bottom[2] > 200 and bottom[0] < 60
+
+def test_jpeg_draft_decodes_at_reduced_scale(tmp_path):
+    from resizer import prepare_decode, REDUCING_GAP
+    path = tmp_path / "big.jpg"
+    Image.new("RGB", (2000, 1000), "green").save(path)
+    with Image.open(path) as im:
+        prepare_decode(im, 100, None)
+        im.load()
+        assert im.size[0] < 2000                        # DCT scaling kicked in
+        assert im.size[0] >= 100 * REDUCING_GAP and im.size[1] >= 50 * REDUCING_GAP
+    with Image.open(path) as im:
+        prepare_decode(im, 4000, None)                  # no downscale, no draft
+        im.load()
+        assert im.size == (2000, 1000)
+
+def _photos(folder, count):
+    folder.mkdir()
+    for i in range(count):
+        Image.new("RGB", (400, 300), (i * 10, 0, 0)).save(folder / f"p{i:02d}.jpg")
+
+def _wait_for(job, *states, timeout=10):
+    import time
+    deadline = time.monotonic() + timeout
+    while job.state not in states:
+        assert time.monotonic() < deadline, f"job stuck in {job.state}"
+        time.sleep(0.01)
+
+def test_job_cancel_then_resume_finishes_the_rest(tmp_path):
+    from jobs import CANCELLED, DONE, PAUSED, JobRunner
+    _photos(tmp_path / "in", 12)
+    runner = JobRunner()
+    try:
+        # Pausing straight away holds the job after its first image, so
+        # the cancel always lands mid-run.
+        job = runner.submit(tmp_path / "in", tmp_path / "out", width=100)
+        job.pause()
+        _wait_for(job, PAUSED)
+        job.cancel()
+        _wait_for(job, CANCELLED)
+        assert job.done == 1 and job.summary is None
+        built = sorted((tmp_path / "out").glob("*.jpg"))
+        assert len(built) == 1
+        mtime = built[0].stat().st_mtime_ns
+
+        again = runner.submit(tmp_path / "in", tmp_path / "out", width=100, resume=True)
+        _wait_for(again, DONE)
+        assert again.summary.success == 11           # only what was left
+        assert again.summary.skipped == 0
+        assert len(list((tmp_path / "out").glob("*.jpg"))) == 12
+        assert built[0].stat().st_mtime_ns == mtime
+    finally:
+        runner.shutdown()
+
+def test_job_pause_and_unpause_completes(tmp_path):
+    from jobs import DONE, PAUSED, RUNNING, JobRunner
+    _photos(tmp_path / "in", 6)
+    runner = JobRunner()
+    try:
+        job = runner.submit(tmp_path / "in", tmp_path / "out", width=100)
+        job.pause()
+        _wait_for(job, PAUSED)
+        done_while_paused = job.done
+        job.resume()
+        _wait_for(job, DONE)
+        assert done_while_paused == 1
+        assert job.summary.success == 6 and job.done == 6
+        states = [event["state"] for event in job.drain()]
+        assert RUNNING in states[states.index(PAUSED):]
+        assert states[-1] == DONE
+    finally:
+        runner.shutdown()
+
+def test_job_state_changes_once_and_never_leaves_a_finished_state(tmp_path):
+    from jobs import CANCELLED, DONE, QUEUED, RUNNING, Job
+    job = Job(1, tmp_path, tmp_path, {})
+    assert job._set_state(RUNNING, only_from=(QUEUED,))
+    assert not job._set_state(RUNNING)                   # no change, no event
+    job.cancel()                                         # too late to skip the run
+    assert job.state == RUNNING
+    assert job._set_state(DONE)
+    assert not job._set_state(CANCELLED) and job.state == DONE
+    assert [event["state"] for event in job.drain()] == [RUNNING, DONE]
+
+def test_cancel_racing_the_job_start_ends_cancelled(tmp_path):
+    import threading
+    from jobs import CANCELLED, FINISHED, JobRunner
+    _photos(tmp_path / "in", 3)
+    for _ in range(20):
+        runner = JobRunner()
+        try:
+            job = runner.submit(tmp_path / "in", tmp_path / "out", width=100, overwrite=True)
+            threading.Thread(target=job.cancel).start()
+            _wait_for(job, *FINISHED)
+            runner.shutdown(cancel=False)
+            # Whichever side won, the job ends once, and a cancel that
+            # landed before the first image is never reported as done.
+            states = [event["state"] for event in job.drain()]
+            assert sum(state in FINISHED for state in states) == 1
+            assert states[-1] == job.state
+            if job.done == 0:
+                assert job.state == CANCELLED
+        finally:
+            runner.shutdown()
@@ -1,7 +1,15 @@
 import streamlit as st
-from resizer import process_images
+from jobs import JobRunner, PAUSED, FINISHED, DONE, FAILED
 from pathlib import Path
-import shutil
+import time
+
+# One runner per server process, shared by every browser session, so
+# batches keep going while pages rerun.
+@st.cache_resource
+def get_runner():
+    return JobRunner(max_concurrent=2)
+
+runner = get_runner()
 
 st.title("📸 Image Resizer & Optimizer")
 
@@ -15,7 +23,7 @@ if st.button("Start"):
     if not Path(input_folder).exists():
         st.error("Invalid input folder!")
     else:
-        process_images(
+        job = runner.submit(
             Path(input_folder),
             Path(output_folder),
             width=width,
@@ -26,4 +34,40 @@ if st.button("Start"):
             workers=4,
             recursive=True
         )
-        st.success("Done! Images processed.")
+        st.session_state.setdefault("jobs", []).append(job.id)
+
+for job_id in reversed(st.session_state.get("jobs", [])):
+    job = runner.get(job_id)
+    if job is None:
+        continue
+    list(job.drain())   # events are for push-style UIs; polling status() is enough here
+    status = job.status()
+
+    st.subheader(f"Job {job.id} — {job.input_dir}")
+    if status["total"]:
+        st.progress(min(status["done"] / status["total"], 1.0))
+    line = f"{status['state']}: {status['done']}"
+    if status["total"] is not None:
+        line += f" / {status['total']}"
+    line += f" images · {status['rate']:.1f} img/s"
+    if status["eta"] is not None:
+        line += f" · ETA {int(status['eta'])}s"
+    st.write(line)
+
+    if status["state"] == DONE:
+        s = job.summary
+        st.success(f"Done! ✔ {s.success} · ↺ {s.skipped} · ⧉ {s.copied} · ✖ {s.failed}")
+    elif status["state"] == FAILED:
+        st.error(status["error"])
+    elif status["state"] not in FINISHED:
+        left, right = st.columns(2)
+        if status["state"] == PAUSED:
+            left.button("Resume", key=f"resume-{job.id}", on_click=job.resume)
+        else:
+            left.button("Pause", key=f"pause-{job.id}", on_click=job.pause)
+        right.button("Cancel", key=f"cancel-{job.id}", on_click=job.cancel)
+
+# Refresh while anything from this session is still queued or running.
+if any(runner.get(i) and runner.get(i).state not in FINISHED for i in st.session_state.get("jobs", [])):
+    time.sleep(1)
+    st.rerun()
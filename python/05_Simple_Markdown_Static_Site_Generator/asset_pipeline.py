@@ -0,0 +1,314 @@
+"""
+ASSET PIPELINE
+--------------
+Brings site/assets/ up to date with assets/. Files whose size and mtime
+didn't change since the last build are skipped.
+
+Production builds (build.py --production) also:
+
+* minify CSS and JS. This only removes comments and whitespace, so it
+  can't change what the code does.
+* put a content hash in every asset's name (style.css → style.1a2b3c4d.css),
+  so a host can cache them forever. builder.py rewrites "/assets/..."
+  references in pages (outside <pre> and <code>); url(...) references
+  inside CSS are rewritten here. The same bytes are also written under the
+  plain name, for URLs a script builds at runtime that nothing can rewrite.
+* write .gz, and .br if the optional `brotli` package is installed, next to
+  every compressible file. Static hosts serve those instead of compressing
+  on each request.
+"""
+
+import concurrent.futures
+import gzip
+import hashlib
+import os
+import posixpath
+import re
+import secrets
+import shutil
+from pathlib import Path, PurePosixPath
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+COMPRESSIBLE = {".html", ".css", ".js", ".mjs", ".json", ".svg", ".xml", ".txt", ".map", ".webmanifest", ".ico"}
+COMPRESS_MIN_BYTES = 256      # below this the headers cost more than they save
+SIBLINGS = (".gz", ".br")
+
+
+def write_atomic(path, data):
+    """Write text or bytes under a temp name, then rename over `path`."""
+    path = Path(path)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    if isinstance(data, str):
+        data = data.encode("utf-8")
+    # Not mkstemp(): its 0600 would survive the rename and hide the site
+    # from a web server running as another user. Created as 0666, the file
+    # gets the umask applied by the kernel, like open(path, "wb").
+    tmp = path.with_name(f".{path.name}.{secrets.token_hex(6)}.tmp")
+    fd = os.open(tmp, os.O_WRONLY | os.O_CREAT | os.O_EXCL | getattr(os, "O_BINARY", 0), 0o666)
+    try:
+        with os.fdopen(fd, "wb") as f:
+            f.write(data)
+        os.replace(tmp, path)
+    except BaseException:
+        try:
+            os.unlink(tmp)
+        except OSError:
+            pass
+        raise
+
+
+# ---------------------------------------------------------
+# Minifiers (comments and whitespace only)
+# ---------------------------------------------------------
+
+_CSS_STRINGS_AND_COMMENTS = re.compile(r'"(?:\\.|[^"\\])*"|\'(?:\\.|[^\'\\])*\'|/\*.*?\*/', re.S)
+
+
+def _squeeze_css(chunk):
+    chunk = re.sub(r"\s+", " ", chunk)
+    chunk = re.sub(r" ?([{};,>]) ?", r"\1", chunk)
+    chunk = re.sub(r": ", ":", chunk)      # not " :" — "a :hover" means something else
+    return chunk.replace(";}", "}")
+
+
+def minify_css(css):
+    out, pos = [], 0
+    for m in _CSS_STRINGS_AND_COMMENTS.finditer(css):
+        out.append(_squeeze_css(css[pos:m.start()]))
+        token = m.group()
+        if not token.startswith("/*") or token.startswith("/*!"):   # keep strings and /*! licences */
+            out.append(token)
+        pos = m.end()
+    out.append(_squeeze_css(css[pos:]))
+    return "".join(out).strip()
+
+
+def minify_js(js):
+    """Drop indentation, blank lines and whole-line // comments. Line
+    breaks stay (JavaScript's automatic semicolons depend on them)."""
+    if "`" in js or any(line.endswith("\\") for line in js.splitlines()):
+        # Template literals and backslash-continued strings span lines, and
+        # stripping those lines would change the string; leave the file alone.
+        return js
+    lines = []
+    for line in js.splitlines():
+        line = line.strip()
+        if line and not line.startswith("//"):
+            lines.append(line)
+    return "\n".join(lines) + "\n"
+
+
+_HTML_RAW = re.compile(r"<(pre|textarea|script|style)\b.*?</\1\s*>", re.S | re.I)
+_HTML_COMMENT = re.compile(r"<!--(?!\[if|\s*\[endif).*?-->", re.S)
+_HTML_TAG_OR_SPACE = re.compile(r"(<[^>]*>)|\s+")
+
+
+def _squeeze_html(chunk):
+    chunk = _HTML_COMMENT.sub("", chunk)
+    # Runs of whitespace between tags render as one space anyway; tags
+    # themselves (attribute values) are left exactly as they are.
+    return _HTML_TAG_OR_SPACE.sub(
+        lambda m: m.group(1) or ("\n" if "\n" in m.group() else " "), chunk
+    )
+
+
+def minify_html(html):
+    out, pos = [], 0
+    for m in _HTML_RAW.finditer(html):
+        out.append(_squeeze_html(html[pos:m.start()]))
+        out.append(m.group())          # <pre>, <textarea>, <script>, <style> untouched
+        pos = m.end()
+    out.append(_squeeze_html(html[pos:]))
+    return "".join(out).strip() + "\n"
+
+
+# ---------------------------------------------------------
+# Fingerprints and references
+# ---------------------------------------------------------
+
+def fingerprinted(rel, data):
+    """css/style.css + content → css/style.1a2b3c4d.css"""
+    p = PurePosixPath(rel)
+    digest = hashlib.blake2b(data, digest_size=4).hexdigest()
+    return str(p.with_name(f"{p.stem}.{digest}{p.suffix}"))
+
+
+_PAGE_ASSET_REF = re.compile(r"""(?<=[\s"'(=,])/assets/([^"'()\s?#<>,]+)""")
+_PAGE_CODE = re.compile(r"<(pre|code)\b.*?</\1\s*>", re.S | re.I)
+_CSS_URL = re.compile(r"""url\(\s*(['"]?)([^'")]+?)\1\s*\)""")
+
+
+def rewrite_references(html, manifest):
+    """Point every /assets/<file> in a page at the file's fingerprinted
+    name. Code samples (<pre>, <code>) show paths as written."""
+    def rewrite(chunk):
+        return _PAGE_ASSET_REF.sub(lambda m: "/assets/" + manifest.get(m.group(1), m.group(1)), chunk)
+
+    out, pos = [], 0
+    for m in _PAGE_CODE.finditer(html):
+        out.append(rewrite(html[pos:m.start()]))
+        out.append(m.group())
+        pos = m.end()
+    out.append(rewrite(html[pos:]))
+    return "".join(out)
+
+
+def rewrite_css_urls(css, css_rel, manifest):
+    base = posixpath.dirname(css_rel)
+
+    def repl(m):
+        quote, url = m.group(1), m.group(2)
+        path = re.split(r"[?#]", url, 1)[0]
+        rest = url[len(path):]
+        if path.startswith("/assets/"):
+            target = manifest.get(path[len("/assets/"):])
+            new = "/assets/" + target if target else None
+        elif path.startswith(("/", "data:", "http:", "https:")) or not path:
+            new = None
+        else:
+            target = manifest.get(posixpath.normpath(posixpath.join(base, path)))
+            new = posixpath.relpath(target, base or ".") if target else None
+        return f"url({quote}{new}{rest}{quote})" if new else m.group()
+
+    return _CSS_URL.sub(repl, css)
+
+
+# ---------------------------------------------------------
+# Precompression
+# ---------------------------------------------------------
+
+def remove_siblings(path):
+    for ext in SIBLINGS:
+        Path(f"{path}{ext}").unlink(missing_ok=True)
+
+
+def compress_siblings(path, data=None):
+    """Write <path>.gz and <path>.br for a compressible file, keeping only
+    the ones that come out smaller."""
+    path = Path(path)
+    if path.suffix.lower() not in COMPRESSIBLE:
+        return
+    data = path.read_bytes() if data is None else data
+    if len(data) < COMPRESS_MIN_BYTES:
+        remove_siblings(path)
+        return
+
+    variants = {".gz": lambda: gzip.compress(data, 9, mtime=0)}
+    if brotli is not None:
+        variants[".br"] = lambda: brotli.compress(data, quality=11)
+    for ext in SIBLINGS:
+        packed = variants[ext]() if ext in variants else None
+        if packed is not None and len(packed) < len(data):
+            write_atomic(f"{path}{ext}", packed)
+        else:
+            Path(f"{path}{ext}").unlink(missing_ok=True)
+
+
+# ---------------------------------------------------------
+# Sync
+# ---------------------------------------------------------
+
+def process_asset(rel, src, out_dir, production, manifest):
+    """Produce one asset in `out_dir`; returns its output name."""
+    plain = out_dir / rel
+    if not production:
+        plain.parent.mkdir(parents=True, exist_ok=True)
+        shutil.copy2(src, plain)
+        remove_siblings(plain)      # left over from a production build
+        return rel
+
+    data = src.read_bytes()
+    suffix = src.suffix.lower()
+    if suffix in (".css", ".js", ".mjs"):
+        try:
+            text = data.decode("utf-8")
+        except UnicodeDecodeError:
+            pass
+        else:
+            if suffix == ".css":
+                text = minify_css(rewrite_css_urls(text, rel, manifest))
+            else:
+                text = minify_js(text)
+            data = text.encode("utf-8")
+
+    out_rel = fingerprinted(rel, data)
+    dst = out_dir / out_rel
+    if not dst.exists():        # same name means same bytes
+        write_atomic(dst, data)
+        compress_siblings(dst, data)
+    write_atomic(plain, data)
+    compress_siblings(plain, data)
+    return out_rel
+
+
+def sync_assets(assets_dir, out_dir, old, force, log, only=None, production=False, workers=1):
+    """
+    Bring `out_dir` (site/assets) up to date with `assets_dir`.
+
+    old         last build's {rel: [size, mtime_ns, output rel]}
+    only        if given, just these asset paths are looked at (changed
+                files from the watcher) instead of the whole folder
+
+    Returns (entries, manifest, processed): the new entries, a map of
+    every asset to its output name (the same name unless production) and
+    how many files were written.
+    """
+    assets_dir, out_dir = Path(assets_dir), Path(out_dir)
+    if only is None:
+        current = {}
+        files = sorted(p for p in assets_dir.rglob("*") if p.is_file()) if assets_dir.exists() else []
+    else:
+        current = dict(old)
+        files = [p for p in only if p.is_file()]
+        for path in only:
+            if not path.is_file():
+                current.pop(path.relative_to(assets_dir).as_posix(), None)
+
+    todo = []
+    for path in files:
+        rel = path.relative_to(assets_dir).as_posix()
+        st = path.stat()
+        sig = [st.st_size, st.st_mtime_ns]
+        prev = old.get(rel)
+        if (not force and prev and prev[:2] == sig and (out_dir / prev[2]).exists()
+                and (out_dir / rel).exists()):
+            current[rel] = prev
+            continue
+        todo.append((rel, path, sig))
+
+    manifest = {rel: entry[2] for rel, entry in current.items()}
+    if production:
+        # Stylesheets go last: their url(...)s need the other files' new names.
+        stages = [[t for t in todo if not t[0].endswith(".css")], [t for t in todo if t[0].endswith(".css")]]
+    else:
+        stages = [todo]
+
+    processed = 0
+    with concurrent.futures.ThreadPoolExecutor(max(1, workers)) as ex:
+        for n, stage in enumerate(stages):
+            if production and n == 1 and any(manifest.get(rel) != old.get(rel, [None] * 3)[2] for rel, *_ in stages[0]):
+                # An image/font got a new name: every stylesheet may point at it.
+                queued = {rel for rel, *_ in stage}
+                stage = stage + [(rel, assets_dir / rel, current[rel][:2])
+                                 for rel in current
+                                 if rel.endswith(".css") and rel not in queued and (assets_dir / rel).is_file()]
+            futures = [(rel, sig, ex.submit(process_asset, rel, src, out_dir, production, dict(manifest)))
+                       for rel, src, sig in stage]
+            for rel, sig, future in futures:
+                out_rel = future.result()
+                current[rel] = sig + [out_rel]
+                manifest[rel] = out_rel
+                processed += 1
+
+    outputs = {entry[2] for entry in current.values()} | set(current)
+    for rel, entry in old.items():
+        for name in (entry[2], rel):
+            if name not in outputs and (out_dir / name).exists():
+                (out_dir / name).unlink()
+                remove_siblings(out_dir / name)
+                log(f"[REMOVED] assets/{name}")
+    return current, manifest, processed
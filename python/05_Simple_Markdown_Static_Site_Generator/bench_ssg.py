@@ -0,0 +1,175 @@
+"""
+Benchmark the site builder on a generated corpus.
+
+    python bench_ssg.py --pages 10000
+    python bench_ssg.py --pages 10000 --workers 8 --corpus /tmp/ssg-corpus
+
+Generates Markdown pages (front matter, headings, lists, a table, a code
+block) into a temp folder (or --corpus DIR, reused between runs), then
+times:
+
+    legacy      the old loop: a new Markdown converter and a get_template()
+                call per page, one process
+    serial      builder.build_site with one worker (reused converter,
+                template compiled once)
+    parallel    builder.build_site with --workers processes
+    bytecode    the same, with Jinja's bytecode cache on disk
+    no-op       a second build with nothing changed
+
+Every row except no-op starts from an empty output folder.
+"""
+
+import argparse
+import datetime
+import os
+import shutil
+import tempfile
+import time
+from pathlib import Path
+
+import markdown
+import frontmatter
+
+import builder
+
+TEMPLATE = """<!doctype html>
+<html>
+<head><meta charset="utf-8"><title>{{ title }} · {{ site_title }}</title>
+<link rel="stylesheet" href="/assets/style.css"></head>
+<body>
+<header><a href="/">{{ site_title }}</a></header>
+<main>
+  <h1>{{ title }}</h1>
+  {% if date %}<time>{{ date }}</time>{% endif %}
+  {{ content|safe }}
+</main>
+<footer>&copy; {{ year }} {{ site_title }}</footer>
+</body>
+</html>
+"""
+
+PAGE = """---
+title: Page {i}
+date: 2024-{month:02d}-{day:02d}
+tags: [bench, page{tag}]
+---
+# Page {i}
+
+Intro paragraph with *emphasis*, **bold**, `code` and a [link](/page{prev}.html).
+
+## Details
+
+- first item
+- second item with more text
+- third item
+
+| name | value |
+| ---- | ----- |
+| a    | {i}   |
+| b    | {tag} |
+
+```python
+def page_{i}():
+    return {i}
+```
+
+### Notes
+
+Closing paragraph number {i}. Lorem ipsum dolor sit amet, consectetur
+adipiscing elit, sed do eiusmod tempor incididunt ut labore.
+"""
+
+
+def make_corpus(root: Path, pages):
+    content = root / "content"
+    templates = root / "templates"
+    assets = root / "assets"
+    for folder in (content, templates, assets):
+        folder.mkdir(parents=True, exist_ok=True)
+    (templates / "base.html").write_text(TEMPLATE, encoding="utf-8")
+    (assets / "style.css").write_text("body { font-family: sans-serif; }\n", encoding="utf-8")
+
+    existing = len(list(content.rglob("*.md")))
+    for i in range(existing, pages):
+        folder = content / f"section{i // 1000:02d}"
+        folder.mkdir(exist_ok=True)
+        text = PAGE.format(i=i, month=i % 12 + 1, day=i % 28 + 1, tag=i % 50, prev=max(i - 1, 0))
+        (folder / f"page{i}.md").write_text(text, encoding="utf-8")
+    return content, templates, assets
+
+
+def legacy_build(content_dir, template_dir, output_dir):
+    """The pre-cache loop from gui_ssg.py, minus the rmtree and assets."""
+    env = builder.make_env(template_dir)
+    count = 0
+    for md_file in content_dir.rglob("*.md"):
+        post = frontmatter.load(md_file)
+        html_body = markdown.Markdown(extensions=builder.MARKDOWN_EXTENSIONS).convert(post.content)
+        out_path = output_dir / md_file.relative_to(content_dir).with_suffix(".html")
+        out_path.parent.mkdir(parents=True, exist_ok=True)
+        rendered = env.get_template("base.html").render(
+            content=html_body,
+            title=post.metadata.get("title", md_file.stem),
+            date=post.metadata.get("date", ""),
+            site_title=builder.SITE_TITLE,
+            year=datetime.date.today().year
+        )
+        out_path.write_text(rendered, encoding="utf-8")
+        count += 1
+    return count
+
+
+def timed(fn):
+    start = time.perf_counter()
+    pages = fn()
+    return time.perf_counter() - start, pages
+
+
+def main():
+    p = argparse.ArgumentParser(description="Benchmark the static site builder")
+    p.add_argument("--pages", type=int, default=10000)
+    p.add_argument("--workers", type=int, default=os.cpu_count() or 4)
+    p.add_argument("--corpus", help="Folder to create/reuse the generated pages in")
+    p.add_argument("--skip-legacy", action="store_true", help="Don't time the old per-page loop")
+    args = p.parse_args()
+
+    tmp = tempfile.mkdtemp(prefix="bench_ssg_")
+    root = Path(args.corpus).resolve() if args.corpus else Path(tmp) / "corpus"
+    quiet = lambda line: None
+
+    try:
+        print(f"Generating {args.pages} pages…")
+        content, templates, assets = make_corpus(root, args.pages)
+
+        def fresh(name):
+            out = Path(tmp) / name
+            shutil.rmtree(out, ignore_errors=True)
+            return out
+
+        def build(out, workers, bytecode_cache=None):
+            stats = builder.build_site(content, templates, assets, out, log=quiet,
+                                       workers=workers, bytecode_cache=bytecode_cache)
+            return stats["rendered"]
+
+        rows = []
+        if not args.skip_legacy:
+            out = fresh("legacy")
+            rows.append(("legacy", *timed(lambda: legacy_build(content, templates, out))))
+        rows.append(("serial", *timed(lambda: build(fresh("serial"), 1))))
+        parallel_out = fresh("parallel")
+        rows.append(("parallel", *timed(lambda: build(parallel_out, args.workers))))
+        bytecode = Path(tmp) / "jinja-cache"
+        build(fresh("warm"), 1, bytecode)     # fill the bytecode cache
+        rows.append(("bytecode", *timed(lambda: build(fresh("bytecode"), args.workers, bytecode))))
+        seconds, _ = timed(lambda: build(parallel_out, args.workers))
+        rows.append(("no-op", seconds, args.pages))
+
+        print(f"\n{'build':<10} {'seconds':>8} {'pages/s':>10}   (workers={args.workers})")
+        for name, seconds, pages in rows:
+            print(f"{name:<10} {seconds:8.2f} {pages / seconds:10.0f}")
+    finally:
+        shutil.rmtree(tmp, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,50 @@
+"""
+BUILD THE SITE FROM THE COMMAND LINE
+------------------------------------
+    python build.py                  # content/ + templates/ + assets/ → site/
+    python build.py --force          # ignore the cache, rebuild everything
+    python build.py --content docs --output public --workers 4
+    python build.py --production     # minify, fingerprint assets, write .gz/.br
+
+Only pages that changed since the last build are rendered (see builder.py).
+Exits with status 1 if any page failed to render.
+"""
+
+import argparse
+import sys
+
+import builder
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Build the static site")
+    parser.add_argument("--content", default="content", help="Markdown folder (default: content)")
+    parser.add_argument("--templates", default="templates", help="Jinja2 templates folder (default: templates)")
+    parser.add_argument("--assets", default="assets", help="CSS/JS/images folder (default: assets)")
+    parser.add_argument("--output", default="site", help="Output folder (default: site)")
+    parser.add_argument("--force", action="store_true", help="Rebuild every page, ignoring the build cache")
+    parser.add_argument("--production", action="store_true",
+                        help="Minify, fingerprint asset names and write .gz/.br copies for static hosting")
+    parser.add_argument("--workers", type=int, default=None, help="Render processes (default: CPU count)")
+    parser.add_argument("--bytecode-cache", default=None, metavar="DIR",
+                        help="Keep compiled templates in DIR between runs")
+    parser.add_argument("-q", "--quiet", action="store_true", help="Only print the summary")
+    args = parser.parse_args(argv)
+
+    log = (lambda line: None) if args.quiet else print
+    stats = builder.build_site(
+        args.content, args.templates, args.assets, args.output,
+        log=log,
+        force=args.force,
+        workers=args.workers,
+        bytecode_cache=args.bytecode_cache,
+        production=args.production
+    )
+    print(f"[BUILD] {stats['rendered']} built, {stats['unchanged']} unchanged, "
+          f"{stats['failed']} failed, {stats['assets_copied']} assets copied "
+          f"in {stats['seconds']:.2f}s")
+    return 1 if stats["failed"] else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
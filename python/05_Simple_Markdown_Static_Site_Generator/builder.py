@@ -0,0 +1,396 @@
+"""
+INCREMENTAL BUILD ENGINE
+------------------------
+Turns content/*.md into site/*.html, redoing only what changed since the
+last build. It has no UI of its own; build.py (command line), gui_ssg.py
+and dev_server.py all call build_site() and pass in `log` / `progress`
+callbacks:
+
+    stats = builder.build_site("content", "templates", "assets", "site", log=print)
+
+What gets redone:
+
+* A page is re-rendered when its Markdown file (body or front matter), any
+  template, or a site-wide value changed. A file whose mtime moved but whose
+  bytes didn't is skipped after hashing it.
+* Assets are copied only when their size or mtime changed.
+* Pages and assets that were deleted from the sources are deleted from the
+  output.
+* index.html is re-rendered only when the list of pages changed.
+
+What was built is remembered in <output>/.ssg-cache.json. The output folder
+is updated in place (never wiped), and every file is written under a temp
+name and renamed, so a dev server can keep serving it during a build.
+
+When many pages changed they are rendered in a process pool; a handful are
+rendered in-process, where starting a pool would cost more than it saves.
+Nothing here imports Tkinter, so pool workers can import this module.
+
+Each worker keeps one Markdown converter (reset between pages) and compiles
+base.html once. Pass `bytecode_cache=<folder>` to let Jinja store compiled
+templates on disk, so fresh workers and cold builds skip compiling them.
+
+With `production=True` assets get fingerprinted names (see asset_pipeline.py),
+pages link those names and are minified, and every page also gets .gz/.br
+copies. Changing an asset's content then re-renders every page, since they
+all link its new name.
+"""
+
+import concurrent.futures
+import datetime
+import hashlib
+import json
+import os
+import threading
+import time
+from pathlib import Path
+
+import markdown
+import frontmatter
+from jinja2 import Environment, FileSystemBytecodeCache, FileSystemLoader, select_autoescape
+
+import asset_pipeline
+from asset_pipeline import write_atomic
+
+CACHE_NAME = ".ssg-cache.json"
+CACHE_VERSION = 2
+SITE_TITLE = "My Static Site"
+MARKDOWN_EXTENSIONS = ["fenced_code", "tables", "toc"]
+RENDER_POOL_MIN = 64      # changed pages needed before a process pool pays off
+
+
+_local = threading.local()
+
+
+def markdown_to_html(md_text):
+    # Setting up the extensions costs more than converting a short page, so
+    # each thread keeps its converter; reset() drops the previous page's
+    # state (toc, footnotes, references).
+    md = getattr(_local, "md", None)
+    if md is None:
+        md = _local.md = markdown.Markdown(extensions=MARKDOWN_EXTENSIONS)
+    return md.reset().convert(md_text)
+
+
+def make_env(template_dir, bytecode_cache=None):
+    cache = None
+    if bytecode_cache:
+        Path(bytecode_cache).mkdir(parents=True, exist_ok=True)
+        cache = FileSystemBytecodeCache(str(bytecode_cache))
+    return Environment(
+        loader=FileSystemLoader(str(template_dir)),
+        autoescape=select_autoescape(["html", "xml"]),
+        bytecode_cache=cache
+    )
+
+
+def file_hash(path):
+    h = hashlib.blake2b(digest_size=16)
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(1 << 20), b""):
+            h.update(chunk)
+    return h.hexdigest()
+
+
+def tree_hash(folder):
+    """One hash over every file (name + content) under `folder`."""
+    h = hashlib.blake2b(digest_size=16)
+    folder = Path(folder)
+    if folder.exists():
+        for path in sorted(p for p in folder.rglob("*") if p.is_file()):
+            h.update(path.relative_to(folder).as_posix().encode("utf-8") + b"\0")
+            h.update(file_hash(path).encode("ascii"))
+    return h.hexdigest()
+
+
+def write_page(out_path, html, site):
+    """Write a rendered page; in production builds rewrite asset links,
+    minify it and add .gz/.br copies."""
+    if site["production"]:
+        html = asset_pipeline.minify_html(asset_pipeline.rewrite_references(html, site["assets"]))
+    data = html.encode("utf-8")
+    write_atomic(out_path, data)
+    if site["production"]:
+        asset_pipeline.compress_siblings(out_path, data)
+    else:
+        asset_pipeline.remove_siblings(out_path)    # left over from a production build
+
+
+# ---------------------------------------------------------
+# Page rendering (runs in pool workers too)
+# ---------------------------------------------------------
+
+_env = None
+_env_key = None
+_template = None
+
+
+def init_renderer(template_dir, bytecode_cache=None):
+    """Set up this process's Jinja environment and compile base.html. The
+    environment is kept between builds; Jinja itself recompiles a template
+    whose file changed."""
+    global _env, _env_key, _template
+    key = (str(template_dir), str(bytecode_cache or ""))
+    if _env is None or _env_key != key:
+        _env = make_env(template_dir, bytecode_cache)
+        _env_key = key
+    _template = _env.get_template("base.html")
+
+
+def render_page(job):
+    """Render one page. Returns (rel, meta, error)."""
+    rel, md_file, out_path, url, site = job
+    try:
+        post = frontmatter.load(md_file)
+        html_body = markdown_to_html(post.content)
+        metadata = post.metadata
+
+        title = metadata.get("title", Path(md_file).stem)
+        date = metadata.get("date", "")
+
+        rendered = _template.render(
+            content=html_body,
+            title=title,
+            date=date,
+            site_title=site["site_title"],
+            year=site["year"]
+        )
+        write_page(out_path, rendered, site)
+        return rel, {"title": str(title), "url": url, "date": str(date)}, None
+    except Exception as e:
+        return rel, None, f"{type(e).__name__}: {e}"
+
+
+def render_pages(jobs, template_dir, workers, bytecode_cache=None):
+    """Render `jobs`, yielding results in order. The in-process path expects
+    init_renderer() to have been called already. Closing the generator early
+    drops the pages that haven't started yet."""
+    if len(jobs) >= RENDER_POOL_MIN and workers > 1:
+        initargs = (str(template_dir), str(bytecode_cache) if bytecode_cache else None)
+        ex = concurrent.futures.ProcessPoolExecutor(workers, initializer=init_renderer, initargs=initargs)
+        try:
+            yield from ex.map(render_page, jobs, chunksize=max(1, len(jobs) // (workers * 4)))
+        finally:
+            ex.shutdown(wait=True, cancel_futures=True)
+    else:
+        for job in jobs:
+            yield render_page(job)
+
+
+# ---------------------------------------------------------
+# Build
+# ---------------------------------------------------------
+
+def load_cache(output_dir):
+    try:
+        cache = json.loads((Path(output_dir) / CACHE_NAME).read_text(encoding="utf-8"))
+    except (OSError, ValueError):
+        return {}
+    return cache if cache.get("version") == CACHE_VERSION else {}
+
+
+def _key(*parts):
+    blob = json.dumps(parts, sort_keys=True, default=str).encode("utf-8")
+    return hashlib.blake2b(blob, digest_size=16).hexdigest()
+
+
+def _inside(path, folder):
+    try:
+        path.relative_to(folder)
+        return True
+    except ValueError:
+        return False
+
+
+def change_scope(changed, content_dir, assets_dir, old_pages, old_assets):
+    """
+    Split changed paths into (page files, asset files) for a scoped build,
+    or return None when only a full scan is safe: a folder was added,
+    moved or deleted, or something outside content/ and assets/ changed.
+    """
+    content_dir = Path(os.path.abspath(content_dir))
+    assets_dir = Path(os.path.abspath(assets_dir))
+    pages, assets = set(), set()
+    for path in changed:
+        path = Path(os.path.abspath(path))
+        if _inside(path, content_dir):
+            rel = path.relative_to(content_dir).as_posix()
+            if path.suffix != ".md" and not path.exists():
+                if any(r.startswith(rel + "/") for r in old_pages):
+                    return None     # a folder of pages went away
+                continue
+            if path.suffix != ".md" and path.is_file():
+                continue            # not a page; nothing to do
+            if path.is_file() or (not path.exists() and rel in old_pages):
+                pages.add(path)
+                continue
+        elif _inside(path, assets_dir):
+            rel = path.relative_to(assets_dir).as_posix()
+            if path.is_file() or (not path.exists() and rel in old_assets):
+                assets.add(path)
+                continue
+        return None
+    return sorted(pages), sorted(assets)
+
+
+def build_site(content_dir, template_dir, assets_dir, output_dir, log=print, force=False, workers=None,
+               bytecode_cache=None, progress=None, changed=None, cancel=None, production=False):
+    """
+    Build (or bring up to date) the site in `output_dir`.
+
+    log             called with one line per built/removed file
+    progress        called as progress(done, total) after each rendered page
+    force           ignore the cache and rebuild everything
+    workers         processes for rendering (default: CPU count)
+    bytecode_cache  optional folder for Jinja's compiled templates
+    changed         paths known to have changed (e.g. from a file watcher);
+                    only those pages/assets are looked at instead of
+                    scanning every file. Falls back to a full scan when the
+                    change can't be scoped (templates, folders).
+    cancel          called between pages; returning True stops the build.
+                    Pages rendered so far are kept in the cache, the rest
+                    are picked up by the next build.
+    production      fingerprint, minify and precompress (asset_pipeline.py)
+
+    Returns counts of what was done.
+    """
+    started = time.perf_counter()
+    content_dir = Path(content_dir)
+    template_dir = Path(template_dir)
+    assets_dir = Path(assets_dir)
+    output_dir = Path(output_dir)
+    output_dir.mkdir(parents=True, exist_ok=True)
+    workers = workers or os.cpu_count() or 1
+
+    cache = load_cache(output_dir)
+    old_pages = cache.get("pages", {})
+    old_assets = cache.get("assets", {})
+
+    site = {"site_title": SITE_TITLE, "year": datetime.date.today().year, "production": production}
+    # Every page depends on the templates and the site-wide values...
+    templates_key = _key(tree_hash(template_dir), site)
+    init_renderer(template_dir, bytecode_cache)
+
+    scope = None
+    if changed is not None and not force and cache.get("templates") == templates_key:
+        scope = change_scope(changed, content_dir, assets_dir, old_pages, old_assets)
+    if scope is None:
+        md_files, asset_files = sorted(content_dir.rglob("*.md")), None
+        pages = {}
+    else:
+        # Scoped paths are absolute; everything else is as it was.
+        md_files, asset_files = scope
+        content_dir = Path(os.path.abspath(content_dir))
+        assets_dir = Path(os.path.abspath(assets_dir))
+        pages = dict(old_pages)
+
+    # Switching between production and plain builds redoes every asset.
+    redo_assets = force or cache.get("production", False) != production
+    assets, manifest, copied = asset_pipeline.sync_assets(
+        assets_dir, output_dir / "assets", old_assets, redo_assets, log,
+        only=asset_files, production=production, workers=workers
+    )
+    # ...and, in production, on the fingerprinted asset names they link.
+    site["assets"] = manifest if production else {}
+    site_key = _key(templates_key, site["assets"])
+    if scope is not None and site_key != cache.get("site"):
+        md_files, pages = sorted(content_dir.rglob("*.md")), {}
+
+    jobs = []
+    for md_file in md_files:
+        rel = md_file.relative_to(content_dir).as_posix()
+        if not md_file.exists():
+            pages.pop(rel, None)     # deleted; removed from the output below
+            continue
+        out_rel = Path(rel).with_suffix(".html").as_posix()
+        out_path = output_dir / out_rel
+        st = md_file.stat()
+        stat = [st.st_size, st.st_mtime_ns]
+        old = old_pages.get(rel)
+        fresh = not force and old and old.get("site") == site_key and "meta" in old and out_path.exists()
+
+        if fresh and old["stat"] == stat:
+            pages[rel] = old
+            continue
+        digest = file_hash(md_file)
+        if fresh and old["hash"] == digest:
+            pages[rel] = dict(old, stat=stat)
+            continue
+
+        pages[rel] = {"stat": stat, "hash": digest, "site": site_key, "out": out_rel}
+        jobs.append((rel, str(md_file), str(out_path), "/" + out_rel, site))
+
+    rendered = failed = 0
+    cancelled = False
+    if progress:
+        progress(0, len(jobs))
+    results = render_pages(jobs, template_dir, workers, bytecode_cache)
+    try:
+        for done, (rel, meta, error) in enumerate(results, 1):
+            if error:
+                # Leave it out of the cache so the next build tries again.
+                failed += 1
+                del pages[rel]
+                log(f"[ERROR] {rel}: {error}")
+            else:
+                rendered += 1
+                pages[rel]["meta"] = meta
+                log(f"[BUILT] {output_dir / pages[rel]['out']}")
+            if progress:
+                progress(done, len(jobs))
+            if cancel and done < len(jobs) and cancel():
+                cancelled = True
+                break
+    finally:
+        results.close()
+
+    if cancelled:
+        # Pages that never got rendered keep their old entry (whose stat no
+        # longer matches), so the next build renders them.
+        for rel, *_ in jobs:
+            if rel in pages and "meta" not in pages[rel]:
+                if rel in old_pages:
+                    pages[rel] = old_pages[rel]
+                else:
+                    del pages[rel]
+        log(f"[CANCELLED] {len(jobs) - rendered - failed} pages left for the next build")
+
+    for rel, old in old_pages.items():
+        if rel not in pages and not (content_dir / rel).exists():
+            (output_dir / old["out"]).unlink(missing_ok=True)
+            asset_pipeline.remove_siblings(output_dir / old["out"])
+            log(f"[REMOVED] {old['out']}")
+
+    pages_meta = [pages[rel]["meta"] for rel in sorted(pages)]
+    index_key = _key(site_key, pages_meta)
+    index_path = output_dir / "index.html"
+    if cancelled:
+        index_key = cache.get("index")
+    elif force or cache.get("index") != index_key or not index_path.exists():
+        index_items = ["<h2>Pages</h2><ul>"]
+        for p in pages_meta:
+            index_items.append(f'<li><a href="{p["url"]}">{p["title"]}</a></li>')
+        index_items.append("</ul>")
+
+        index_html = _template.render(
+            content="\n".join(index_items),
+            title="Home",
+            site_title=site["site_title"],
+            year=site["year"]
+        )
+        write_page(index_path, index_html, site)
+        log("[BUILT] index.html")
+
+    write_atomic(output_dir / CACHE_NAME, json.dumps({
+        "version": CACHE_VERSION, "production": production, "templates": templates_key, "site": site_key,
+        "pages": pages, "assets": assets, "index": index_key
+    }))
+
+    return {
+        "rendered": rendered,
+        "failed": failed,
+        "unchanged": len(pages) - rendered,
+        "assets_copied": copied,
+        "cancelled": cancelled,
+        "seconds": time.perf_counter() - started,
+    }
@@ -5,33 +5,55 @@ This script does three things:
 
 1) Watches your project folders (content/, templates/, assets/)
 2) Rebuilds the static site whenever something changes
-3) Serves the built site at http://localhost:8000 with auto-refresh
+3) Serves the built site at http://localhost:8000 and tells open pages to
+   refresh (or just swap their CSS) over a WebSocket
 
 This gives you the same workflow as frameworks like Jekyll, Hugo, Astro, Vite, etc.
+
+Builds run in this process (builder.build_site), so markdown/jinja2 are
+imported once and each rebuild only re-renders the pages that changed.
+
+Watcher events are collected for a short quiet period (an editor save can
+fire several), so a burst becomes one build of just the files it touched.
+Changes that arrive during a build stop it, and the next build picks up
+where it left off plus the new changes.
 """
 
+import base64
+import email.utils
+import hashlib
 import http.server
-import socketserver
+import json
+import os
+import queue
 import threading
 import time
+import urllib.parse
 from pathlib import Path
-import subprocess
-import sys
-import io
 
 from watchdog.observers import Observer
 from watchdog.events import FileSystemEventHandler
 
+import builder
+
 
 # ---------------------------------------------------------
 # CONFIGURATION
 # ---------------------------------------------------------
 
-BUILD_SCRIPT = "build.py"                # The script that generates your HTML files
+CONTENT_DIR = Path("content")            # Markdown pages
+TEMPLATE_DIR = Path("templates")         # Jinja2 templates
+ASSETS_DIR = Path("assets")              # CSS, JS, images
 SITE_DIR = Path("site")                  # Output folder containing the generated website
 WATCH_DIRS = ["content", "templates", "assets"]
 PORT = 8000                              # Local server port
-RELOAD_FILE = SITE_DIR / ".reload"       # Timestamp file used for browser auto-reload
+RELOAD_PATH = "/__livereload"            # WebSocket endpoint pages connect to
+CACHE_MAX_FILE = 1024 * 1024             # Files up to this size are served from memory
+CACHE_MAX_TOTAL = 64 * 1024 * 1024       # Memory the dev server may use for that
+DEBOUNCE_SECONDS = 0.15                  # Quiet time before a burst of changes is built
+
+# Editor swap/backup files and our own temp files — never worth a rebuild.
+IGNORED_SUFFIXES = (".tmp", ".swp", ".swx", ".swo", ".part", ".crdownload", "~")
 
 
 # ---------------------------------------------------------
@@ -43,65 +65,193 @@ def ensure_site_directory():
     SITE_DIR.mkdir(parents=True, exist_ok=True)
 
 
-def update_reload_timestamp():
-    """Touch or update .reload to trigger browser refresh."""
-    ensure_site_directory()
-    RELOAD_FILE.write_text(str(time.time()))
+def is_css_only(changed):
+    """True if every changed path is a stylesheet in assets/."""
+    if not changed:
+        return False
+    assets = os.path.abspath(ASSETS_DIR)
+    return all(
+        path.endswith(".css") and os.path.abspath(path).startswith(assets + os.sep)
+        for path in changed
+    )
+
+
+def asset_url(path):
+    rel = Path(os.path.abspath(path)).relative_to(os.path.abspath(ASSETS_DIR))
+    return "/assets/" + rel.as_posix()
+
+
+# ---------------------------------------------------------
+# LIVE RELOAD NOTIFICATIONS (pushed to every open page)
+# ---------------------------------------------------------
+
+class ReloadBroadcaster:
+    """Every connected page gets a queue; notify() puts a message in all of them."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._clients = set()
+
+    def connect(self):
+        q = queue.Queue()
+        with self._lock:
+            self._clients.add(q)
+        return q
+
+    def disconnect(self, q):
+        with self._lock:
+            self._clients.discard(q)
+
+    def notify(self, message):
+        with self._lock:
+            clients = list(self._clients)
+        for q in clients:
+            q.put(message)
+        return len(clients)
+
+
+reloader = ReloadBroadcaster()
+
+
+def notify_pages(changed):
+    """After a build: swap stylesheets if only CSS changed, else reload."""
+    if is_css_only(changed):
+        message = {"type": "css", "paths": sorted(asset_url(p) for p in changed)}
+    else:
+        message = {"type": "reload"}
+    count = reloader.notify(message)
+    if count:
+        print(f"[RELOAD] {message['type']} → {count} page(s)")
 
 
 # ---------------------------------------------------------
 # BUILD PROCESS (called every time files change)
 # ---------------------------------------------------------
 
-def rebuild_site():
-    """Rebuild the static site using build.py (or fallback import)."""
+def rebuild_site(changed=None, cancel=None):
+    """
+    Bring the static site up to date. `changed` limits the build to those
+    paths (None scans everything); `cancel` lets a newer change stop it.
+    Returns False if the build was cancelled.
+    """
     print("\n[BUILD] Rebuilding your site…")
 
     ensure_site_directory()
 
-    # Try running "python build.py --force"
-    if Path(BUILD_SCRIPT).exists():
-        try:
-            result = subprocess.run(
-                [sys.executable, BUILD_SCRIPT, "--force"],
-                capture_output=True,
-                text=True
-            )
-            print(result.stdout or "[BUILD] Finished.")
-            if result.returncode != 0:
-                print("[BUILD] Error in build.py:")
-                print(result.stderr)
-        except Exception as error:
-            print(f"[BUILD] Failed to run build.py: {error}")
-
+    try:
+        stats = builder.build_site(CONTENT_DIR, TEMPLATE_DIR, ASSETS_DIR, SITE_DIR,
+                                   log=print, changed=changed, cancel=cancel)
+    except Exception as error:
+        print(f"[BUILD] Build failed: {error}")
     else:
-        print("[BUILD] No build.py found — skipping site generation.")
-
-    # Always update reload file
-    update_reload_timestamp()
+        if stats["cancelled"]:
+            print("[BUILD] Superseded by newer changes.")
+            return False
+        print(f"[BUILD] {stats['rendered']} built, {stats['unchanged']} unchanged, "
+              f"{stats['failed']} failed in {stats['seconds'] * 1000:.0f} ms")
+
+    # Output files changed: forget what the server kept in memory, then tell
+    # open pages (even after an error — they may show it fixed)
+    file_cache.clear()
+    notify_pages(changed)
     print("[BUILD] Done.\n")
+    return True
 
 
 # ---------------------------------------------------------
 # FILE WATCHER (triggers rebuild on any file change)
 # ---------------------------------------------------------
 
+def is_noise(path):
+    """Changes that should never trigger a build: the output folder (our own
+    writes), hidden files (.#lock, .swp, .DS_Store) and temp/backup files."""
+    path = Path(os.path.abspath(path))
+    try:
+        path.relative_to(os.path.abspath(SITE_DIR))
+        return True
+    except ValueError:
+        pass
+    name = path.name
+    return name.startswith(".") or name.endswith(IGNORED_SUFFIXES) or name == "4913"   # vim's write test
+
+
+class RebuildScheduler:
+    """
+    Collects changed paths from the watcher and builds them on one
+    background thread: it waits until no new change arrived for
+    DEBOUNCE_SECONDS, then builds the whole batch at once. If changes come
+    in while a build runs, that build is cancelled and a new one covers
+    both.
+    """
+
+    def __init__(self, delay=DEBOUNCE_SECONDS):
+        self.delay = delay
+        self._cond = threading.Condition()
+        self._pending = set()
+        self._last_change = 0.0
+        threading.Thread(target=self._run, daemon=True).start()
+
+    def add(self, paths):
+        with self._cond:
+            self._pending.update(paths)
+            self._last_change = time.monotonic()
+            self._cond.notify()
+
+    def _superseded(self):
+        return bool(self._pending)
+
+    def _next_batch(self):
+        with self._cond:
+            while True:
+                if not self._pending:
+                    self._cond.wait()
+                    continue
+                wait = self._last_change + self.delay - time.monotonic()
+                if wait <= 0:
+                    batch, self._pending = self._pending, set()
+                    return batch
+                self._cond.wait(wait)
+
+    def _run(self):
+        while True:
+            batch = self._next_batch()
+            print(f"[WATCH] {len(batch)} changed: " + ", ".join(sorted(batch)[:5])
+                  + (" …" if len(batch) > 5 else ""))
+            if not rebuild_site(changed=batch, cancel=self._superseded):
+                # Unfinished work goes back in with the newer changes.
+                self.add(batch)
+
+
 class ChangeHandler(FileSystemEventHandler):
-    """Watchdog event handler — rebuild site whenever any file is edited."""
+    """Watchdog event handler — hands changed paths to the scheduler."""
+
+    def __init__(self, scheduler):
+        super().__init__()
+        self.scheduler = scheduler
+
     def on_any_event(self, event):
-        print(f"[WATCH] Detected change: {event.src_path}")
-        rebuild_site()
+        # Directory "modified" events just mean a file inside changed, and
+        # opened/closed-without-writing events change nothing.
+        if event.event_type in ("opened", "closed_no_write"):
+            return
+        if event.is_directory and event.event_type == "modified":
+            return
+        paths = {event.src_path, getattr(event, "dest_path", "")} - {""}
+        paths = {p for p in paths if not is_noise(p)}
+        if paths:
+            self.scheduler.add(paths)
 
 
 def start_file_watcher():
     """Start watching project folders for changes."""
     observer = Observer()
+    handler = ChangeHandler(RebuildScheduler())
 
     for folder in WATCH_DIRS:
         path = Path(folder)
         if path.exists():
             print(f"[WATCH] Watching → {folder}/")
-            observer.schedule(ChangeHandler(), folder, recursive=True)
+            observer.schedule(handler, folder, recursive=True)
         else:
             print(f"[WATCH] Skipping missing folder → {folder}/")
 
@@ -123,61 +273,267 @@ def start_file_watcher():
 
 LIVE_RELOAD_JS = """
 <script>
-async function checkReload() {
-    let last = localStorage.getItem("reload_time") || "0";
-    try {
-        let res = await fetch("/.reload");
-        let text = await res.text();
-        if (text !== last) {
-            localStorage.setItem("reload_time", text);
-            location.reload();
-        }
-    } catch (err) {}
-}
-setInterval(checkReload, 1000);
+(function () {
+    var connectedBefore = false;
+
+    function swapCss(paths) {
+        document.querySelectorAll('link[rel="stylesheet"]').forEach(function (link) {
+            var url = new URL(link.href);
+            if (url.origin !== location.origin || paths.indexOf(url.pathname) === -1) return;
+            url.searchParams.set("livereload", Date.now());
+            var fresh = link.cloneNode();
+            fresh.href = url.href;
+            fresh.onload = function () { link.remove(); };   // no flash of unstyled page
+            link.after(fresh);
+        });
+    }
+
+    function connect() {
+        var ws = new WebSocket((location.protocol === "https:" ? "wss://" : "ws://") + location.host + "/__livereload");
+        ws.onopen = function () {
+            // Back after the dev server restarted: the page may be stale.
+            if (connectedBefore) location.reload();
+            connectedBefore = true;
+        };
+        ws.onmessage = function (event) {
+            var message = JSON.parse(event.data);
+            if (message.type === "css") swapCss(message.paths);
+            else location.reload();
+        };
+        ws.onclose = function () { setTimeout(connect, 1000); };
+    }
+    connect();
+})();
 </script>
 """
 
+WEBSOCKET_GUID = "258EAFA5-E914-47DA-95CA-C5AB0DC85B11"
+WEBSOCKET_PING_SECONDS = 20   # also how long a closed tab lingers in the broadcaster
+
+
+def websocket_frame(payload, opcode=0x1):
+    """One unmasked server→client frame (0x1 = text, 0x9 = ping)."""
+    header = bytearray([0x80 | opcode])
+    if len(payload) < 126:
+        header.append(len(payload))
+    elif len(payload) < 65536:
+        header.append(126)
+        header += len(payload).to_bytes(2, "big")
+    else:
+        header.append(127)
+        header += len(payload).to_bytes(8, "big")
+    return bytes(header) + payload
+
+
+def inject_reload_script(body):
+    try:
+        content = body.decode("utf-8")
+    except UnicodeDecodeError:
+        return body
+    if "</body>" in content:
+        content = content.replace("</body>", LIVE_RELOAD_JS + "</body>")
+    else:
+        content += LIVE_RELOAD_JS
+    return content.encode("utf-8")
+
+
+class FileCache:
+    """
+    Small files from site/ kept in memory, each checked against the file's
+    (mtime, size) on use. HTML pages are stored with the reload script
+    already injected. rebuild_site() clears it after every build; files
+    over `max_file` bytes are never stored and go out with sendfile().
+    """
+
+    def __init__(self, max_file=CACHE_MAX_FILE, max_total=CACHE_MAX_TOTAL):
+        self.max_file = max_file
+        self.max_total = max_total
+        self._lock = threading.Lock()
+        self._entries = {}
+        self._total = 0
+
+    def get(self, path, st):
+        with self._lock:
+            entry = self._entries.get(path)
+        if entry and entry[0] == (st.st_mtime_ns, st.st_size):
+            return entry[1]
+        return None
+
+    def put(self, path, st, body):
+        if len(body) > self.max_file:
+            return
+        with self._lock:
+            if self._total + len(body) > self.max_total:
+                self._entries.clear()
+                self._total = 0
+            old = self._entries.pop(path, None)
+            if old:
+                self._total -= len(old[1])
+            self._entries[path] = ((st.st_mtime_ns, st.st_size), body)
+            self._total += len(body)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._total = 0
+
+
+file_cache = FileCache()
+
+# Changes whenever the injected script does, so pages cached by the browser
+# under an older script are fetched again.
+SCRIPT_TAG = hashlib.blake2b(LIVE_RELOAD_JS.encode("utf-8"), digest_size=4).hexdigest()
+
 
 class LiveReloadHandler(http.server.SimpleHTTPRequestHandler):
-    """Serve files from site/ and inject auto-reload JS into HTML pages."""
+    """Serve files from site/, inject the live-reload script into HTML pages
+    and keep a WebSocket open to each page for reload messages.
+
+    Speaks HTTP/1.1, so a browser reuses one connection for a page and all
+    its assets. Responses carry an ETag and Last-Modified and say
+    "no-cache": the browser revalidates every time (edits show up at once)
+    and gets a body-less 304 when nothing changed."""
+
+    protocol_version = "HTTP/1.1"
+    timeout = 60                  # drop idle keep-alive connections
+    # Headers and body are separate writes; with Nagle on, a reused
+    # connection waits ~40 ms for the client's delayed ACK between them.
+    disable_nagle_algorithm = True
 
     def translate_path(self, path):
-        # Serve everything out of site/
-        clean = path.lstrip("/")
-        if clean == "":
-            clean = "index.html"
-        return str(SITE_DIR / clean)
-
-    def send_head(self):
-        """Inject reload script into HTML pages."""
-        path = Path(self.translate_path(self.path))
+        # Serve everything out of site/ (query strings such as the CSS
+        # swap's ?livereload=… aren't part of the file name). "." and ".."
+        # segments are dropped, as SimpleHTTPRequestHandler does, so a URL
+        # can never name a file outside site/.
+        clean = urllib.parse.unquote(urllib.parse.urlsplit(path).path)
+        parts = [part for part in clean.split("/") if part not in ("", ".", "..")]
+        if not parts:
+            parts = ["index.html"]
+        return str(SITE_DIR.joinpath(*parts))
+
+    def do_GET(self):
+        if self.path == RELOAD_PATH and self.headers.get("Upgrade", "").lower() == "websocket":
+            self.serve_reload_socket()
+        else:
+            self.serve_file()
 
-        if path.is_file() and path.suffix == ".html":
-            try:
-                content = path.read_text(encoding="utf-8")
-                if "</body>" in content:
-                    content = content.replace("</body>", LIVE_RELOAD_JS + "</body>")
-                else:
-                    content += LIVE_RELOAD_JS
-
-                encoded = content.encode("utf-8")
-                self.send_response(200)
-                self.send_header("Content-type", "text/html; charset=utf-8")
-                self.send_header("Content-Length", len(encoded))
-                self.end_headers()
+    def do_HEAD(self):
+        self.serve_file(head_only=True)
 
-                return io.BytesIO(encoded)
+    def handle_one_request(self):
+        # Browsers drop connections all the time (navigating away, cancelled
+        # prefetches); that is not worth a traceback.
+        try:
+            super().handle_one_request()
+        except (BrokenPipeError, ConnectionResetError):
+            self.close_connection = True
+
+    def serve_reload_socket(self):
+        """Hold the connection open and forward broadcaster messages."""
+        key = self.headers.get("Sec-WebSocket-Key", "")
+        accept = base64.b64encode(hashlib.sha1((key + WEBSOCKET_GUID).encode("ascii")).digest())
+        self.send_response(101, "Switching Protocols")
+        self.send_header("Upgrade", "websocket")
+        self.send_header("Connection", "Upgrade")
+        self.send_header("Sec-WebSocket-Accept", accept.decode("ascii"))
+        self.end_headers()
+        self.close_connection = True
+
+        q = reloader.connect()
+        try:
+            while True:
+                # The page never sends us anything we need; pings just find
+                # out when it is gone.
+                try:
+                    frame = websocket_frame(json.dumps(q.get(timeout=WEBSOCKET_PING_SECONDS)).encode("utf-8"))
+                except queue.Empty:
+                    frame = websocket_frame(b"", opcode=0x9)
+                self.wfile.write(frame)
+                self.wfile.flush()
+        except OSError:
+            pass
+        finally:
+            reloader.disconnect(q)
+
+    def not_modified(self, etag, mtime):
+        """Does the browser's copy (If-None-Match / If-Modified-Since) still match?"""
+        if_none_match = self.headers.get("If-None-Match")
+        if if_none_match is not None:
+            tags = [t.strip() for t in if_none_match.split(",")]
+            return "*" in tags or etag in tags or ("W/" + etag) in tags
+        if_modified_since = self.headers.get("If-Modified-Since")
+        if if_modified_since:
+            try:
+                since = email.utils.parsedate_to_datetime(if_modified_since).timestamp()
+            except (TypeError, ValueError, IndexError, OverflowError):
+                return False
+            return int(mtime) <= since
+        return False
 
-            except Exception as e:
-                print("[SERVER] Failed to serve HTML:", e)
+    def serve_file(self, head_only=False):
+        path = Path(self.translate_path(self.path))
+        if path.is_dir():
+            if not urllib.parse.urlsplit(self.path).path.endswith("/"):
+                # Let SimpleHTTPRequestHandler redirect /blog → /blog/
+                f = self.send_head()
+                if f:
+                    f.close()
+                return
+            path = path / "index.html"
+
+        # A symlink inside site/ still must not lead out of it.
+        if not path.resolve().is_relative_to(SITE_DIR.resolve()):
+            self.send_error(404, "File not found")
+            return
 
-        return super().send_head()
+        try:
+            f = open(path, "rb")
+        except OSError:
+            self.send_error(404, "File not found")
+            return
+
+        with f:
+            st = os.fstat(f.fileno())
+            is_html = path.suffix == ".html"
+            etag = f'"{st.st_mtime_ns:x}-{st.st_size:x}' + (f'-{SCRIPT_TAG}"' if is_html else '"')
+            last_modified = email.utils.formatdate(st.st_mtime, usegmt=True)
+
+            if self.not_modified(etag, st.st_mtime):
+                self.send_response(304)
+                self.send_header("ETag", etag)
+                self.send_header("Last-Modified", last_modified)
+                self.send_header("Cache-Control", "no-cache")
+                self.end_headers()
+                return
+
+            body = file_cache.get(path, st)
+            if body is None and (is_html or st.st_size <= file_cache.max_file):
+                body = f.read()
+                if is_html:
+                    body = inject_reload_script(body)
+                file_cache.put(path, st, body)
+
+            self.send_response(200)
+            self.send_header("Content-Type", "text/html; charset=utf-8" if is_html else self.guess_type(str(path)))
+            self.send_header("Content-Length", str(len(body) if body is not None else st.st_size))
+            self.send_header("ETag", etag)
+            self.send_header("Last-Modified", last_modified)
+            self.send_header("Cache-Control", "no-cache")
+            self.end_headers()
+
+            if head_only:
+                return
+            if body is not None:
+                self.wfile.write(body)
+            else:
+                # Big files go straight from the page cache to the socket.
+                self.connection.sendfile(f, 0, st.st_size)
 
 
 def start_server():
-    """Start the local development server."""
-    with socketserver.TCPServer(("", PORT), LiveReloadHandler) as httpd:
+    """Start the local development server (one thread per connection, so a
+    slow client or an open reload socket never holds up other requests)."""
+    with http.server.ThreadingHTTPServer(("", PORT), LiveReloadHandler) as httpd:
         print(f"[SERVER] Live server → http://localhost:{PORT}")
         httpd.serve_forever()
 
@@ -0,0 +1,218 @@
+import asset_pipeline
+from asset_pipeline import minify_css, minify_html, minify_js, rewrite_references, sync_assets
+
+
+# ---------------------------------------------------------
+# Asset pipeline
+# ---------------------------------------------------------
+
+def test_minify_css_keeps_strings_licences_and_descendant_selectors():
+    css = '/*! MIT */\n/* gone */\na :hover ,  b > c {\n  content: "a  ;  }" ;\n  color : red;\n}\n'
+    out = minify_css(css)
+    assert out.startswith("/*! MIT */") and "gone" not in out
+    assert out.endswith('a :hover,b>c{content:"a  ;  }";color :red}')
+
+
+def test_minify_js_strips_lines_but_keeps_line_breaks():
+    js = "// header\nfunction f() {\n    return 1\n}\n\n  // note\nf()\n"
+    assert minify_js(js) == "function f() {\nreturn 1\n}\nf()\n"
+
+
+def test_minify_js_leaves_multiline_strings_alone():
+    continued = 'var s = "one \\\n    // not a comment \\\n  two";\n'
+    template = "var t = `a\n    b`;\n"
+    assert minify_js(continued) == continued
+    assert minify_js(template) == template
+
+
+def test_minify_html_keeps_raw_blocks():
+    html = ("<html>\n  <!-- gone -->\n  <body>   <p>a   b</p>\n"
+            "<pre>  keep\n   this  </pre>\n<script>  if (a)   b()  </script>\n</body></html>\n")
+    out = minify_html(html)
+    assert "gone" not in out and "<p>a b</p>" in out
+    assert "<pre>  keep\n   this  </pre>" in out
+    assert "<script>  if (a)   b()  </script>" in out
+
+
+def test_rewrite_references_skips_code_samples():
+    manifest = {"css/style.css": "css/style.1a2b3c4d.css"}
+    html = ('<link href="/assets/css/style.css">'
+            '<p>Link <code>/assets/css/style.css</code></p>'
+            '<pre><code> href="/assets/css/style.css"</code></pre>'
+            '<img src="/assets/missing.png">')
+    assert rewrite_references(html, manifest) == (
+        '<link href="/assets/css/style.1a2b3c4d.css">'
+        '<p>Link <code>/assets/css/style.css</code></p>'
+        '<pre><code> href="/assets/css/style.css"</code></pre>'
+        '<img src="/assets/missing.png">')
+
+
+def test_production_assets_get_fingerprinted_and_plain_names(tmp_path):
+    src, out = tmp_path / "assets", tmp_path / "site" / "assets"
+    (src / "css").mkdir(parents=True)
+    (src / "logo.svg").write_text("<svg xmlns='http://www.w3.org/2000/svg'></svg>\n")
+    (src / "css" / "style.css").write_text("body {\n  background: url(../logo.svg);\n}\n" * 20)
+    log = []
+
+    entries, manifest, processed = sync_assets(src, out, {}, False, log.append, production=True)
+    logo, css = manifest["logo.svg"], manifest["css/style.css"]
+    assert processed == 2
+    assert logo.startswith("logo.") and logo != "logo.svg"
+    assert css.startswith("css/style.") and css.endswith(".css")
+    for name in (logo, css, "logo.svg", "css/style.css"):
+        assert (out / name).is_file()
+    assert (out / css).read_text() == (out / "css/style.css").read_text()
+    assert f"url(../{logo.split('/')[-1]})" in (out / css).read_text()
+    assert (out / (css + ".gz")).is_file() and (out / "css/style.css.gz").is_file()
+
+    # Unchanged: nothing is redone. Deleted: both names go.
+    assert sync_assets(src, out, entries, False, log.append, production=True)[2] == 0
+    (src / "logo.svg").unlink()
+    sync_assets(src, out, entries, False, log.append, production=True)
+    assert not (out / logo).exists() and not (out / "logo.svg").exists()
+
+
+def test_write_atomic_uses_the_umask(tmp_path):
+    import os
+    import stat
+    previous = os.umask(0o027)
+    try:
+        asset_pipeline.write_atomic(tmp_path / "a" / "page.html", "<p>hi</p>")
+    finally:
+        os.umask(previous)
+    assert stat.S_IMODE((tmp_path / "a" / "page.html").stat().st_mode) == 0o640
+    assert [p.name for p in (tmp_path / "a").iterdir()] == ["page.html"]
+
+
+# ---------------------------------------------------------
+# Incremental builds
+# ---------------------------------------------------------
+
+BASE_HTML = "<html><title>{{ title }}</title><body>{{ content }}</body></html>\n"
+
+
+def make_site(tmp_path):
+    for folder in ("content/blog", "templates", "assets/css"):
+        (tmp_path / folder).mkdir(parents=True)
+    (tmp_path / "content" / "about.md").write_text("---\ntitle: About\n---\nAbout us.\n")
+    (tmp_path / "content" / "blog" / "first.md").write_text("---\ntitle: First\n---\nHello.\n")
+    (tmp_path / "templates" / "base.html").write_text(BASE_HTML)
+    (tmp_path / "assets" / "css" / "style.css").write_text("body { color: red; }\n")
+    return tmp_path
+
+
+def build(root, **kwargs):
+    import builder
+    return builder.build_site(root / "content", root / "templates", root / "assets", root / "site",
+                              log=lambda line: None, workers=1, **kwargs)
+
+
+def snapshot(root):
+    """Inode and mtime of every output file: pages are renamed into place
+    (new inode), plain assets are copied over with the source's mtime."""
+    site = root / "site"
+    return {p.relative_to(site).as_posix(): (p.stat().st_ino, p.stat().st_mtime_ns)
+            for p in site.rglob("*") if p.is_file()}
+
+
+def rewritten(before, after):
+    return {name for name in after if before.get(name) != after[name]} - {".ssg-cache.json"}
+
+
+def test_first_build_then_nothing_to_do(tmp_path):
+    import os
+    import stat
+    root = make_site(tmp_path)
+    previous = os.umask(0o027)
+    try:
+        stats = build(root)
+    finally:
+        os.umask(previous)
+    assert (stats["rendered"], stats["failed"], stats["assets_copied"]) == (2, 0, 1)
+    before = snapshot(root)
+    assert set(before) == {"about.html", "blog/first.html", "index.html", "assets/css/style.css",
+                           ".ssg-cache.json"}
+    for name in ("about.html", "index.html", ".ssg-cache.json"):
+        assert stat.S_IMODE((root / "site" / name).stat().st_mode) == 0o640
+
+    stats = build(root)
+    assert (stats["rendered"], stats["unchanged"], stats["assets_copied"]) == (0, 2, 0)
+    assert rewritten(before, snapshot(root)) == set()
+
+
+def test_changing_one_page_rewrites_only_that_page(tmp_path):
+    root = make_site(tmp_path)
+    build(root)
+    before = snapshot(root)
+    page = root / "content" / "about.md"
+    page.write_text("---\ntitle: About\n---\nAbout us, at length.\n")
+    assert build(root)["rendered"] == 1
+    assert rewritten(before, snapshot(root)) == {"about.html"}      # same titles: index kept
+    assert "at length" in (root / "site" / "about.html").read_text()
+
+    # A touched but identical file is hashed and skipped.
+    page.touch()
+    before = snapshot(root)
+    assert build(root)["rendered"] == 0
+    assert rewritten(before, snapshot(root)) == set()
+
+    # Same again, scoped to the path a watcher reported.
+    page.write_text("---\ntitle: About us\n---\nAbout us.\n")
+    before = snapshot(root)
+    assert build(root, changed=[page])["rendered"] == 1
+    assert rewritten(before, snapshot(root)) == {"about.html", "index.html"}
+    assert "About us" in (root / "site" / "index.html").read_text()
+
+
+def test_deleting_a_page_removes_its_output(tmp_path):
+    root = make_site(tmp_path)
+    build(root)
+    before = snapshot(root)
+    (root / "content" / "about.md").unlink()
+    stats = build(root, changed=[root / "content" / "about.md"])
+    assert (stats["rendered"], stats["unchanged"]) == (0, 1)
+    after = snapshot(root)
+    assert "about.html" not in after
+    assert rewritten(before, after) == {"index.html"}
+    assert "About" not in (root / "site" / "index.html").read_text()
+
+
+def test_new_folder_of_pages_is_built(tmp_path):
+    root = make_site(tmp_path)
+    build(root)
+    before = snapshot(root)
+    folder = root / "content" / "guides"
+    folder.mkdir()
+    (folder / "setup.md").write_text("---\ntitle: Setup\n---\nInstall it.\n")
+    # A watcher reports the folder, which can't be scoped: full scan.
+    assert build(root, changed=[folder])["rendered"] == 1
+    assert rewritten(before, snapshot(root)) == {"guides/setup.html", "index.html"}
+
+    # Removing the folder again takes its pages with it.
+    (folder / "setup.md").unlink()
+    folder.rmdir()
+    build(root, changed=[folder])
+    assert not (root / "site" / "guides" / "setup.html").exists()
+
+
+def test_editing_css_copies_only_the_asset(tmp_path):
+    root = make_site(tmp_path)
+    build(root)
+    before = snapshot(root)
+    css = root / "assets" / "css" / "style.css"
+    css.write_text("body { color: blue; }\n")
+    stats = build(root, changed=[css])
+    assert (stats["rendered"], stats["assets_copied"]) == (0, 1)
+    assert rewritten(before, snapshot(root)) == {"assets/css/style.css"}
+    assert "blue" in (root / "site" / "assets" / "css" / "style.css").read_text()
+
+
+def test_editing_a_template_rerenders_every_page(tmp_path):
+    root = make_site(tmp_path)
+    build(root)
+    before = snapshot(root)
+    (root / "templates" / "base.html").write_text(BASE_HTML.replace("<body>", "<body><nav></nav>"))
+    stats = build(root, changed=[root / "templates" / "base.html"])
+    assert stats["rendered"] == 2
+    assert rewritten(before, snapshot(root)) == {"about.html", "blog/first.html", "index.html"}
+    assert "<nav>" in (root / "site" / "blog" / "first.html").read_text()